@@ -0,0 +1,188 @@
+"""Benchmark the stages of dff on generated ANNOVAR-like tables.
+
+Times the load (parsing and numeric normalization apart), each kind of
+filter and the output, with the peak memory of each stage (see
+metrics.Memory), and appends the results to a JSON lines file so they can be
+compared between versions:
+
+    python benchmarks/bench_dff.py --rows 1000000 --gzip --latin1
+    python benchmarks/bench_dff.py --rows 1000000 --gzip --latin1 --compare
+
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from os.path import dirname, exists, join
+from timeit import default_timer as timer
+
+import pandas as pd
+
+sys.path.insert(0, join(dirname(__file__), "..", "dffiltering", "ff"))
+import ff  # noqa: E402
+import metrics  # noqa: E402
+import reader  # noqa: E402
+from _version import __version__  # noqa: E402
+
+import generate  # noqa: E402
+
+
+RESULTS = join(dirname(__file__), "results.jsonl")
+
+GENES = generate.GENES[:10] + generate.GENES[100:110]
+# The filters of each kind timed, by name
+FILTERS = [
+    ("==", ['Func.refGene == "exonic"']),
+    ("<", ["ExAC_ALL < 0.01"]),
+    (">", ["GATK.Depth > 40"]),
+    ("contains", ["Gene.refGene contains BRCA|TP53|KRAS"]),
+    ("not_contains", ["ExonicFunc.refGene not_contains synonymous"]),
+    ("in", ["Gene.refGene in {}".format("|".join(GENES))]),
+    ("not_in", ["Gene.refGene not_in {}".format("|".join(GENES))]),
+    ("contains_many", ["Gene.refGene contains {}".format(
+        "|".join(generate.GENES[1010:1510]))]),
+    ("panel", ["ExAC_ALL < 0.01", "Func.refGene contains exonic|splicing",
+               "ExonicFunc.refGene not_contains synonymous",
+               "GATK.Depth > 20"]),
+]
+
+
+def commit():
+    """Return the git commit of the working tree, None if unknown."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=dirname(__file__),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(stages, name, function, repeat=1, rows=None):
+    """Return the result of function, adding its timing to stages.
+
+    With repeat, the best time of repeat runs is kept.
+
+    """
+    seconds = []
+    memory = metrics.Memory()
+    for _ in range(repeat):
+        start = timer()
+        result = function()
+        seconds.append(timer() - start)
+
+    stages[name] = {"seconds": min(seconds), "peak_mb": memory.peak()}
+    if rows is not None:
+        stages[name]["rows"] = rows(result)
+    print("{:<24}{:>9.3f}s  {}".format(
+        name, min(seconds), stages[name].get("rows", "")), file=sys.stderr)
+
+    return result
+
+
+def bench(filepath, repeat=1):
+    """Return the timings of the stages of dff on filepath."""
+    stages = {}
+    raw = timed(stages, "parse", lambda: reader.read_table(
+        filepath, dtype=object), rows=len)
+    numeric_columns = [
+        _ for _ in ff.COLUMN_TYPES["numeric"] if _ in raw.columns]
+    timed(stages, "numerize", lambda: ff.numerize(
+        raw.copy(), numeric_columns), repeat)
+    del raw
+    df = timed(stages, "load", lambda: ff.load(filepath))
+
+    for name, conditions in FILTERS:
+        if all(_.split()[0] in df.columns for _ in conditions):
+            timed(stages, "filter " + name, lambda: ff.Filter(
+                conditions).apply(df.copy(deep=False)), repeat, len)
+
+    result = ff.Filter(FILTERS[1][1]).apply(df.copy(deep=False))
+    with open(os.devnull, "w") as out:
+        timed(stages, "output", lambda: ff.write(result, out), repeat)
+    with open(os.devnull, "wb") as out:
+        timed(stages, "output raw",
+              lambda: ff.write_raw(result, filepath, out), repeat)
+
+    return stages
+
+
+def compare(record, results):
+    """Print the record against the last one with the same table."""
+    previous = None
+    if exists(results):
+        with open(results) as js:
+            for line in js:
+                other = json.loads(line)
+                if other["table"] == record["table"]:
+                    previous = other
+    if previous is None:
+        print("Nothing to compare with.")
+        return
+
+    print("{:<24}{:>10}{:>10}{:>8}   vs {} ({})".format(
+        "stage", "seconds", "before", "ratio",
+        previous["version"], previous["commit"]))
+    for name, stage in record["stages"].items():
+        before = previous["stages"].get(name)
+        if before:
+            print("{:<24}{:>10.3f}{:>10.3f}{:>7.2f}x".format(
+                name, stage["seconds"], before["seconds"],
+                stage["seconds"] / max(before["seconds"], 1e-9)))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--columns", type=int,
+                        help="Only the first columns (default all)")
+    parser.add_argument("--missing", type=float, default=0.3)
+    parser.add_argument("--comma", type=float, default=0.0)
+    parser.add_argument("--latin1", action="store_true")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Keep the best of these runs (default 3)")
+    parser.add_argument("--table",
+                        help="Benchmark this TSV instead of a generated one")
+    parser.add_argument("--results", default=RESULTS,
+                        help="JSON lines file to append the results to")
+    parser.add_argument("--compare", action="store_true",
+                        help="Compare with the last results of the table")
+    args = parser.parse_args(args)
+
+    table = {"path": args.table} if args.table else {
+        "rows": args.rows, "columns": args.columns, "missing": args.missing,
+        "comma": args.comma, "latin1": args.latin1, "gzip": args.gzip,
+        "seed": args.seed}
+    directory = tempfile.mkdtemp()
+    filepath = args.table or join(
+        directory, "bench.tsv" + (".gz" if args.gzip else ""))
+    try:
+        if not args.table:
+            start = timer()
+            generate.write(filepath, args.rows, args.seed, args.columns,
+                           args.missing, args.comma, args.latin1)
+            print("generated in {:.1f}s".format(timer() - start),
+                  file=sys.stderr)
+        stages = bench(filepath, args.repeat)
+    finally:
+        if exists(filepath) and not args.table:
+            os.remove(filepath)
+        os.rmdir(directory)
+
+    record = {"version": __version__, "commit": commit(),
+              "python": platform.python_version(),
+              "pandas": pd.__version__, "table": table, "stages": stages,
+              "peak": ("cumulative" if metrics.Memory().cumulative
+                       else "stage")}
+    if args.compare:
+        compare(record, args.results)
+    with open(args.results, "a") as results:
+        results.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
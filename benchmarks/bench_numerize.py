@@ -0,0 +1,76 @@
+"""Benchmark the numeric columns normalization of ff.load.
+
+Tiles the numeric columns of 8859.tab up to a number of rows and times
+ff.numerize against the former column by column, pass by pass, cleaning:
+
+    python benchmarks/bench_numerize.py --rows 1000000
+
+"""
+import argparse
+import sys
+from os.path import dirname, join
+from timeit import default_timer as timer
+
+import pandas as pd
+
+sys.path.insert(0, join(dirname(__file__), "..", "dffiltering", "ff"))
+import ff  # noqa: E402
+
+
+TAB_FILE = join(
+    dirname(__file__), "..", "dffiltering", "ff", "test_files", "8859.tab")
+
+
+def numerize_by_passes(df, numeric_columns):
+    """Return the DF numerized the way load did before (five passes)."""
+    for numeric_column in numeric_columns:
+        df[numeric_column] = df[numeric_column].str.replace(",", ".")
+        df[numeric_column].replace(".", 0, inplace=True)
+        df[numeric_column].replace("1.", 1, inplace=True)
+        df[numeric_column].replace("-", 0, inplace=True)
+        df[numeric_column].fillna(0, inplace=True)
+        df[numeric_column] = pd.to_numeric(df[numeric_column], errors="coerce")
+
+    return df
+
+
+def raw_numeric_columns(rows):
+    """Return the numeric columns of TAB_FILE as strings, tiled to rows."""
+    df = pd.read_table(TAB_FILE, dtype=object, encoding="iso-8859-1")
+    numeric_columns = [
+        _ for _ in ff.COLUMN_TYPES["numeric"] if _ in df.columns]
+    df = df[numeric_columns]
+    repeat = rows // len(df) + 1
+
+    return pd.concat([df] * repeat, ignore_index=True).iloc[:rows]
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args(args)
+
+    df = raw_numeric_columns(args.rows)
+    print("{} rows x {} numeric columns".format(*df.shape))
+
+    # One column at a time, so the copies of a few million strings the
+    #  passes create don't take all the memory.
+    passes = single = 0
+    for numeric_column in df.columns:
+        column = df[[numeric_column]]
+
+        start = timer()
+        by_passes = numerize_by_passes(column.copy(), [numeric_column])
+        passes += timer() - start
+
+        start = timer()
+        numerized = ff.numerize(column.copy(), [numeric_column])
+        single += timer() - start
+
+        assert numerized.equals(by_passes), numeric_column
+
+    print("by passes: {:.2f}s".format(passes))
+    print("numerize:  {:.2f}s ({:.1f}x)".format(single, passes / single))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
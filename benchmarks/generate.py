@@ -0,0 +1,220 @@
+"""Generate synthetic ANNOVAR-like tables to benchmark dff.
+
+The columns are the ones of COLUMN_TYPES, with values shaped like the
+ones of the real tables: sorted positions, bases, gene names (some of
+them many per cell), frequencies and scores with the missing value
+markers (".", "-", "1.") and, if asked, comma decimals. The same seed
+gives the same table:
+
+    python benchmarks/generate.py table.tsv.gz --rows 1000000 --latin1
+
+"""
+import argparse
+import gzip
+import io
+import sys
+from os.path import dirname, join
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, join(dirname(__file__), "..", "dffiltering", "ff"))
+from columns import COLUMN_TYPES  # noqa: E402
+
+
+CHROMOSOMES = ["chr{}".format(_) for _ in list(range(1, 23)) + ["X", "Y"]]
+BASES = ["A", "C", "G", "T", "-", "AT", "GCA", "CTTG"]
+FUNCS = ["exonic", "intronic", "splicing", "UTR3", "UTR5", "intergenic",
+         "ncRNA_exonic", "upstream", "downstream", "exonic;splicing"]
+EXONIC_FUNCS = [".", "synonymous SNV", "nonsynonymous SNV", "stopgain",
+                "frameshift deletion", "nonframeshift insertion", "unknown"]
+PREDICTIONS = [".", "D", "T", "P", "B", "N", "H", "L", "M"]
+CALLERS = ["GATK", "TVC", "GATK,TVC", "TVC,GATK"]
+# Genes, most of them made up
+GENES = ["BRCA1", "BRCA2", "TP53", "POLE", "PRH1", "OLR1", "KRAS", "EGFR",
+         "GRIN2B", "PTPN11"] + ["GENE{}".format(_) for _ in range(2000)]
+# Some text in ISO-8859-1, for the --latin1 tables
+LATIN1 = [u"Sj\xf6gren syndrome", u"Beh\xe7et disease",
+          u"M\xe9ni\xe8re disease", u"Waldenstr\xf6m macroglobulinemia"]
+DISEASES = ["Lynch syndrome", "Breast cancer", "Noonan syndrome", "."]
+
+
+# Each column draws its values from this many different ones
+POOL = 4096
+
+
+def columns(count=None):
+    """Return the names of the columns, the positions first, no repeats."""
+    names = []
+    for name in ["Chr", "Start", "End", "Ref", "Alt"] + \
+            COLUMN_TYPES["numeric"] + COLUMN_TYPES["str"]:
+        if name not in names:
+            names.append(name)
+
+    return names[:count] if count else names
+
+
+def kind(name):
+    """Return the kind of values of the column name."""
+    if name in ("Start", "End", "Chr", "Ref", "Alt", "Callers"):
+        return name
+    if name in COLUMN_TYPES["numeric"]:
+        if any(_ in name for _ in ["counts", "Depth", "vardb"]):
+            return "count"
+        if any(_ in name for _ in ["1000G", "1000g", "ExAC", "ESP6500",
+                                   "gnomAD", "PopFreq", "MaxPopFreq"]):
+            return "frequency"
+        return "score"
+    if name.startswith("Func."):
+        return "func"
+    if name.startswith("Gene."):
+        return "gene"
+    if name.startswith("ExonicFunc."):
+        return "exonic_func"
+    if name.endswith("_pred"):
+        return "prediction"
+    if "disorder" in name.lower() or "disease" in name.lower():
+        return "disease"
+    return "text"
+
+
+def with_markers(rng, pool, rows, missing, comma):
+    """Return rows numbers of pool as strings, some as missing markers.
+
+    Formatting a pool and drawing from it is far faster than formatting
+    every value.
+
+    """
+    text = ["%.4g" % _ if isinstance(_, float) else str(_) for _ in pool]
+    pool = np.array(text + [_.replace(".", ",") for _ in text] +
+                    [".", "-", "1."], dtype=object)
+    drawn = rng.randint(0, len(text), rows)
+    if comma:
+        drawn[rng.random_sample(rows) < comma] += len(text)
+
+    marks = rng.random_sample(rows)
+    drawn[marks < missing] = len(pool) - 3
+    drawn[(marks >= missing) & (marks < missing * 1.1)] = len(pool) - 2
+    drawn[(marks >= missing * 1.1) & (marks < missing * 1.12)] = \
+        len(pool) - 1
+
+    return pool[drawn]
+
+
+def positions(rows, seed=0):
+    """Return the sorted (chromosome indexes, starts) of the rows."""
+    rng = np.random.RandomState(seed)
+    chromosomes = rng.randint(0, len(CHROMOSOMES), rows)
+    starts = rng.randint(1, 150000000, rows)
+    order = np.lexsort((starts, chromosomes))
+
+    return chromosomes[order], starts[order]
+
+
+def table(rows, seed=0, count=None, missing=0.3, comma=0.0, latin1=False,
+          sorted_positions=None):
+    """Return a DataFrame of strings, rows x count columns.
+
+    The rows are sorted by sorted_positions, as positions returns them.
+
+    """
+    rng = np.random.RandomState(seed)
+    data = {}
+    chromosomes, starts = sorted_positions or positions(rows, seed)
+    refs = rng.choice(BASES, rows)
+    ends = starts + np.array([max(len(_), 1) for _ in refs]) - 1
+    ends[refs == "-"] = starts[refs == "-"]
+
+    for name in columns(count):
+        what = kind(name)
+        if what == "Chr":
+            values = np.array(CHROMOSOMES, dtype=object)[chromosomes]
+        elif what == "Start":
+            values = starts.astype(str).astype(object)
+        elif what == "End":
+            values = ends.astype(str).astype(object)
+        elif what == "Ref":
+            values = refs.astype(object)
+        elif what == "Alt":
+            values = rng.choice(BASES, rows).astype(object)
+        elif what == "Callers":
+            values = rng.choice(CALLERS, rows).astype(object)
+        elif what == "count":
+            values = with_markers(
+                rng, rng.poisson(40, POOL).tolist(), rows, missing / 3, 0)
+        elif what == "frequency":
+            values = with_markers(
+                rng, rng.beta(0.3, 6, POOL).tolist(), rows, missing, comma)
+        elif what == "score":
+            values = with_markers(
+                rng, rng.normal(0, 2, POOL).tolist(), rows, missing, comma)
+        elif what == "func":
+            values = rng.choice(FUNCS, rows).astype(object)
+        elif what == "gene":
+            values = rng.choice(GENES, rows).astype(object)
+            # Some cells have many genes
+            many = rng.random_sample(rows) < 0.05
+            values[many] = [";".join(_) for _ in zip(
+                values[many], rng.choice(GENES, many.sum()))]
+        elif what == "exonic_func":
+            values = rng.choice(EXONIC_FUNCS, rows).astype(object)
+        elif what == "prediction":
+            values = rng.choice(PREDICTIONS, rows).astype(object)
+        elif what == "disease":
+            values = rng.choice(
+                DISEASES + (LATIN1 if latin1 else []), rows).astype(object)
+        else:
+            values = np.array(["v{}".format(_) for _ in range(500)],
+                              dtype=object)[rng.randint(0, 500, rows)]
+            values[rng.random_sample(rows) < missing] = "."
+        data[name] = values
+
+    return pd.DataFrame(data, columns=columns(count))
+
+
+def write(filepath, rows, seed=0, count=None, missing=0.3, comma=0.0,
+          latin1=False, block=100000):
+    """Write a generated table to filepath, gzipped if it ends in .gz.
+
+    It's generated and written in blocks of rows, so any size fits in
+    memory. With latin1 the text is in ISO-8859-1, else in UTF-8.
+
+    """
+    encoding = "iso-8859-1" if latin1 else "utf-8"
+    chromosomes, starts = positions(rows, seed)
+    raw = gzip.open(filepath, "wb", 6) if filepath.endswith(".gz") \
+        else open(filepath, "wb")
+    with io.TextIOWrapper(raw, encoding=encoding) as out:
+        for number, start in enumerate(range(0, rows, block) or [0]):
+            end = min(start + block, rows)
+            df = table(end - start, seed + number, count, missing, comma,
+                       latin1, (chromosomes[start:end], starts[start:end]))
+            if start == 0:
+                out.write("\t".join(df.columns) + "\n")
+            # Much faster than to_csv for columns of strings
+            out.write("".join(
+                "\t".join(_) + "\n" for _ in zip(*(
+                    df[column].values for column in df.columns))))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("filepath", help="Table to write (.gz to gzip it)")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--columns", type=int,
+                        help="Only the first columns (default all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--missing", type=float, default=0.3,
+                        help="Share of missing values (default 0.3)")
+    parser.add_argument("--comma", type=float, default=0.0,
+                        help="Share of decimals with comma (default 0)")
+    parser.add_argument("--latin1", action="store_true",
+                        help="Write the text in ISO-8859-1 with accents")
+    args = parser.parse_args(args)
+
+    write(args.filepath, args.rows, args.seed, args.columns, args.missing,
+          args.comma, args.latin1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,17 +1,56 @@
 import sys
-try:
-    from dffiltering.ff import ff
-except ImportError:
-    from ff import ff
 
 
 def run():
-    args = ff.argparser(sys.argv[1:])
+    if sys.argv[1:2] == ["client"]:
+        # Before importing ff, the client doesn't need pandas
+        try:
+            from dffiltering.ff import client
+        except ImportError:
+            from ff import client
+        sys.exit(client.run(sys.argv[2:]))
 
-    if args:
-        df = ff.main(args)
-        if df is not None:
-            print(df.to_csv(sep="\t", index=False))
+    if sys.argv[1:2] == ["serve"]:
+        try:
+            from dffiltering.ff import serve
+        except ImportError:
+            from ff import serve
+        sys.exit(serve.run(sys.argv[2:]))
+
+    if sys.argv[1:2] == ["batch"]:
+        try:
+            from dffiltering.ff import batch
+        except ImportError:
+            from ff import batch
+        sys.exit(batch.run(sys.argv[2:]))
+
+    try:
+        from dffiltering.ff import options
+    except ImportError:
+        from ff import options
+
+    args = options.argparser(sys.argv[1:])
+
+    if args.version:
+        try:
+            from dffiltering.ff import _version
+        except ImportError:
+            from ff import _version
+        print(_version.__version__)
+        return
+
+    if not args.filepath:
+        # Nothing to filter, no need to import pandas
+        return
+
+    try:
+        from dffiltering.ff import ff
+    except ImportError:
+        from ff import ff
+
+    df = ff.main(args)
+    if df is not None:
+        ff.output(df, args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+"""Multi-pattern substring search (Aho-Corasick) for long literal lists."""
+from collections import deque
+import re
+
+# Terms with any of these chars are regular expressions, not plain literals
+REGEX_CHARS = re.compile(r"[.^$*+?{}\[\]\\()]")
+
+
+def literals(terms):
+    """Return the list of literals in a "A|B|C" terms, None if it's a regex."""
+    if REGEX_CHARS.search(terms):
+        return None
+
+    return [_ for _ in terms.split("|")]
+
+
+class Automaton(object):
+    """Aho-Corasick automaton telling if a text contains any of the words.
+
+    It scans each text once whatever the number of words, whereas a regex
+    alternation of the words tries every one of them at every position.
+
+    """
+
+    def __init__(self, words):
+        # The trie: goto[state] maps a char to the next state.
+        self.goto = [{}]
+        self.fail = [0]
+        self.final = [False]
+
+        for word in words:
+            state = 0
+            for char in word:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.final.append(False)
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.final[state] = True
+
+        # Breadth first, link each state to its longest proper suffix that is
+        #  also in the trie.
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                if self.fail[next_state] == next_state:
+                    self.fail[next_state] = 0
+                self.final[next_state] |= self.final[self.fail[next_state]]
+
+    def search(self, text):
+        """Return True if any of the words is in text."""
+        goto, fail, final = self.goto, self.fail, self.final
+        if final[0]:
+            # The empty word is in every text
+            return True
+
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if final[state]:
+                return True
+
+        return False
@@ -0,0 +1,197 @@
+"""Filters many TSV files with the same filters in a pool of processes."""
+import glob
+import os
+import sys
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+try:
+    from . import ff
+except (SystemError, ImportError):
+    import ff
+
+
+# The Filter and arguments of each worker process, set once by init_worker
+WORKER = {}
+
+
+def argparser(args):
+    """Return the parsed arguments of the batch command."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="dff batch",
+        description="Filter many TSV files with the same filters")
+    parser.add_argument(
+        "paths", nargs="*",
+        help="TSV files or glob patterns (e.g. 'samples/*.tsv')")
+    parser.add_argument(
+        "--manifest",
+        help="Text file with the path of a TSV file per line")
+    parser.add_argument("--json-filter",
+                        help="JSON file with list of filters")
+    parser.add_argument("--column-contains", action="append",
+                        help="As in dff, a txt list of values to contain")
+    parser.add_argument("--column-in", action="append",
+                        help="As in dff, a txt list of values to be in")
+    parser.add_argument(
+        "--numeric-cols", type=lambda s: [_ for _ in s.split(',')],
+        help="As in dff, extra numeric columns: columnNameA,columnNameB")
+    parser.add_argument(
+        "--output", default="output_{stem}.tsv",
+        help="""Path template of the output of each file. It can use {path},
+        {dir}, {name} (file name) and {stem} (file name without extensions).
+        Default: output_{stem}.tsv""")
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=os.cpu_count() or 1,
+        help="Number of files filtered at the same time (default: all CPUs)")
+    parser.add_argument("--chunksize", type=int,
+                        help="As in dff, stream each file in chunks")
+    parser.add_argument("--project", action="store_true",
+                        help="As in dff, parse first the filtered columns")
+    parser.add_argument(
+        "--output-columns", type=lambda s: [_ for _ in s.split(',')],
+        help="As in dff, output only these columns")
+    parser.add_argument("--raw", action="store_true",
+                        help="As in dff, output the input lines untouched")
+    parser.add_argument("--optimize", action="store_true",
+                        help="As in dff, evaluate the selective filters first")
+
+    args = parser.parse_args(args)
+    if args.raw and args.output_columns is not None:
+        parser.error("--raw writes whole lines, it can't use --output-columns")
+
+    return args
+
+
+def paths(args):
+    """Return the list of TSV paths given in args, globs expanded."""
+    patterns = list(args.paths)
+    if args.manifest:
+        with open(args.manifest) as manifest:
+            patterns.extend(
+                _.strip() for _ in manifest
+                if _.strip() and not _.startswith("#"))
+
+    # Each file once, even if many patterns give it
+    found = OrderedDict()
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            found.setdefault(os.path.abspath(path), path)
+
+    return list(found.values())
+
+
+def collisions(files, template):
+    """Return the error of each of files whose output is another's too."""
+    outputs = OrderedDict()
+    for path in files:
+        outputs.setdefault(os.path.abspath(ff.output_path(template, path)),
+                           []).append(path)
+
+    return dict(
+        (path, "The output {} is also the one of {}".format(
+            output, ", ".join(_ for _ in same if _ != path)))
+        for output, same in outputs.items() if len(same) > 1
+        for path in same)
+
+
+def init_worker(filters, args, errors=None):
+    """Keep the Filter and args to use for every file of this process.
+
+    errors are those of the files not to filter, by path.
+
+    """
+    if args.numeric_cols:
+        ff.add_numeric(args.numeric_cols)
+    WORKER["filters"] = filters
+    WORKER["args"] = args
+    WORKER["errors"] = errors or {}
+
+
+def filter_one(path):
+    """Filter the TSV in path to its output.
+
+    Return a dict with the paths, rows in and out, seconds and error, if
+    any; errors are reported instead of raised.
+
+    """
+    filters, args = WORKER["filters"], WORKER["args"]
+    output = ff.output_path(args.output, path)
+    summary = {"path": path, "output": output, "rows_in": 0, "rows_out": 0,
+               "seconds": 0.0, "error": ""}
+    if path in WORKER["errors"]:
+        summary["error"] = WORKER["errors"][path]
+        return summary
+
+    start = timer()
+    filters.rows = [0, 0]
+    try:
+        result = ff.filter_file(path, filters, args)
+        if args.raw:
+            with open(output, "wb") as out:
+                ff.write_raw(result, path, out)
+        else:
+            with open(output, "w") as out:
+                ff.write(result, out)
+        summary["rows_in"], summary["rows_out"] = [int(_) for _ in
+                                                   filters.rows]
+    except Exception as err:
+        summary["error"] = "{}: {}".format(type(err).__name__, err)
+    summary["seconds"] = timer() - start
+
+    return summary
+
+
+def batch(files, filters, args):
+    """Filter every file in files, yielding the summary of each in order.
+
+    The files whose output path is the one of another file too are not
+    filtered, they are errors.
+
+    """
+    errors = collisions(files, args.output)
+    jobs = min(max(args.jobs, 1), max(len(files), 1))
+    if jobs == 1:
+        init_worker(filters, args, errors)
+        for path in files:
+            yield filter_one(path)
+        return
+
+    from multiprocessing import Pool
+
+    pool = Pool(jobs, initializer=init_worker,
+                initargs=(filters, args, errors))
+    try:
+        for summary in pool.imap(filter_one, files):
+            yield summary
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(args, out=sys.stdout):
+    """Filter the files in args and write their summary to out.
+
+    Return the number of files that failed.
+
+    """
+    # The conditions are read and compiled only once for all the files.
+    filters = ff.compile_filter(ff.conditions(args), args)
+    fields = ["path", "output", "rows_in", "rows_out", "seconds", "error"]
+
+    out.write("\t".join(fields) + "\n")
+    errors = 0
+    for summary in batch(paths(args), filters, args):
+        summary["seconds"] = "{:.3f}".format(summary["seconds"])
+        out.write("\t".join(str(summary[_]) for _ in fields) + "\n")
+        out.flush()
+        if summary["error"]:
+            errors += 1
+
+    return errors
+
+
+def run(args):
+    """Run the batch command line with args (sys.argv without "batch")."""
+    return 1 if main(argparser(args)) else 0
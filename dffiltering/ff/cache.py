@@ -0,0 +1,132 @@
+"""Binary columnar cache of the loaded TSV files.
+
+The cache lives next to the TSV, in a directory with the values of each
+column (already typecasted) and a meta.json with the key that makes it
+valid: the path, size and mtime of the TSV plus the numeric columns it was
+cast with. Numeric columns are .npy arrays, string ones the .npy codes of
+their distinct values, kept in JSON. Nothing is unpickled, so reading the
+cache of a shared file runs no code of whoever could write it.
+
+"""
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger("ff")
+
+SUFFIX = ".dffcache"
+# Changes when the files of the cache do, so the older ones are stale
+FORMAT = 2
+
+
+def cache_dir(filepath):
+    """Return the directory holding the cache of filepath."""
+    return filepath + SUFFIX
+
+
+def key(filepath, numeric_columns):
+    """Return the key of the filepath cached with these numeric columns."""
+    stat = os.stat(filepath)
+
+    return {"path": os.path.abspath(filepath),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "numeric": sorted(numeric_columns),
+            "format": FORMAT}
+
+
+def meta(filepath):
+    """Return the meta of the cache of filepath, None if there's none."""
+    try:
+        with open(os.path.join(cache_dir(filepath), "meta.json")) as js:
+            return json.load(js)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def read(filepath, numeric_columns, columns=None):
+    """Return the DF cached for filepath, None if missing or stale.
+
+    With columns, only those columns are read from the cache.
+
+    """
+    cached = meta(filepath)
+    if cached is None or cached["key"] != key(filepath, numeric_columns):
+        return None
+
+    names = cached["columns"]
+    if columns is not None:
+        names = [_ for _ in names if _ in columns]
+
+    directory = cache_dir(filepath)
+    data = {}
+    for name in names:
+        data[name] = read_column(directory, cached["files"][name])
+
+    # The rows are kept even when no column is read
+    return pd.DataFrame(data, columns=names,
+                        index=pd.RangeIndex(cached["rows"]))
+
+
+def read_column(directory, files):
+    """Return the values of a column stored as write_column does."""
+    values = np.load(os.path.join(directory, files["values"]),
+                     allow_pickle=False)
+    if "uniques" not in files:
+        return values
+
+    with open(os.path.join(directory, files["uniques"])) as js:
+        uniques = json.load(js)
+    if files["categorical"]:
+        return pd.Categorical.from_codes(values, uniques)
+    # The code -1 is the last one, NaN
+    return np.array(uniques + [np.nan], dtype=object)[values]
+
+
+def write_column(directory, index, series):
+    """Store the values of the series, return the names of its files."""
+    files = {"values": "{}.npy".format(index)}
+    if series.dtype.kind in "biuf":
+        np.save(os.path.join(directory, files["values"]), series.values,
+                allow_pickle=False)
+        return files
+
+    categorical = getattr(series.dtype, "name", None) == "category"
+    if categorical:
+        codes, uniques = series.cat.codes.values, series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    files.update(uniques="{}.json".format(index), categorical=categorical)
+    np.save(os.path.join(directory, files["values"]), codes,
+            allow_pickle=False)
+    with open(os.path.join(directory, files["uniques"]), "w") as js:
+        json.dump(list(uniques), js)
+
+    return files
+
+
+def write(df, filepath, numeric_columns):
+    """Store the df as the cache of filepath."""
+    directory = cache_dir(filepath)
+    try:
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+        # Invalidate any previous cache before overwriting its columns
+        if os.path.exists(os.path.join(directory, "meta.json")):
+            os.remove(os.path.join(directory, "meta.json"))
+
+        files = {}
+        for index, name in enumerate(df.columns):
+            files[name] = write_column(directory, index, df.iloc[:, index])
+
+        with open(os.path.join(directory, "meta.json"), "w") as js:
+            json.dump({"key": key(filepath, numeric_columns),
+                       "columns": list(df.columns), "rows": len(df),
+                       "files": files}, js)
+    except (IOError, OSError) as err:
+        logger.warning("Can't write the cache {} ({}).".format(
+            directory, err))
@@ -0,0 +1,121 @@
+"""Sends dff command lines to a dff server (see serve) and prints the result.
+
+It imports nothing but the standard library, so it starts at once.
+
+The protocol is a JSON line with the request ({"command": "filter",
+"cwd": ..., "args": [dff flags]}, or "stats" and "shutdown" commands),
+answered with a line "OK" or "ERROR message" and then the output bytes.
+
+"""
+import json
+import os
+import socket
+import sys
+import tempfile
+
+
+# Where the server listens by default (TCP on localhost if no Unix sockets)
+SOCKET = os.path.join(tempfile.gettempdir(), "dff.sock")
+PORT = 7357
+# Where the server on a TCP port keeps the token of its clients
+TOKENS = os.path.join(os.path.expanduser("~"), ".cache", "dff")
+
+
+def argparser(args):
+    """Return the parsed client arguments and the dff flags to send."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="dff client",
+        description="""Filter with a running `dff serve`. Any other flag is
+        a dff one, e.g. dff client --filepath a.tsv --json-filter f.json""")
+    address(parser)
+    parser.add_argument("--stats", action="store_true",
+                        help="Print the tables kept by the server")
+    parser.add_argument("--shutdown", action="store_true",
+                        help="Stop the server")
+
+    return parser.parse_known_args(args)
+
+
+def address(parser):
+    """Add the flags with the address of the server to parser."""
+    parser.add_argument(
+        "--socket", default=SOCKET,
+        help="Unix socket of the server (default {})".format(SOCKET))
+    parser.add_argument(
+        "--port", type=int,
+        help="""Port of the server on localhost, instead of a Unix socket
+        (default {} where there are no Unix sockets). The clients must read
+        the token of the server in {}""".format(PORT, TOKENS))
+
+
+def token_path(port):
+    """Return the path of the token of the server on port."""
+    return os.path.join(TOKENS, "server-{}.token".format(port))
+
+
+def token(args):
+    """Return the token of the server at the address in args, if any."""
+    if not (args.port or not hasattr(socket, "AF_UNIX")):
+        return None
+    try:
+        with open(token_path(args.port or PORT)) as saved:
+            return saved.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def connect(args):
+    """Return a socket connected to the server at the address in args."""
+    if args.port or not hasattr(socket, "AF_UNIX"):
+        return socket.create_connection(("127.0.0.1", args.port or PORT))
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.connect(args.socket)
+
+    return connection
+
+
+def request(args, message, out):
+    """Send the message to the server and copy its answer to out.
+
+    Return the error message of the server, None if there's none.
+
+    """
+    with connect(args) as connection:
+        connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+        answer = connection.makefile("rb")
+        status = answer.readline().decode("utf-8").rstrip("\n")
+        if status != "OK":
+            return status[len("ERROR "):] or "No answer from the server"
+
+        for data in iter(lambda: answer.read(1 << 16), b""):
+            out.write(data)
+        out.flush()
+
+    return None
+
+
+def run(args, out=None):
+    """Run the client command line with args (sys.argv without "client")."""
+    args, flags = argparser(args)
+    command = "filter"
+    if args.stats:
+        command = "stats"
+    elif args.shutdown:
+        command = "shutdown"
+
+    try:
+        failure = request(
+            args, {"command": command, "cwd": os.getcwd(), "args": flags,
+                   "token": token(args)},
+            out or sys.stdout.buffer)
+    except (IOError, OSError) as err:
+        failure = "Can't reach the server ({}), is `dff serve` on?".format(
+            err)
+    if failure:
+        print(failure, file=sys.stderr)
+        return 1
+
+    return 0
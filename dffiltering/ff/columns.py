@@ -64,3 +64,12 @@ COLUMN_TYPES["str"].extend(
      "GeneReviews_ID", "MCAP", "ClinVar_Phenotype", "ICGC_Id",
      "Eigen_coding_or_noncoding", "ICGC_Occurrence", "GeneReviews_Disease",
      "GTEx_V6_tissue", "ClinVar_Significance"])
+
+# String columns with a handful of distinct values, loaded as categoricals
+COLUMN_TYPES["category"] = [
+    "Chr", "Callers", "Func.refGene", "ExonicFunc.refGene", "Func.ensGene",
+    "ExonicFunc.ensGene", "SIFT_pred", "Polyphen2_HDIV_pred",
+    "Polyphen2_HVAR_pred", "LRT_pred", "MutationTaster_pred",
+    "MutationAssessor_pred", "FATHMM_pred", "PROVEAN_pred",
+    "fathmm-MKL_coding_pred", "MetaSVM_pred", "MetaLR_pred", "M-CAP_pred",
+    "Zygosity", "CHROM", "FILTER", "TYPE", "GT"]
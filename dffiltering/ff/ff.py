@@ -1,20 +1,57 @@
 """Deals with TAB files to load, munge and filter them."""
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from copy import deepcopy
 import logging
-from os.path import basename, splitext
+import os
+from os.path import basename, exists, splitext
 import re
-from colorama import init, Fore, Style
+import threading
+from timeit import default_timer as timer
+import numpy as np
 import pandas as pd
 
-init()  # Initialize colorama for windows
-
 try:
+    from .automaton import Automaton, literals
+    from . import cache as tsv_cache
+    from . import metrics
+    from . import reader
     from .columns import COLUMN_TYPES
+    from .options import argparser
 except (SystemError, ImportError):
+    from automaton import Automaton, literals
+    import cache as tsv_cache
+    import metrics
+    import reader
     from columns import COLUMN_TYPES
+    from options import argparser
 
 
 logger = logging.getLogger("ff")
 
+# From this many literals on, "contains" searches them with an automaton
+#  instead of a regex alternation.
+AUTOMATON_MIN = 64
+# Operators filtering by the strings of a column, all the others are queries.
+STRING_OPERATORS = ["contains", "not_contains", "in", "not_in"]
+# The terms of a query "in" a Python list or tuple, e.g. Chr in ["chr1"]
+QUERY_SEQUENCES = ("[", "(")
+# Values of the numeric columns that are missing values or truncated ones.
+NUMERIC_MARKS = {".": 0, "1.": 1, "-": 0}
+# ANNOVAR separates the multiple values of a cell (e.g. genes) with these.
+MULTIVALUE = re.compile(r"\s*[;,]\s*")
+# A string column with at most this many distinct values (and at most one
+#  per two rows) is loaded as a categorical, as those of
+#  COLUMN_TYPES["category"] always are.
+CATEGORY_MAX = 1024
+# Rows looked at first to rule out the columns with too many values.
+CATEGORY_SAMPLE = 10000
+# Not empty once colorama is initialized, on the first colored message.
+COLORAMA = []
+# The extra numeric columns of the request filtered by each thread (see
+#  extra_numeric).
+REQUEST = threading.local()
+
 
 def clean(column, df):
     """Return the header/column in the DF cleaned from weird chars."""
@@ -36,94 +73,833 @@ def clean(column, df):
     return new_column, df
 
 
+def distinct(series, function):
+    """Return function applied to each value of the series as a bool array.
+
+    function is called once per distinct value and NaN is always False.
+    The values of a categorical series are its categories already.
+
+    """
+    if is_categorical(series):
+        codes, uniques = series.cat.codes.values, series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    hits = np.array([function(_) for _ in uniques] + [False], dtype=bool)
+
+    return hits[codes]
+
+
+def is_categorical(series):
+    """Return if the series is a categorical one."""
+    return getattr(series.dtype, "name", None) == "category"
+
+
+def decategorize(df):
+    """Return the DF with its categorical columns back to strings."""
+    categoricals = [_ for _ in df.columns if is_categorical(df[_])]
+    if not categoricals:
+        return df
+
+    return df.astype(dict((_, object) for _ in categoricals))
+
+
+def by_strings(operator, terms):
+    """Return if a condition filters by strings instead of being a query.
+
+    "in" with a Python list or tuple of terms is the one of pandas queries.
+
+    """
+    return operator in STRING_OPERATORS and not (
+        operator == "in" and terms.lstrip().startswith(QUERY_SEQUENCES))
+
+
 def error(text):
     """Colorize a text as error for the logs."""
+    from colorama import init, Fore, Style
+
+    if not COLORAMA:
+        init()  # Initialize colorama for windows, once
+        COLORAMA.append(True)
+
     return "{}{}{}".format(Fore.RED, text, Style.RESET_ALL)
 
 
+class Filter(object):
+    """The filtering conditions compiled once into a plan of boolean masks.
+
+    Each condition is resolved against the DF columns (extension trimming
+    and clean renames) only once per distinct header, so the same Filter
+    can be applied to any number of DataFrames, chunks or files. The
+    conditions are then ANDed into a single mask with one final selection.
+
+    """
+
+    def __init__(self, conditions, optimize=False, sample_size=1000):
+        self.conditions = list(conditions)
+        self.plans = {}
+        # With optimize the steps are sorted cheapest and most selective
+        #  first, using the stats estimated on a sample (or loaded from a
+        #  previous run) of {condition: (seconds per row, fraction kept)}.
+        self.optimize = optimize
+        self.sample_size = sample_size
+        self.stats = {}
+        # {condition: [seconds, rows before, rows after]} of the real runs
+        self.timings = {}
+        self.order = []
+        self.matchers = {}
+        # Rows seen and rows passed
+        self.rows = [0, 0]
+
+    def plan(self, columns):
+        """Return the renamed columns and the steps to filter them."""
+        columns = tuple(columns)
+        if columns not in self.plans:
+            self.plans[columns] = self.compile(columns)
+
+        return self.plans[columns]
+
+    def compile(self, columns):
+        """Resolve the conditions against the columns.
+
+        Return the columns once renamed and a list of (column, operator,
+        terms, condition) steps for the columns found.
+
+        """
+        # An empty DF with the same header receives the very same renames
+        #  the filtered DF would.
+        df = pd.DataFrame(columns=columns)
+        renames = []
+        steps = []
+
+        for condition in self.conditions:
+            for old, new in renames:
+                if condition.startswith(old):
+                    condition = new + condition[len(old):]
+
+            column, operator, terms = condition.split(" ", 2)
+            original_column = column
+
+            if column not in df.columns:
+                # As now this could come as file, trim the extension from the
+                #  column name.
+                column = splitext(column)[0]
+
+            new_column, df = clean(column, df)
+            if new_column != column:
+                # Replace all cases of this weird column
+                renames.append((column, new_column))
+                condition = new_column + condition[len(column):]
+
+            if new_column in df.columns:
+                steps.append((new_column, operator, terms, condition))
+            else:
+                logger.error(
+                    error("Column not found ({}).".format(original_column)))
+
+        return list(df.columns), steps
+
+    def columns(self, columns):
+        """Return the columns the conditions need to be evaluated."""
+        renamed, steps = self.plan(columns)
+        used = set()
+        for column, operator, terms, condition in steps:
+            used.add(column)
+            if not by_strings(operator, terms):
+                # A query can compare with other columns too
+                used.update(re.findall(r"[A-Za-z_]\w*", condition))
+
+        return [column for column, new_column in zip(columns, renamed)
+                if new_column in used]
+
+    def matcher(self, operator, terms):
+        """Return a function telling if a cell matches the terms, if any.
+
+        None means the regex of the terms is the fastest way to go.
+
+        """
+        if (operator, terms) not in self.matchers:
+            matcher = None
+            if operator in ["in", "not_in"]:
+                words = set(terms.split("|"))
+
+                def matcher(value):
+                    return not words.isdisjoint(
+                        MULTIVALUE.split(str(value)))
+            else:
+                words = literals(terms)
+                if words is not None and len(words) >= AUTOMATON_MIN:
+                    automaton = Automaton(words)
+
+                    def matcher(value):
+                        return isinstance(value, str) and \
+                            automaton.search(value)
+
+            self.matchers[(operator, terms)] = matcher
+
+        return self.matchers[(operator, terms)]
+
+    def step(self, df, step, mask):
+        """Return the mask of the rows alive in mask that also pass step."""
+        column, operator, terms, condition = step
+
+        if by_strings(operator, terms):
+            # Only look into the strings of the rows still alive.
+            series = df[column]
+            if not mask.all():
+                series = series[mask]
+            matcher = self.matcher(operator, terms)
+            if matcher is None and is_categorical(series):
+                # The regex runs once per category instead of once per row
+                regex = re.compile(terms)
+
+                def matcher(value):
+                    return isinstance(value, str) and \
+                        regex.search(value) is not None
+            if matcher is None:
+                found = series.str.contains(terms, na=False).values
+            else:
+                found = distinct(series, matcher)
+            if operator.startswith("not_"):
+                found = ~found
+            mask = mask.copy()
+            mask[mask] = found
+
+            return mask
+
+        try:
+            found = df.eval(condition)
+        except TypeError:
+            # Categoricals only compare for equality with anything else
+            found = decategorize(df).eval(condition)
+
+        return mask & np.asarray(found, dtype=bool)
+
+    def estimate(self, df, steps):
+        """Store the cost and selectivity of the steps on a sample of df."""
+        sample = df
+        if len(df) > self.sample_size:
+            sample = df.sample(self.sample_size, random_state=0)
+
+        alive = np.ones(len(sample), dtype=bool)
+        for step in steps:
+            start = timer()
+            kept = self.step(sample, step, alive).sum()
+            self.stats[step[3]] = (
+                (timer() - start) / max(len(sample), 1),
+                kept / max(len(sample), 1))
+
+    def sort(self, df, steps):
+        """Return the steps sorted by their rank (cheap and selective first).
+
+        The rank of a step is its cost per row over the fraction of rows it
+        discards, the best order for a chain of ANDed conditions.
+
+        """
+        if any(_[3] not in self.stats for _ in steps):
+            self.estimate(df, [_ for _ in steps if _[3] not in self.stats])
+
+        def rank(step):
+            cost, kept = self.stats[step[3]]
+            if kept >= 1:
+                return float("inf")
+            return cost / (1 - kept)
+
+        return sorted(steps, key=rank)
+
+    def mask(self, df, steps, shared=None):
+        """Return the boolean mask of the rows in df that pass all steps.
+
+        shared maps the conditions other Filters evaluate on df too to their
+        mask over all the rows (None until one of them evaluates it), so each
+        of them is evaluated only once.
+
+        """
+        mask = np.ones(len(df), dtype=bool)
+
+        if self.optimize:
+            steps = self.sort(df, steps)
+        self.order = [_[3] for _ in steps]
+
+        for step in steps:
+            if not mask.any():
+                # Nothing left to filter out
+                break
+
+            rows = mask.sum()
+            start = timer()
+            if shared is not None and step[3] in shared:
+                if shared[step[3]] is None:
+                    shared[step[3]] = self.step(
+                        df, step, np.ones(len(df), dtype=bool))
+                mask = mask & shared[step[3]]
+            else:
+                mask = self.step(df, step, mask)
+            timing = self.timings.setdefault(step[3], [0, 0, 0])
+            timing[0] += timer() - start
+            timing[1] += rows
+            timing[2] += mask.sum()
+
+        self.rows[0] += len(df)
+        self.rows[1] += mask.sum()
+
+        return mask
+
+    def apply(self, df, shared=None):
+        """Return the DF filtered by the conditions.
+
+        shared is the masks of the conditions shared with other Filters, as
+        in mask.
+
+        """
+        columns, steps = self.plan(df.columns)
+        df.columns = columns
+
+        if not steps:
+            self.rows[0] += len(df)
+            self.rows[1] += len(df)
+            return df
+
+        with metrics.stage("filter"):
+            return df.loc[self.mask(df, steps, shared)]
+
+    def load_stats(self, filepath):
+        """Update the stats with the ones saved by a previous run."""
+        import json
+
+        with open(filepath) as stats:
+            self.stats.update(
+                (condition, tuple(stat))
+                for condition, stat in json.load(stats).items())
+
+    def save_stats(self, filepath):
+        """Save the stats, refined with the timings of this run."""
+        import json
+
+        for condition, (seconds, before, after) in self.timings.items():
+            if before:
+                self.stats[condition] = (seconds / before, after / before)
+
+        with open(filepath, "w") as stats:
+            json.dump(self.stats, stats, indent=1, sort_keys=True)
+
+    def report(self):
+        """Return a report of the evaluation order and time per condition."""
+        lines = ["{:>3} {:>10} {:>10} {:>10}  {}".format(
+            "#", "seconds", "rows in", "rows out", "condition")]
+        for index, condition in enumerate(self.order, 1):
+            seconds, before, after = self.timings.get(condition, [0, 0, 0])
+            lines.append("{:>3} {:>10.4f} {:>10} {:>10}  {}".format(
+                index, seconds, before, after, condition))
+
+        return "\n".join(lines)
+
+
 def dffilter(conditions, df):
     """Return a dataframe filtered by the conditions."""
     if not conditions:
         return df
 
-    column, operator, terms = conditions[0].split(" ", 2)
+    return Filter(conditions).apply(df)
 
-    original_column = column
 
-    if column not in df.columns:
-        # As now this could come as file, trim the extension from the
-        #  column name.
-        column = splitext(column)[0]
+def numeric(value):
+    """Return the value of a numeric column cleaned before its typecast."""
+    if not isinstance(value, str):
+        return 0
+    # Correct columns with "," to ".".
+    value = value.replace(",", ".")
+    # Correct columns with "." or "-" to zeroes and "1." to ones.
+    return NUMERIC_MARKS.get(value, value)
 
-    new_column, df = clean(column, df)
-    conditions = [re.sub(r"\A" + column, new_column, _)
-                  for _ in conditions]
-    column = new_column
 
-    if column in df.columns:
-        if operator in ["contains"]:
-            return dffilter(conditions[1:],
-                            df[df[column].str.contains(terms, na=False)])
+def numerize(df, numeric_columns=None, traits=None):
+    """Return the DF with the known numeric columns cleaned and typecasted.
 
-        if operator in ["not_contains"]:
-            return dffilter(conditions[1:],
-                            df[~df[column].str.contains(terms, na=False)])
+    If a traits dict is given, it's updated with the traits of each numeric
+    column that decide if it's float (see float_columns).
 
-        else:
-            df.query(conditions[0], inplace=True)
-            #return dffilter(conditions[1:], df)
+    """
+    if numeric_columns is None:
+        numeric_columns = numeric_in(df.columns)
+
+    numerized = {}
+    for numeric_column in numeric_columns:
+        # Clean and cast each distinct value once, instead of running
+        #  every correction over the whole column, and spread the results
+        #  back through the codes. Columns of frequencies and scores repeat
+        #  the same few values over and over.
+        codes, uniques = pd.factorize(df[numeric_column])
+        cleaned = [numeric(_) for _ in uniques]
+        has_strings = any(isinstance(_, str) for _ in cleaned)
+        has_nan = bool((codes == -1).any())
+        # The last one (code -1) is the NaN, filled with zero.
+        # Typecast the column into numeric hidding errors in NaN
+        values = pd.to_numeric(
+            pd.Series(cleaned + [0], dtype=object), errors="coerce").values
+        if traits is not None:
+            merge_traits(traits, {numeric_column: (
+                values.dtype.kind == "f", has_strings, has_nan,
+                bool(len(uniques)))})
+        if len(uniques) and has_nan and not has_strings:
+            # A column with NaN and nothing but zeroes and ones to correct
+            #  was left as floats before the typecast.
+            values = values.astype(float)
+        numerized[numeric_column] = values[codes]
+
+    if not df.columns.is_unique:
+        for numeric_column, values in numerized.items():
+            df[numeric_column] = values
+        return df
+
+    # Setting the columns one by one copies all the other (object) columns
+    #  each time, which grows with the square of the width of the table.
+    return pd.DataFrame(
+        dict((column, numerized[column] if column in numerized
+              else df[column].values) for column in df.columns),
+        index=df.index, columns=df.columns)
+
+
+def categorize(df, category_columns=None, most=CATEGORY_MAX):
+    """Return the DF with its low-cardinality string columns as categoricals.
+
+    The columns of category_columns (COLUMN_TYPES["category"] by default)
+    always are, any other string column when it has at most most distinct
+    values (no limit if None) and at most one per two rows. They take far
+    less memory and their strings are filtered once per category instead of
+    once per row.
+
+    """
+    if category_columns is None:
+        category_columns = COLUMN_TYPES["category"]
+    if not df.columns.is_unique:
+        return df
+
+    categorized = {}
+    for column in df.columns:
+        series = df[column]
+        if series.dtype != object:
+            continue
+        told = column in category_columns
+        if not told:
+            sample = series.iloc[:CATEGORY_SAMPLE]
+            distinct = sample.nunique()
+            if (most is not None and distinct > most) or \
+                    distinct * 2 > len(sample):
+                continue
+        codes, uniques = pd.factorize(series)
+        if len(uniques) and (told or (
+                (most is None or len(uniques) <= most) and
+                len(uniques) * 2 <= len(series))):
+            categorized[column] = pd.Categorical.from_codes(codes, uniques)
+
+    if not categorized:
+        return df
+
+    return pd.DataFrame(
+        dict((column, categorized[column] if column in categorized
+              else df[column].values) for column in df.columns),
+        index=df.index, columns=df.columns)
+
+
+def compact_dtypes(df, out=None):
+    """Return the DF with every column in the smallest dtype for its values.
+
+    The integers go down to int32 if they fit (not smaller, so the math of
+    the queries doesn't overflow), the floats to float32 only if all of them
+    are exactly the same as float32, and the strings with repeated values to
+    categoricals. With out, write to it a report of the memory before and
+    after.
+
+    """
+    before = memory(df) if out else None
+
+    compacted = {}
+    for column in df.columns:
+        values = df[column].values
+        if values.dtype.kind == "i" and values.dtype.itemsize > 4 and \
+                (not len(values) or
+                 (values.min() >= np.iinfo(np.int32).min and
+                  values.max() <= np.iinfo(np.int32).max)):
+            compacted[column] = values.astype(np.int32)
+        elif values.dtype.kind == "f" and values.dtype.itemsize > 4:
+            small = values.astype(np.float32)
+            if ((small == values) | np.isnan(values)).all():
+                compacted[column] = small
+
+    if compacted and df.columns.is_unique:
+        df = pd.DataFrame(
+            dict((column, compacted[column] if column in compacted
+                  else df[column].values) for column in df.columns),
+            index=df.index, columns=df.columns)
+    df = categorize(df, most=None)
+
+    if out:
+        out.write(memory_report(before, memory(df)) + "\n")
+
+    return df
+
+
+def memory(df):
+    """Return the list of (dtype, bytes) of each column of the DF."""
+    return list(zip(
+        [str(_) for _ in df.dtypes],
+        df.memory_usage(index=False, deep=True).values.tolist()))
+
+
+def memory_report(before, after):
+    """Return a report of the memory of the columns, before and after.
+
+    before and after are the memory of the same columns, as memory returns
+    them, before and after changing their dtypes. The columns are grouped by
+    the dtype they had and the one they have.
+
+    """
+    groups = OrderedDict()
+    for (dtype, size), (new_dtype, new_size) in zip(before, after):
+        group = groups.setdefault(
+            "{} -> {}".format(dtype, new_dtype), [0, 0, 0])
+        group[0] += 1
+        group[1] += size
+        group[2] += new_size
+
+    lines = ["{:<24} {:>8} {:>12} {:>12}".format(
+        "dtype", "columns", "before Mb", "after Mb")]
+    groups["total"] = [sum(_) for _ in zip(*groups.values())]
+    for dtypes, (columns, size, new_size) in groups.items():
+        lines.append("{:<24} {:>8} {:>12.1f} {:>12.1f}".format(
+            dtypes, columns, size / 2.0 ** 20, new_size / 2.0 ** 20))
+
+    return "\n".join(lines)
+
+
+def merge_traits(traits, other):
+    """Update the numeric column traits with the ones of other part."""
+    for column, column_traits in other.items():
+        traits[column] = tuple(
+            _ or __ for _, __ in zip(
+                traits.get(column, column_traits), column_traits))
+
+
+def float_columns(traits):
+    """Return the set of numeric columns with these traits that are float.
+
+    traits are those of numerize, gathered over all the parts (chunks,
+    shards...) of a file: the column is float in the whole file if any part
+    has decimals or non numbers, or if none has strings but some has NaN.
+
+    """
+    return set(column for column, (floats, strings, nan, values)
+               in traits.items()
+               if floats or (values and nan and not strings))
+
+
+def retype(df, traits, renames=None):
+    """Return a part of a file typecasted as the whole file would be.
+
+    traits are those gathered by numerize over all the parts of the file.
+    renames maps the numeric columns to their names in df, if renamed.
+
+    """
+    floats = float_columns(traits)
+    for column in traits:
+        new_column = column if renames is None else renames[column]
+        if column in floats:
+            df[new_column] = df[new_column].astype(float)
+        elif df[new_column].dtype.kind == "f":
+            # Only floats for its NaN, all of them zeroes and ones
+            df[new_column] = df[new_column].astype("int64")
+
+    return df
+
+
+def opener(filepath):
+    """Return the function to open filepath, gzipped or not."""
+    if filepath.endswith(".gz"):
+        from gzip import open as open_f
     else:
-        logger.error(
-            error("Column not found ({}).".format(original_column)))
+        open_f = open
+
+    return open_f
+
 
-    # This column didn't exits, continue trying next columns
-    return dffilter(conditions[1:], df)
+def read_header(filepath):
+    """Return the list of column names of the filepath."""
+    with opener(filepath)(filepath, "rb") as csv:
+        return csv.readline().decode().rstrip().split("\t")
 
 
-def load(filepath):
+def load(filepath, chunksize=None, cache=False, columns=None, compact=False,
+         retyped=True):
     """Return the filepath loaded as a DataFrame.
 
-    filepath is a path to either a .tab file or a .tab gzipped file.
+    filepath is a path to either a .tab file or a .tab gzipped file, "-"
+    for the standard input or a file object (see load_stream).
+
+    With a chunksize, return an iterator of DataFrames of chunksize rows
+    instead, so the whole file never has to fit in memory. Their numeric
+    columns are typecasted as in the whole file, unless not retyped (see
+    load_chunks).
+
+    With cache, reuse (or create) a binary cache of the loaded DataFrame
+    next to the file, and read only the columns given, if any.
+
+    With compact, the columns take the smallest dtypes that keep their
+    values (see compact_dtypes), reporting the memory saved to stderr.
 
     """
+    if reader.is_stream(filepath):
+        return load_stream(filepath, chunksize, compact)
+
+    if chunksize:
+        return load_chunks(
+            filepath, read_header(filepath), chunksize, retyped)
+
+    if cache:
+        header = read_header(filepath)
+        numeric_columns = numeric_in(header)
+        with metrics.stage("read"):
+            df = tsv_cache.read(filepath, numeric_columns, columns)
+        if df is not None:
+            return compacted(df) if compact else df
+
     # Explain: if dtype is not specified, read_table loads all the file into
     #  RAM (4 Gb), then infer types (down to 2 Gb) and then work. By loading
     #  everything as "object" we save the first pre-loading.
-    if filepath.endswith(".gz"):
-        from gzip import open as open_f
-    else:
-        open_f = open
+    # The file is decompressed (by other threads) and decoded only once, for
+    #  both the encoding detection and the parsing.
+    with metrics.stage("read"):
+        df = reader.read_table(filepath, dtype=object)
 
-    with open_f(filepath, "rb") as csv:
-        header = {}.fromkeys(
-            csv.readline().decode().rstrip().split("\t"), object)
+    numeric_columns = numeric_in(df.columns)
+    with metrics.stage("numerize"):
+        df = categorize(numerize(df, numeric_columns))
 
-    try:
-        df = pd.read_table(filepath, dtype=header)
-    except UnicodeDecodeError:
-        df = pd.read_table(filepath, dtype=header, encoding="iso-8859-1")
+    if cache:
+        with metrics.stage("cache"):
+            tsv_cache.write(df, filepath, numeric_columns)
+        if columns is not None:
+            df = df[[_ for _ in df.columns if _ in columns]]
 
-    numeric_columns = [_ for _ in COLUMN_TYPES["numeric"] if _ in df.columns]
+    return compacted(df) if compact else df
 
-    for numeric_column in numeric_columns:
-        # Correct columns with "," to ".".
-        df[numeric_column] = df[numeric_column].str.replace(",", ".")
-        # Correct columns with "." to zeroes.
-        df[numeric_column].replace(".", 0, inplace=True)
-        # Correct columns with "1." to ones.
-        df[numeric_column].replace("1.", 1, inplace=True)
-        # Replace - with zeroes
-        df[numeric_column].replace("-", 0, inplace=True)
-        # Fill the NaN with zeroes
-        df[numeric_column].fillna(0, inplace=True)
-        # Typecast the column into numeric hidding errors in NaN
-        df[numeric_column] = pd.to_numeric(df[numeric_column], errors="coerce")
 
-    # This could be faster than above line... but it isn't
-    # df[numeric_columns] = df[numeric_columns].\
-    #    apply(pd.to_numeric, errors="coerce")
+def compacted(df):
+    """Return compact_dtypes of the DF, reporting the memory to stderr."""
+    import sys
 
-    return df
+    with metrics.stage("compact"):
+        return compact_dtypes(df, sys.stderr)
+
+
+def load_stream(stream, chunksize=None, compact=False):
+    """Return the TSV in stream loaded as load does.
+
+    stream is "-" for the standard input, or a file object (binary, even
+    gzipped, or text). It's read only once: with a chunksize, each chunk is
+    typecasted on its own, so a numeric column can print as 3 in a chunk
+    and as 3.0 in another with decimals.
+
+    """
+    if chunksize:
+        return stream_chunks(stream, chunksize)
+
+    with metrics.stage("read"):
+        df = reader.read_table(stream, dtype=object)
+    with metrics.stage("numerize"):
+        df = categorize(numerize(df))
+
+    return compacted(df) if compact else df
+
+
+def stream_chunks(stream, chunksize):
+    """Yield the TSV in stream as numerized DataFrames of chunksize rows."""
+    for chunk in metrics.iterate("read", reader.read_chunks(
+            stream, chunksize, dtype=object)):
+        with metrics.stage("numerize"):
+            chunk = numerize(chunk)
+        yield chunk
+
+
+def iter_filtered(source, filters, chunksize=100000):
+    """Yield the rows of source that pass the filters, as DataFrames.
+
+    source is a path to a TSV (gzipped or not), "-" for the standard input
+    or a file object with one. filters is a list of conditions or a Filter.
+    Only chunksize rows are in memory at a time, filtered as soon as they
+    are read (see load).
+
+    """
+    if not isinstance(filters, Filter):
+        filters = Filter(filters)
+
+    for chunk in load(source, chunksize):
+        yield filters.apply(chunk)
+
+
+def load_chunks(filepath, header, chunksize, retyped=True):
+    """Yield the filepath as numerized DataFrames of chunksize rows.
+
+    Unless retyped is False, the numeric columns are typecasted as in the
+    whole file. Then each chunk is typecasted on its own (a number can be
+    3 in a chunk and 3.0 in another), but the file is read only once.
+
+    """
+    numeric_columns = numeric_in(header)
+
+    # A column typecasts to int in a chunk of integers, but to float when the
+    #  whole file is loaded and any other chunk has decimals (or the other
+    #  way around). Gather the traits of the numeric columns in all the
+    #  chunks first so every chunk prints exactly like the whole DF would.
+    #  That read tells the encoding of the file for the next one too.
+    traits = file_encoding = None
+    if retyped:
+        traits = {}
+        with reader.open_text(filepath) as text:
+            for chunk in metrics.iterate("read", pd.read_table(
+                    text, dtype=object, chunksize=chunksize,
+                    usecols=numeric_columns)):
+                with metrics.stage("numerize"):
+                    numerize(chunk, numeric_columns, traits)
+            file_encoding = text.file_encoding()
+
+    for chunk in metrics.iterate("read", reader.read_chunks(
+            filepath, chunksize, file_encoding, dtype=object)):
+        with metrics.stage("numerize"):
+            chunk = numerize(chunk, numeric_columns)
+            if traits is not None:
+                chunk = retype(chunk, traits)
+        yield chunk
+
+
+def project(filepath, filters, output_columns=None, chunksize=None):
+    """Return the rows of filepath that pass the filters, as load does.
+
+    Only the columns the filters need are parsed (and typecasted) to find
+    the rows that pass. Then only those rows are parsed in full, or only
+    their output_columns if given. The numeric columns of the output are
+    typecasted on the rows that passed only.
+
+    With a chunksize, return an iterator of DataFrames as load does.
+
+    """
+    # The header, the rows that pass and the encoding of the file, all from
+    #  the same read of the columns filtered.
+    positions = file_encoding = None
+    with reader.open_text(filepath) as text:
+        header = parse_header(text.readline())
+        renamed, steps = filters.plan(header)
+        if steps:
+            used = filters.columns(header)
+            before = (list(filters.rows), deepcopy(filters.timings))
+            positions, rows = passing_rows(pd.read_table(
+                text, dtype=object, header=None, names=header, usecols=used,
+                chunksize=chunksize or 1000000), filters, steps, header,
+                renamed)
+            file_encoding = text.file_encoding()
+            lossy = text.lossy
+            blank_lines = text.lines() > rows + 1
+    renames = dict(zip(header, renamed))
+
+    if positions is not None and lossy:
+        # Some of it was decoded as UTF-8 but all of it is ISO-8859-1
+        filters.rows, filters.timings = before
+        positions, rows = passing_rows(reader.read_chunks(
+            filepath, chunksize or 1000000, file_encoding, dtype=object,
+            usecols=used), filters, steps, header, renamed)
+
+    keep = None
+    if positions is not None:
+        # The lines of the rows that pass, after the header
+        keep = set((row_lines(filepath)[positions] if blank_lines
+                    else positions + 1).tolist())
+
+    if output_columns is not None:
+        for column in output_columns:
+            if column not in header:
+                logger.error(error("Column not found ({}).".format(column)))
+        output_columns = [_ for _ in header if _ in output_columns]
+
+    skiprows = None if keep is None else \
+        (lambda line: line and line not in keep)
+    with metrics.stage("read"):
+        if chunksize:
+            df = reader.read_chunks(
+                filepath, chunksize, file_encoding, dtype=object,
+                usecols=output_columns, skiprows=skiprows)
+        else:
+            df = reader.read_table(
+                filepath, file_encoding, dtype=object,
+                usecols=output_columns, skiprows=skiprows)
+
+    def rows(chunk, start):
+        """Return the chunk typecasted and renamed as the filters do."""
+        with metrics.stage("numerize"):
+            chunk = numerize(chunk)
+        chunk.columns = [renames[_] for _ in chunk.columns]
+        if positions is not None:
+            # Index the rows by their position in the file, as load does.
+            chunk.index = positions[start:start + len(chunk)]
+        else:
+            filters.rows[0] += len(chunk)
+            filters.rows[1] += len(chunk)
+        return chunk
+
+    if chunksize:
+        return projected_chunks(df, rows)
+
+    return rows(df, 0)
+
+
+def parse_header(line):
+    """Return the names of the columns in the header line, as parsed.
+
+    The parser mangles the duplicated names (e.g. Gene and Gene.1).
+
+    """
+    from io import StringIO
+
+    return list(pd.read_table(StringIO(line), dtype=object, nrows=0).columns)
+
+
+def passing_rows(chunks, filters, steps, header, renamed):
+    """Return the positions of the rows in chunks passing the steps.
+
+    The number of rows in the chunks is returned too.
+
+    """
+    renames = dict(zip(header, renamed))
+    positions = []
+    rows = 0
+    for chunk in metrics.iterate("read", chunks):
+        with metrics.stage("numerize"):
+            chunk = numerize(chunk)
+        chunk.columns = [renames[_] for _ in chunk.columns]
+        with metrics.stage("filter"):
+            positions.append(
+                np.flatnonzero(filters.mask(chunk, steps)) + rows)
+        rows += len(chunk)
+
+    return np.concatenate(positions or [[]]).astype(int), rows
+
+
+def row_lines(filepath):
+    """Return the line of each row of filepath (1... after the header).
+
+    The parser skips the blank lines, they are no row.
+
+    """
+    with reader.open_binary(filepath) as stream:
+        stream.readline()
+        return np.array([number for number, line in enumerate(stream, 1)
+                         if not reader.blank(line)], dtype=int)
+
+
+def projected_chunks(chunks, rows):
+    """Yield the chunks through rows, with the position of their first."""
+    start = 0
+    for chunk in metrics.iterate("read", chunks):
+        yield rows(chunk, start)
+        start += len(chunk)
 
 
 def load_from_files(filepaths, condition):
@@ -139,67 +915,649 @@ def load_from_files(filepaths, condition):
     return conds
 
 
-def argparser(args):
-    """Return the parsed arguments."""
-    import argparse
+def add_numeric(columns):
+    """Add the columns to the known numeric ones."""
+    COLUMN_TYPES["numeric"].extend(
+        _ for _ in columns if _ not in COLUMN_TYPES["numeric"])
+
+
+@contextmanager
+def extra_numeric(columns):
+    """Context where the columns are known numeric ones, in this thread only.
 
-    parser = argparse.ArgumentParser(description="DataFrame Filtering")
-    parser.add_argument("--filepath",
-                        help="Path to the TSV file")
-    parser.add_argument("--json-filter",
-                        help="JSON file with list of filters")
-    parser.add_argument(
-        "--column-contains", action="append",
-        help="""If you find more suitable to provide the filtering conditions
-        as a txt list in a file, include as many columns as you need:
+    Unlike add_numeric, the other threads (e.g. filtering the other requests
+    of a server) don't see them.
 
-        --column-contains columnName --column-contains anotherCol""")
+    """
+    REQUEST.numeric = list(columns or [])
+    try:
+        yield
+    finally:
+        REQUEST.numeric = []
 
-    parser.add_argument(
-        "--numeric-cols",
-        type=lambda s: [_ for _ in s.split(',')],
-        help="""If you have numeric columns added to your .tsv file that are
-        not in the default ones, you'll have to include them in this flag:
 
-        --numeric-cols columnName
-        --numeric-cols columnNameA,columnNameB""")
+def known_numeric():
+    """Return the known numeric columns, with the extra ones of the thread."""
+    return COLUMN_TYPES["numeric"] + [
+        _ for _ in getattr(REQUEST, "numeric", [])
+        if _ not in COLUMN_TYPES["numeric"]]
 
-    parser.add_argument("--version", "-v", action="store_true")
 
-    return parser.parse_args(args)
+def numeric_in(columns):
+    """Return the known numeric columns in columns."""
+    return [_ for _ in known_numeric() if _ in columns]
 
 
-def main(args):  # json_filter, filepath, column_contains=None):
-    """Return a filtered DF per json_filter."""
-    if getattr(args, "version", None):
-        from . import _version
-        print(_version.__version__)
+def json_filters(args):
+    """Return the (name, path) of each JSON filter file given in args.
+
+    A filter set is named as given in name=path, else after its file.
 
+    """
+    paths = getattr(args, "json_filter", None) or []
+    if isinstance(paths, str):
+        paths = [paths]
+
+    named = []
+    for path in paths:
+        name, equals, named_path = path.partition("=")
+        if equals and name and os.sep not in name and not exists(path):
+            path = named_path
+        else:
+            name = splitext(basename(path))[0]
+        named.append((name, path))
+
+    return named
+
+
+def conditions(args, json_filter=None):
+    """Return the list of filtering conditions given in args.
+
+    The conditions are read from the json_filter file, the first one in args
+    by default.
+
+    """
     filters = []
-    if args.json_filter:
+    if json_filter is None and json_filters(args):
+        json_filter = json_filters(args)[0][1]
+    if json_filter:
         import json
 
-        with open(args.json_filter) as js_filter:
+        with open(json_filter) as js_filter:
             filters = json.load(js_filter)
 
     if getattr(args, "column_contains", None):
         # Load the extra conditions passed
         filters.extend(load_from_files(args.column_contains, "contains"))
 
-    if getattr(args, "numeric_cols", None):
-        # Load the extra columns defined as numeric
-        COLUMN_TYPES["numeric"].extend(args.numeric_cols)
+    if getattr(args, "column_in", None):
+        filters.extend(load_from_files(args.column_in, "in"))
+
+    return filters
+
+
+def compile_filter(filters, args):
+    """Return the Filter for the filters list, optimized as args ask."""
+    stats = getattr(args, "filter_stats", None)
+    filters = Filter(
+        filters, optimize=bool(getattr(args, "optimize", False) or stats))
+    if stats and exists(stats):
+        filters.load_stats(stats)
+
+    return filters
+
+
+def compile_filters(filter_sets, args):
+    """Return the compiled Filter of each list of filters, by name.
+
+    All of them share the same stats, so the ones of all the conditions are
+    saved and loaded together.
+
+    """
+    compiled = OrderedDict()
+    for name, filters in filter_sets.items():
+        compiled[name] = compile_filter(filters, args)
+        compiled[name].stats = next(iter(compiled.values())).stats
+
+    return compiled
+
+
+def read_regions(filepath, args):
+    """Return the rows of filepath in the regions given in args."""
+    try:
+        from . import region
+    except (SystemError, ImportError):
+        import region
+
+    regions = [region.parse_region(_) for _ in args.region or []]
+    if getattr(args, "regions_bed", None):
+        regions.extend(region.read_bed(args.regions_bed))
+    with metrics.stage("read"):
+        return region.load_regions(filepath, regions)
 
-    if args.filepath:
-        df = dffilter(filters, load(args.filepath))
+
+def read_zones(filepath, filters, chunksize=None):
+    """Return the rows of filepath no zone map rules out (see zonemap)."""
+    try:
+        from . import zonemap
+    except (SystemError, ImportError):
+        import zonemap
+
+    if chunksize:
+        return metrics.iterate(
+            "read", zonemap.read_zones(filepath, filters, chunksize))
+    with metrics.stage("read"):
+        return zonemap.read_zones(filepath, filters)
+
+
+def select_columns(df, header, filters, output_columns):
+    """Return the output_columns of the DF filtered by filters from header."""
+    renames = dict(zip(header, filters.plan(header)[0]))
+
+    return df[[renames[_] for _ in header if _ in output_columns]]
+
+
+def filter_file(filepath, filters, args):
+    """Return the filepath filtered by the Filter filters, as args ask.
+
+    If args.chunksize is set, return an iterator of filtered DFs instead.
+
+    """
+    chunksize = getattr(args, "chunksize", None)
+    output_columns = getattr(args, "output_columns", None)
+
+    if getattr(args, "region", None) or getattr(args, "regions_bed", None):
+        df = read_regions(filepath, args)
+        header = list(df.columns)
+        df = filters.apply(df)
+        if output_columns is not None:
+            df = select_columns(df, header, filters, output_columns)
+        finish(filters, args)
+
+        return df
+
+    if reader.is_stream(filepath):
+        if any(getattr(args, _, None)
+               for _ in ["parallel", "project", "zone_maps"]):
+            logger.warning("--parallel, --project and --zone-maps need a "
+                           "file, not a stream.")
+        if chunksize:
+            return filter_chunks(
+                filters, load(filepath, chunksize), args, output_columns)
+        df = load(filepath, compact=getattr(args, "compact", False))
+        header = list(df.columns)
+        df = filters.apply(df)
+        if output_columns is not None:
+            df = select_columns(df, header, filters, output_columns)
+        finish(filters, args)
+
+        return df
+
+    if (getattr(args, "parallel", None) or 1) > 1:
+        try:
+            from . import shard
+        except (SystemError, ImportError):
+            import shard
+
+        with metrics.stage("parallel"):
+            df = shard.filter_parallel(
+                filepath, filters, args.parallel,
+                getattr(args, "shard_size", None) or shard.SHARD_SIZE)
+        if output_columns is not None:
+            df = select_columns(
+                df, read_header(filepath), filters, output_columns)
+        finish(filters, args)
+
+        return df
+
+    cache = getattr(args, "cache", False)
+    if getattr(args, "project", False) or (output_columns and not cache):
+        # All the filtering is done here, only the output is chunked
+        df = project(filepath, filters, output_columns, chunksize)
+        finish(filters, args)
+
+        return df
+
+    if getattr(args, "zone_maps", False):
+        if getattr(args, "mask_cache", None):
+            logger.warning("--mask-cache is not used with --zone-maps.")
+        if chunksize:
+            return filter_chunks(
+                filters, read_zones(filepath, filters, chunksize), args)
+        df = filters.apply(read_zones(filepath, filters))
+        if getattr(args, "compact", False):
+            df = compacted(df)
+        finish(filters, args)
 
         return df
 
+    if chunksize:
+        if getattr(args, "mask_cache", None):
+            logger.warning("--mask-cache is not used with --chunksize.")
+        return filter_chunks(filters, load(
+            filepath, chunksize, retyped=not summarizing(args)), args)
+
+    if getattr(args, "mask_cache", None):
+        df = filter_cached(filepath, filters, args)
+    else:
+        df = load(filepath, cache=cache,
+                  columns=cached_columns(filepath, filters, args),
+                  compact=getattr(args, "compact", False))
+        header = list(df.columns)
+        df = filters.apply(df)
+        if output_columns is not None:
+            df = select_columns(df, header, filters, output_columns)
+    finish(filters, args)
+
+    return df
+
+
+def cached_columns(filepath, filters, args):
+    """Return the columns to read from the cache of filepath, as args ask.
+
+    Those the filters need, and the args.output_columns or none with
+    args.raw. None (all of them) if there's no cache or the output needs
+    them all.
+
+    """
+    output_columns = getattr(args, "output_columns", None)
+    if not getattr(args, "cache", False) or \
+            (output_columns is None and not getattr(args, "raw", False)):
+        return None
+
+    header = read_header(filepath)
+    needed = set(filters.columns(header)) | set(output_columns or [])
+
+    return [_ for _ in header if _ in needed]
+
+
+def filter_cached(filepath, filters, args):
+    """Return filepath filtered, keeping the masks of the conditions.
+
+    Only the conditions whose masks aren't in the persistent cache of
+    args.mask_cache (see masks) are evaluated. With args.raw and all of them
+    cached the TSV isn't even loaded: only the positions of the rows that
+    pass are returned, as write_raw needs.
+
+    """
+    try:
+        from . import masks
+    except (SystemError, ImportError):
+        import masks
+
+    cache = masks.MaskCache(
+        masks.MASKS if args.mask_cache is True else args.mask_cache,
+        (getattr(args, "mask_cache_size", None) or masks.BUDGET) * 2 ** 20)
+    header = read_header(filepath)
+    with metrics.stage("masks"):
+        source = cache.source(
+            filepath, numeric_in(header))
+        steps = filters.plan(header)[1]
+        shared = cache.masks(source, [_[3] for _ in steps])
+
+    if getattr(args, "raw", False) and steps and \
+            all(_ is not None for _ in shared.values()):
+        with metrics.stage("filter"):
+            mask = np.logical_and.reduce(list(shared.values()))
+        filters.order = [_[3] for _ in steps]
+        filters.rows[0] += len(mask)
+        filters.rows[1] += mask.sum()
+
+        return pd.DataFrame(index=np.flatnonzero(mask))
+
+    df = load(filepath, cache=getattr(args, "cache", False),
+              columns=cached_columns(filepath, filters, args),
+              compact=getattr(args, "compact", False))
+    header = list(df.columns)
+    df = filters.apply(df, shared)
+    if getattr(args, "output_columns", None) is not None:
+        df = select_columns(df, header, filters, args.output_columns)
+    with metrics.stage("masks"):
+        cache.save(source, shared)
+
+    return df
+
+
+def filter_incremental(filepath, filters, args):
+    """Keep the args.incremental output up to date with filepath filtered.
+
+    Only the lines appended to filepath since the last run are filtered, if
+    possible (see incremental). Return None, the output is written already.
+
+    """
+    try:
+        from . import incremental
+    except (SystemError, ImportError):
+        import incremental
+
+    ignored = [_ for _ in ["chunksize", "region", "regions_bed", "project",
+                           "parallel", "mask_cache", "zone_maps"]
+               if getattr(args, _, None)]
+    if ignored:
+        logger.warning("--incremental doesn't use {}.".format(", ".join(
+            "--" + _.replace("_", "-") for _ in ignored)))
+
+    incremental.update(filepath, filters, args.incremental,
+                       getattr(args, "raw", False),
+                       getattr(args, "output_columns", None))
+    finish(filters, args)
+    metrics.finish(args)
+
+
+def filter_sets(filepath, filters, args):
+    """Return the filepath filtered by each Filter in filters, by name.
+
+    The file is loaded only once for all of them (see apply_sets). If
+    args.chunksize is set, return an iterator of such dicts instead, one per
+    chunk.
+
+    """
+    if getattr(args, "parallel", None) or getattr(args, "project", False):
+        logger.warning(
+            "--parallel and --project are not used with many --json-filter.")
+
+    if getattr(args, "region", None) or getattr(args, "regions_bed", None):
+        df = read_regions(filepath, args)
+    elif getattr(args, "chunksize", None):
+        return filter_set_chunks(
+            filters, load(filepath, args.chunksize,
+                          retyped=not summarizing(args)), args)
+    else:
+        df = load(filepath, cache=getattr(args, "cache", False),
+                  compact=getattr(args, "compact", False))
+
+    results = apply_sets(filters, df, getattr(args, "output_columns", None))
+    finish_sets(filters, args)
+
+    return results
+
+
+def apply_sets(filters, df, output_columns=None):
+    """Return the DF filtered by each Filter in filters, by name.
+
+    A condition in more than one of them is evaluated only once, on all the
+    rows, and its mask is reused by the others.
+
+    """
+    header = list(df.columns)
+    counts = Counter(
+        step[3] for _ in filters.values() for step in _.plan(header)[1])
+    shared = dict.fromkeys(
+        condition for condition, count in counts.items() if count > 1)
+
+    results = OrderedDict()
+    for name, filter_set in filters.items():
+        # A shallow copy, the filters rename its columns
+        result = filter_set.apply(df.copy(deep=False), shared)
+        if output_columns is not None:
+            result = select_columns(
+                result, header, filter_set, output_columns)
+        results[name] = result
+
+    return results
+
+
+def filter_set_chunks(filters, chunks, args):
+    """Yield the chunks filtered by each Filter, finishing after the last."""
+    output_columns = getattr(args, "output_columns", None)
+    for chunk in chunks:
+        yield apply_sets(filters, chunk, output_columns)
+
+    finish_sets(filters, args)
+
+
+def finish_sets(filters, args):
+    """Save the stats and report each Filter, by name, as args ask."""
+    import sys
+
+    for name, filter_set in filters.items():
+        if getattr(args, "filter_stats", None):
+            filter_set.save_stats(args.filter_stats)
+        if getattr(args, "explain", None):
+            print("{}:\n{}".format(name, filter_set.report()),
+                  file=sys.stderr)
+
+
+def main(args):  # json_filter, filepath, column_contains=None):
+    """Return a filtered DF per json_filter.
+
+    If args.chunksize is set, return an iterator of filtered DFs instead.
+    With many JSON filter files, return a dict of their results by name
+    (see filter_sets).
+
+    """
+    if getattr(args, "version", None):
+        try:
+            from . import _version
+        except (SystemError, ImportError):
+            import _version
+        print(_version.__version__)
+        return None
+
+    if getattr(args, "profile", False) or getattr(args, "metrics_json", None):
+        metrics.start()
+
+    if summarizing(args) and not getattr(args, "chunksize", None) and \
+            not getattr(args, "cache", False):
+        # The rows that pass are only counted, they don't need to be kept
+        try:
+            from . import summary
+        except (SystemError, ImportError):
+            import summary
+        args.chunksize = summary.CHUNKSIZE
+
+    with metrics.stage("setup"):
+        many = len(json_filters(args)) > 1
+        if many:
+            filters = OrderedDict(
+                (name, conditions(args, path))
+                for name, path in json_filters(args))
+        else:
+            filters = conditions(args)
+
+        if getattr(args, "numeric_cols", None):
+            # Load the extra columns defined as numeric
+            add_numeric(args.numeric_cols)
+
+        if args.filepath:
+            if many:
+                filters = compile_filters(filters, args)
+            else:
+                filters = compile_filter(filters, args)
+
+    if args.filepath:
+        if many:
+            return filter_sets(args.filepath, filters, args)
+        if getattr(args, "incremental", None):
+            return filter_incremental(args.filepath, filters, args)
+        return filter_file(args.filepath, filters, args)
+
+
+def filter_chunks(filters, chunks, args, output_columns=None):
+    """Yield the chunks filtered, finishing the filters after the last.
+
+    With output_columns, only those columns of each chunk are yielded.
+
+    """
+    for chunk in chunks:
+        header = list(chunk.columns)
+        chunk = filters.apply(chunk)
+        if output_columns is not None:
+            chunk = select_columns(chunk, header, filters, output_columns)
+        yield chunk
+
+    finish(filters, args)
+
+
+def finish(filters, args):
+    """Save the stats and report the filters as requested in args."""
+    if metrics.CURRENT is not None:
+        metrics.CURRENT.filters = filters
+
+    if getattr(args, "filter_stats", None):
+        filters.save_stats(args.filter_stats)
+
+    if getattr(args, "explain", None):
+        import sys
+
+        print(filters.report(), file=sys.stderr)
+
+
+def write_raw(result, filepath, out):
+    """Write the lines of filepath for the rows in result to out.
+
+    result is a filtered DF or an iterator of them, whose index is still
+    the position of each row in the file. The header and the lines are
+    written as bytes exactly as they are in filepath, so the TSV must have
+    one row per line.
+
+    """
+    if isinstance(result, pd.DataFrame):
+        result = [result]
+
+    with RawLines(filepath) as lines:
+        out.write(lines.header)
+        for df in result:
+            lines.write(df, out)
+
+
+class RawLines(object):
+    """The lines of a TSV file, to write them by the position of their row."""
+
+    def __init__(self, filepath):
+        self.raw = reader.open_binary(filepath)
+        self.header = self.raw.readline()
+        # The next line to read from raw is the row in this position
+        self.position = 0
+
+    def write(self, df, out):
+        """Write the lines of the rows in df, after the last ones written."""
+        for row in df.index:
+            # Skip the lines of the rows filtered out, and the blank ones
+            #  that are no row for the parser
+            while self.position <= row:
+                line = self.raw.readline()
+                if not line:
+                    return
+                if not reader.blank(line):
+                    self.position += 1
+            out.write(line)
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def output(result, args):
+    """Write the result of main to the standard output, as args ask."""
+    import sys
+
+    with metrics.stage("output"):
+        if summarizing(args):
+            try:
+                from . import summary
+            except (SystemError, ImportError):
+                import summary
+            write(summary.summarize(
+                result, getattr(args, "group_by", None),
+                getattr(args, "aggregate", None)), sys.stdout)
+            sys.stdout.flush()
+        elif len(json_filters(args)) > 1:
+            write_sets(result, args)
+        elif getattr(args, "raw", False):
+            write_raw(result, args.filepath, sys.stdout.buffer)
+        else:
+            write(result, sys.stdout)
+            sys.stdout.flush()
+
+    metrics.finish(args)
+
+
+def summarizing(args):
+    """Return if args ask for a summary of the rows (see summary)."""
+    return any(getattr(args, _, None)
+               for _ in ["summary", "group_by", "aggregate"])
+
+
+def output_path(template, filepath, **fields):
+    """Return the output path of the TSV filepath as template says.
+
+    The template can use the {path}, {dir}, {name} (file name) and {stem}
+    (file name without extensions) of the TSV, and the other fields given
+    (e.g. the {filter} set name).
+
+    """
+    name = basename(filepath)
+    stem = name[:-3] if name.endswith(".gz") else name
+
+    return template.format(path=filepath, dir=os.path.dirname(filepath) or ".",
+                           name=name, stem=splitext(stem)[0], **fields)
+
+
+def write_sets(results, args):
+    """Write the results of each filter set to its own file, as args ask.
+
+    results is a dict of filtered DFs by name, or an iterator of them (one
+    per chunk), as filter_sets returns.
+
+    """
+    if isinstance(results, dict):
+        results = [results]
+    raw = getattr(args, "raw", False)
+
+    outs = OrderedDict()
+    try:
+        for chunk in results:
+            for name, df in chunk.items():
+                if name not in outs:
+                    path = output_path(args.output, args.filepath, filter=name)
+                    if raw:
+                        outs[name] = (open(path, "wb"),
+                                      RawLines(args.filepath))
+                        outs[name][0].write(outs[name][1].header)
+                    else:
+                        outs[name] = (open(path, "w"), None)
+                        df.to_csv(outs[name][0], sep="\t", index=False)
+                        continue
+                out, lines = outs[name]
+                if raw:
+                    lines.write(df, out)
+                else:
+                    df.to_csv(out, sep="\t", index=False, header=False)
+    finally:
+        for out, lines in outs.values():
+            if lines is None:
+                # The trailing newline of write
+                out.write("\n")
+            else:
+                lines.close()
+            out.close()
+
+
+def write(result, out):
+    """Write a filtered DF, or an iterator of filtered DFs, to out as TSV."""
+    if isinstance(result, pd.DataFrame):
+        result = [result]
+
+    header = True
+    for df in result:
+        df.to_csv(out, sep="\t", index=False, header=header)
+        header = False
+
+    # Keep the trailing newline the plain print(df.to_csv()) always had.
+    out.write("\n")
+
 
 if __name__ == "__main__":
     import sys
     p_args = argparser(sys.argv[1:])
     d_f = main(p_args)
 
-    if d_f:
-        print(d_f.to_csv(sep="\t", index=False))
+    if d_f is not None:
+        output(d_f, p_args)
@@ -0,0 +1,358 @@
+"""Incremental filtering of TSVs that only grow by appending rows.
+
+The output of a full run is kept with a checkpoint (as output.dffck) of
+the bytes of the TSV filtered: their length and the hashes of the header,
+of all of them and of the filter. The next runs parse and filter only the
+lines appended since, and append the rows that pass to the output. If the
+header, the lines filtered before, the filter or the output itself
+changed, it all is filtered again.
+
+The numeric columns of the new rows are typecasted as in the whole file,
+so the output is the same a full run gives. When the new rows turn a
+column of integers into floats (e.g. a first decimal), the lines before
+would print differently, and it all is filtered again too.
+
+A last line without its newline yet is a row too, as in a full run, but it
+may still grow: the checkpoint is kept before it, and its row is taken back
+from the output and filtered again with the lines appended to it.
+
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+
+import pandas as pd
+
+try:
+    from . import ff
+    from . import metrics
+    from . import reader
+except (SystemError, ImportError):
+    import ff
+    import metrics
+    import reader
+
+
+logger = logging.getLogger("ff")
+
+SUFFIX = ".dffck"
+
+
+def checkpoint_path(output):
+    """Return the path of the checkpoint of the output."""
+    return output + SUFFIX
+
+
+def load_checkpoint(output):
+    """Return the checkpoint of the output, None if there's none."""
+    try:
+        with open(checkpoint_path(output)) as js:
+            return json.load(js)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def save_checkpoint(output, checkpoint):
+    """Save the checkpoint of the output, with the size of the output."""
+    checkpoint["output"] = os.path.getsize(output)
+    with open(checkpoint_path(output) + ".tmp", "w") as js:
+        json.dump(checkpoint, js)
+    os.replace(checkpoint_path(output) + ".tmp", checkpoint_path(output))
+
+
+def filter_digest(filters, numeric_columns, raw, output_columns):
+    """Return the hash of all that makes the output of the filters."""
+    return hashlib.sha1(json.dumps(
+        [filters.conditions, sorted(numeric_columns), bool(raw),
+         output_columns]).encode("utf-8")).hexdigest()
+
+
+def numeric_columns(header, file_encoding):
+    """Return the known numeric columns in the header line."""
+    columns = header.decode(file_encoding).rstrip("\r\n").split("\t")
+
+    return ff.numeric_in(columns)
+
+
+def complete_lines(data):
+    """Return the bytes of data up to its last newline."""
+    return data[:data.rfind(b"\n") + 1]
+
+
+def read_new(filepath, checkpoint):
+    """Return the header and the bytes after the checkpoint.
+
+    The hash of the lines before is returned too, to update it with the new
+    ones. Return None if the header or the lines before changed.
+
+    """
+    with reader.open_binary(filepath) as stream:
+        header = stream.readline()
+        if hashlib.sha1(header).hexdigest() != checkpoint["header"]:
+            logger.info("The header of {} changed.".format(filepath))
+            return None
+
+        prefix = hashlib.sha1(header)
+        left = checkpoint["offset"] - len(header)
+        while left > 0:
+            data = stream.read(min(left, 1 << 20))
+            if not data:
+                break
+            prefix.update(data)
+            left -= len(data)
+        if left or prefix.hexdigest() != checkpoint["prefix"]:
+            logger.info("The lines of {} filtered before changed.".format(
+                filepath))
+            return None
+
+        return header, stream.read(), prefix
+
+
+def scan(filepath):
+    """Return what the checkpoint of all the complete lines of filepath has.
+
+    That is their header, their length, the hash of them all and their
+    encoding, and also the bytes after the last newline. The file is read
+    by parts, never kept whole.
+
+    """
+    file_encoding = "utf-8"
+    with reader.open_binary(filepath) as stream:
+        header = stream.readline()
+        prefix = hashlib.sha1(header)
+        offset = len(header)
+        tail = b""
+        while True:
+            data = stream.read(1 << 20)
+            if not data:
+                break
+            data = tail + data
+            lines = complete_lines(data)
+            tail = data[len(lines):]
+            prefix.update(lines)
+            offset += len(lines)
+            if file_encoding == "utf-8":
+                # A newline always ends a character
+                try:
+                    lines.decode("utf-8")
+                except UnicodeDecodeError:
+                    file_encoding = "iso-8859-1"
+    try:
+        header.decode(file_encoding)
+    except UnicodeDecodeError:
+        file_encoding = "iso-8859-1"
+
+    return header, offset, prefix, file_encoding, tail
+
+
+def typecast(df, header, file_encoding, traits, unterminated=False):
+    """Return the parsed DF typecasted as load does, and its traits.
+
+    traits are those of the numeric columns of the lines before (see
+    numerize), updated with the ones of these lines. With unterminated, the
+    last row is of a line without its newline yet, that may still grow:
+    its traits are only in the ones returned, those of all the rows.
+
+    """
+    columns = numeric_columns(header, file_encoding)
+    with metrics.stage("numerize"):
+        if not unterminated:
+            df = ff.numerize(df, columns, traits)
+            return ff.categorize(ff.retype(df, traits)), traits
+
+        last_traits = {}
+        df = pd.concat([ff.numerize(df.iloc[:-1], columns, traits),
+                        ff.numerize(df.iloc[-1:], columns, last_traits)])
+        all_traits = dict(traits)
+        ff.merge_traits(all_traits, last_traits)
+
+        return ff.categorize(ff.retype(df, all_traits)), all_traits
+
+
+def parse_lines(header, data, file_encoding, traits, unterminated=False):
+    """Return the lines in data parsed and typecasted as typecast does."""
+    with metrics.stage("read"):
+        df = pd.read_table(io.BytesIO(header + data), dtype=object,
+                           encoding=file_encoding)
+
+    return typecast(df, header, file_encoding, traits, unterminated)
+
+
+def select(df, filters, output_columns):
+    """Return the DF filtered, and only its output_columns if given."""
+    header = list(df.columns)
+    df = filters.apply(df)
+    if output_columns is not None:
+        df = ff.select_columns(df, header, filters, output_columns)
+
+    return df
+
+
+def write_lines(out, data, df):
+    """Write the lines in data of the rows of the DF, by their position."""
+    # The parser skips the blank lines, they are no row
+    lines = [_ for _ in io.BytesIO(data).readlines() if not reader.blank(_)]
+    out.writelines(lines[_] for _ in df.index)
+
+
+def append(output, size, df, raw, data=None):
+    """Append the rows of the DF to output, cut back to size first.
+
+    With raw, the lines of the rows are the ones in data (see write_lines).
+    Return the size of the output after.
+
+    """
+    with open(output, "r+b") as out:
+        # The trailing newline of write goes after the new rows
+        out.truncate(size if raw else size - 1)
+    if raw:
+        with open(output, "ab") as out:
+            write_lines(out, data, df)
+    else:
+        with open(output, "a") as out:
+            df.to_csv(out, sep="\t", index=False, header=False)
+            out.write("\n")
+
+    return os.path.getsize(output)
+
+
+def save(output, checkpoint, last, raw, tail, traits):
+    """Append the row of the unterminated tail, if given, and checkpoint.
+
+    The checkpoint is kept before the tail: it's parsed again with the
+    lines appended to it, and its row in the output (last, if it passes) is
+    cut back (see filter_new). traits are the ones the rows are printed
+    with, those of the tail too.
+
+    """
+    if reader.blank(tail):
+        checkpoint["last"] = None
+    else:
+        size = os.path.getsize(output)
+        with metrics.stage("output"):
+            append(output, size, last.reset_index(drop=True), raw, tail)
+        checkpoint["last"] = {"output": size,
+                              "floats": sorted(ff.float_columns(traits))}
+
+    save_checkpoint(output, checkpoint)
+
+
+def filter_all(filepath, filters, output, raw=False, output_columns=None):
+    """Write to output the rows of filepath that pass the filters.
+
+    Return the number of rows written.
+
+    """
+    with metrics.stage("read"):
+        header, offset, prefix, file_encoding, tail = scan(filepath)
+        df = reader.read_table(filepath, file_encoding, dtype=object)
+    # A last line without its newline is a row, as in a full run
+    unterminated = not reader.blank(tail)
+    end = len(df) - 1 if unterminated else len(df)
+
+    traits = {}
+    df, all_traits = typecast(df, header, file_encoding, traits, unterminated)
+    df = select(df, filters, output_columns)
+
+    with metrics.stage("output"):
+        if raw:
+            with open(output, "wb") as out:
+                ff.write_raw(df[df.index < end], filepath, out)
+        else:
+            with open(output, "w") as out:
+                ff.write(df[df.index < end], out)
+
+    save(output, {
+        "offset": offset,
+        "header": hashlib.sha1(header).hexdigest(),
+        "prefix": prefix.hexdigest(),
+        "encoding": file_encoding,
+        "filter": filter_digest(
+            filters, numeric_columns(header, file_encoding), raw,
+            output_columns),
+        "traits": traits}, df[df.index >= end], raw, tail, all_traits)
+
+    return len(df)
+
+
+def filter_new(filepath, filters, output, raw=False, output_columns=None):
+    """Append to output the rows appended to filepath that pass filters.
+
+    Return the number of rows appended, None if the output can't be
+    appended to and all of filepath must be filtered again.
+
+    """
+    checkpoint = load_checkpoint(output)
+    if checkpoint is None or not os.path.exists(output):
+        return None
+    if os.path.getsize(output) != checkpoint["output"]:
+        logger.info("The output {} changed.".format(output))
+        return None
+
+    with metrics.stage("read"):
+        new = read_new(filepath, checkpoint)
+    if new is None:
+        return None
+    header, data, prefix = new
+    file_encoding = checkpoint["encoding"]
+    if checkpoint["filter"] != filter_digest(
+            filters, numeric_columns(header, file_encoding), raw,
+            output_columns):
+        logger.info("The filter of {} changed.".format(output))
+        return None
+    # The row of an unterminated last line is written again, as it is now
+    last = checkpoint.get("last")
+    if last is None and reader.blank(data):
+        return 0
+    try:
+        data.decode(file_encoding)
+    except UnicodeDecodeError:
+        logger.info("The new lines of {} aren't {}.".format(
+            filepath, file_encoding))
+        return None
+
+    lines = complete_lines(data)
+    tail = data[len(lines):]
+    unterminated = not reader.blank(tail)
+    traits = dict((column, tuple(column_traits)) for column, column_traits
+                  in checkpoint["traits"].items())
+    df, all_traits = parse_lines(header, data, file_encoding, traits,
+                                 unterminated)
+    printed = set(last["floats"]) if last is not None else \
+        ff.float_columns(checkpoint["traits"])
+    if ff.float_columns(all_traits) != printed:
+        logger.info("The new lines of {} change the numeric columns.".format(
+            filepath))
+        return None
+    end = len(df) - 1 if unterminated else len(df)
+    df = select(df, filters, output_columns)
+
+    with metrics.stage("output"):
+        append(output, checkpoint["output"] if last is None
+               else last["output"], df[df.index < end], raw, lines)
+
+    prefix.update(lines)
+    checkpoint.update(offset=checkpoint["offset"] + len(lines),
+                      prefix=prefix.hexdigest(), traits=traits)
+    save(output, checkpoint, df[df.index >= end], raw, tail, all_traits)
+
+    return len(df)
+
+
+def update(filepath, filters, output, raw=False, output_columns=None):
+    """Keep output up to date with the rows of filepath that pass filters.
+
+    Only the lines appended since the last update are filtered, if possible
+    (see filter_new). Return the number of rows written.
+
+    """
+    written = filter_new(filepath, filters, output, raw, output_columns)
+    if written is None:
+        logger.info("Filtering all of {}.".format(filepath))
+        return filter_all(filepath, filters, output, raw, output_columns)
+
+    logger.info("Appended {} rows to {}.".format(written, output))
+
+    return written
@@ -0,0 +1,183 @@
+"""Persistent cache of the masks of the conditions evaluated on TSV files.
+
+Each mask is kept as a compressed bitmap (a bit per row) in a file named
+after the content of the TSV, the numeric columns it was typecasted with
+and the condition. Re-filtering a file evaluates only the conditions that
+are new or changed, the others are read and ANDed. The least recently used
+masks are dropped when the cache grows over its budget.
+
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import zlib
+
+import numpy as np
+
+
+logger = logging.getLogger("ff")
+
+# Default directory and budget (in Mb) of the cache
+MASKS = os.path.join(os.path.expanduser("~"), ".cache", "dff", "masks")
+BUDGET = 256
+SUFFIX = ".mask"
+# The content hashes of the files, by path, size and mtime
+HASHES = "hashes.json"
+QUOTED = re.compile(r"""("[^"]*"|'[^']*')""")
+# Operators whose terms are kept as they are, spaces included
+VERBATIM = ["contains", "not_contains", "in", "not_in"]
+
+
+def normalize(condition):
+    """Return the condition with its spaces normalized.
+
+    The terms of the string operators and the quoted strings of the queries
+    are kept as they are.
+
+    """
+    column, operator, terms = condition.split(" ", 2)
+    if operator not in VERBATIM:
+        terms = "".join(
+            _ if QUOTED.match(_) else re.sub(r"\s+", " ", _)
+            for _ in QUOTED.split(terms)).strip()
+
+    return " ".join([column, operator, terms])
+
+
+def content_hash(filepath):
+    """Return the SHA-1 of the bytes of filepath."""
+    sha = hashlib.sha1()
+    with open(filepath, "rb") as raw:
+        for data in iter(lambda: raw.read(1 << 20), b""):
+            sha.update(data)
+
+    return sha.hexdigest()
+
+
+def pack(mask):
+    """Return the boolean mask as compressed bytes."""
+    return struct.pack("<Q", len(mask)) + zlib.compress(
+        np.packbits(mask).tobytes())
+
+
+def unpack(data):
+    """Return the boolean mask of the bytes packed by pack."""
+    rows = struct.unpack("<Q", data[:8])[0]
+    bits = np.frombuffer(zlib.decompress(data[8:]), dtype=np.uint8)
+
+    return np.unpackbits(bits)[:rows].astype(bool)
+
+
+class MaskCache(object):
+    """The masks of the conditions kept in directory, within a budget.
+
+    budget is in bytes, the sum of the size of the files of the masks.
+
+    """
+
+    def __init__(self, directory=MASKS, budget=BUDGET * 2 ** 20):
+        self.directory = directory
+        self.budget = budget
+        # The conditions read from the cache, not to write them again
+        self.read = set()
+
+    def source(self, filepath, numeric_columns):
+        """Return the key of the masks of filepath.
+
+        It's the content hash of filepath, computed only once per size and
+        mtime of the file, and its numeric columns.
+
+        """
+        stat = os.stat(filepath)
+        path = os.path.abspath(filepath)
+        hashes_path = os.path.join(self.directory, HASHES)
+        try:
+            with open(hashes_path) as js:
+                hashes = json.load(js)
+        except (IOError, OSError, ValueError):
+            hashes = {}
+
+        size, mtime, sha = hashes.get(path, (None, None, None))
+        if (size, mtime) != (stat.st_size, stat.st_mtime):
+            sha = content_hash(filepath)
+            hashes[path] = (stat.st_size, stat.st_mtime, sha)
+            self.dump(hashes_path, json.dumps(hashes).encode("utf-8"))
+
+        return sha + "\n" + "\n".join(sorted(numeric_columns))
+
+    def path(self, source, condition):
+        """Return the path of the mask of condition on the source."""
+        name = hashlib.sha1(
+            (source + "\n" + normalize(condition)).encode("utf-8"))
+
+        return os.path.join(self.directory, name.hexdigest() + SUFFIX)
+
+    def get(self, source, condition):
+        """Return the mask of condition on the source, None if not kept."""
+        path = self.path(source, condition)
+        try:
+            with open(path, "rb") as bitmap:
+                mask = unpack(bitmap.read())
+            # Recently used
+            os.utime(path, None)
+        except (IOError, OSError, ValueError, struct.error, zlib.error):
+            return None
+        self.read.add(condition)
+
+        return mask
+
+    def masks(self, source, conditions):
+        """Return {condition: mask} of the conditions, None if not kept.
+
+        That's the shared masks Filter.apply takes.
+
+        """
+        masks = dict((_, self.get(source, _)) for _ in conditions)
+        if len(set(len(_) for _ in masks.values() if _ is not None)) > 1:
+            # Not from the same rows, forget them all
+            return dict.fromkeys(conditions)
+
+        return masks
+
+    def save(self, source, masks):
+        """Keep the masks evaluated (not read) and drop the oldest ones."""
+        for condition, mask in masks.items():
+            if mask is not None and condition not in self.read:
+                self.dump(self.path(source, condition), pack(mask))
+        self.evict()
+
+    def dump(self, path, data):
+        """Write data to path atomically, warning if it can't."""
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(path + ".tmp", "wb") as out:
+                out.write(data)
+            os.replace(path + ".tmp", path)
+        except (IOError, OSError) as err:
+            logger.warning("Can't write the mask cache {} ({}).".format(
+                self.directory, err))
+
+    def evict(self):
+        """Remove the least recently used masks over the budget."""
+        try:
+            entries = [os.path.join(self.directory, _)
+                       for _ in os.listdir(self.directory)
+                       if _.endswith(SUFFIX)]
+            stats = sorted((os.stat(_).st_mtime, os.stat(_).st_size, _)
+                           for _ in entries)
+        except (IOError, OSError):
+            return
+
+        size = sum(_[1] for _ in stats)
+        for mtime, entry_size, entry in stats:
+            if size <= self.budget:
+                break
+            try:
+                os.remove(entry)
+                size -= entry_size
+            except (IOError, OSError):
+                pass
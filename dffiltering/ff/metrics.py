@@ -0,0 +1,239 @@
+"""Wall time, CPU time and peak memory of the stages of a dff run.
+
+The stages are timed only while a run is being measured (see start), so
+the rest of the time marking them costs next to nothing. A stage started
+within another (e.g. reading a chunk while writing the output) pauses it:
+each second is charged to one stage only.
+
+The peak memory of a stage is the peak resident memory while it runs, where
+the peak can be reset (Linux); elsewhere it's the peak of the process up to
+the stage, and the metrics say so ("peak": "cumulative").
+
+"""
+import json
+import sys
+import time
+from timeit import default_timer as timer
+
+
+# The Metrics of the run being measured, None if none
+CURRENT = None
+# Linux resets the peak memory (VmHWM) of the process writing 5 here
+CLEAR_REFS = "/proc/self/clear_refs"
+STATUS = "/proc/self/status"
+
+
+def peak_memory():
+    """Return the peak resident memory of this process in Mb, if known."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kb in Linux, bytes in macOS
+    return peak / (1024.0 * 1024 if sys.platform == "darwin" else 1024.0)
+
+
+def highest(*values):
+    """Return the highest of the values that aren't None, None if none."""
+    values = [_ for _ in values if _ is not None]
+
+    return max(values) if values else None
+
+
+class Memory(object):
+    """Peak resident memory of the process between readings.
+
+    If the peak can't be reset, each reading is the peak of the process so
+    far (cumulative).
+
+    """
+
+    def __init__(self):
+        self.cumulative = not self.reset()
+
+    @staticmethod
+    def reset():
+        """Reset the peak to the memory in use now, return if it could."""
+        try:
+            with open(CLEAR_REFS, "w") as refs:
+                refs.write("5")
+        except (IOError, OSError):
+            return False
+
+        return True
+
+    def peak(self):
+        """Return the peak in Mb since the last reading, if known."""
+        if self.cumulative:
+            return peak_memory()
+
+        with open(STATUS) as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    # In kB
+                    peak = int(line.split()[1]) / 1024.0
+                    break
+            else:
+                peak = None
+        self.reset()
+
+        return peak
+
+
+class Metrics(object):
+    """Totals of the stages of a run, in the order they first started."""
+
+    def __init__(self):
+        self.stages = {}
+        self.stack = []
+        self.filters = None
+        self.memory = Memory()
+        self.peak = None
+        self.started = (timer(), time.process_time())
+
+    def start(self, name):
+        """Start the stage name, pausing the running one."""
+        now = (timer(), time.process_time())
+        peak = self.read_peak()
+        if self.stack:
+            self.charge(self.stack[-1][0], self.stack[-1][1], now, peak)
+        self.stack.append([name, now])
+        self.stages.setdefault(
+            name, {"wall": 0.0, "cpu": 0.0, "calls": 0, "peak_mb": None})
+        self.stages[name]["calls"] += 1
+
+    def stop(self):
+        """Stop the running stage, resuming the one it paused."""
+        now = (timer(), time.process_time())
+        name, since = self.stack.pop()
+        self.charge(name, since, now, self.read_peak())
+        if self.stack:
+            self.stack[-1][1] = now
+
+    def read_peak(self):
+        """Return the peak memory since the last reading, kept for total."""
+        peak = self.memory.peak()
+        self.peak = highest(self.peak, peak)
+
+        return peak
+
+    def charge(self, name, since, now, peak):
+        """Add the time from since to now, and its peak, to the stage name."""
+        self.stages[name]["wall"] += now[0] - since[0]
+        self.stages[name]["cpu"] += now[1] - since[1]
+        self.stages[name]["peak_mb"] = highest(
+            self.stages[name]["peak_mb"], peak)
+
+    def as_dict(self):
+        """Return the metrics as a dict ready for JSON."""
+        now = (timer(), time.process_time())
+        self.read_peak()
+        metrics = {
+            "total": {"wall": now[0] - self.started[0],
+                      "cpu": now[1] - self.started[1],
+                      "peak_mb": self.peak},
+            "peak": "cumulative" if self.memory.cumulative else "stage",
+            "stages": [dict(stage=name, **values)
+                       for name, values in self.stages.items()]}
+
+        if self.filters is not None:
+            metrics["rows"] = {"in": int(self.filters.rows[0]),
+                               "out": int(self.filters.rows[1])}
+            metrics["conditions"] = []
+            for order, condition in enumerate(self.filters.order, 1):
+                seconds, before, after = self.filters.timings.get(
+                    condition, [0, 0, 0])
+                metrics["conditions"].append({
+                    "condition": condition, "order": order,
+                    "seconds": seconds, "rows_in": int(before),
+                    "rows_out": int(after)})
+
+        return metrics
+
+    def report(self):
+        """Return a report of the stages and conditions for humans."""
+        metrics = self.as_dict()
+        lines = ["{:<12} {:>10} {:>10} {:>6} {:>10}".format(
+            "stage", "wall", "cpu", "calls",
+            "max Mb" if self.memory.cumulative else "peak Mb")]
+        for stage in metrics["stages"] + [dict(
+                stage="total", calls="", **metrics["total"])]:
+            lines.append("{:<12} {:>10.4f} {:>10.4f} {:>6} {:>10}".format(
+                stage["stage"], stage["wall"], stage["cpu"], stage["calls"],
+                "" if stage["peak_mb"] is None else
+                "{:.1f}".format(stage["peak_mb"])))
+        if self.memory.cumulative:
+            lines.append("(max Mb: peak of the process up to the stage)")
+
+        if self.filters is not None:
+            lines.extend(["", self.filters.report()])
+
+        return "\n".join(lines)
+
+
+class Stage(object):
+    """Context of a stage of the run being measured, if any."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if CURRENT is not None:
+            CURRENT.start(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        if CURRENT is not None:
+            CURRENT.stop()
+        return False
+
+
+def stage(name):
+    """Return the context to measure the stage name of the current run."""
+    return Stage(name)
+
+
+def iterate(name, iterable):
+    """Yield the items of iterable, measuring the getting of each in name."""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def start():
+    """Start measuring a run, return its Metrics."""
+    global CURRENT
+
+    CURRENT = Metrics()
+
+    return CURRENT
+
+
+def finish(args):
+    """Stop measuring the run, reporting it as args ask."""
+    global CURRENT
+
+    if CURRENT is None:
+        return
+    current, CURRENT = CURRENT, None
+
+    if getattr(args, "profile", False):
+        print(current.report(), file=sys.stderr)
+
+    if getattr(args, "metrics_json", None):
+        metrics = current.as_dict()
+        metrics["filepath"] = getattr(args, "filepath", None)
+        try:
+            from ._version import __version__
+        except (SystemError, ImportError):
+            from _version import __version__
+        metrics["version"] = __version__
+        # One line per run, to gather many runs in a file
+        with open(args.metrics_json, "a") as js:
+            js.write(json.dumps(metrics) + "\n")
@@ -0,0 +1,209 @@
+"""Command line options of dff.
+
+Parsing them imports nothing heavy, so dff -h and dff -v are instant.
+
+"""
+
+
+def argparser(args):
+    """Return the parsed arguments."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DataFrame Filtering")
+    parser.add_argument("--filepath",
+                        help="Path to the TSV file, - for the standard input")
+    parser.add_argument(
+        "--json-filter", action="append",
+        help="""JSON file with list of filters. Give many to filter the TSV
+        with each of them in a single load, writing each output to its own
+        file (see --output). Each filter set is named after its file, or as
+        given in name=path:
+
+        --json-filter clinical=panels/clinical.json --json-filter qc.json""")
+    parser.add_argument(
+        "--column-contains", action="append",
+        help="""If you find more suitable to provide the filtering conditions
+        as a txt list in a file, include as many columns as you need:
+
+        --column-contains columnName --column-contains anotherCol""")
+
+    parser.add_argument(
+        "--column-in", action="append",
+        help="""Like --column-contains, but keep the rows whose column has
+        exactly one of the values in the file (e.g. a list of genes). Cells
+        with many values separated by ";" or "," match if any of them does:
+
+        --column-in path/to/Gene.refGene""")
+
+    parser.add_argument(
+        "--output", default="output_{filter}.tsv",
+        help="""With many --json-filter, path template of the output of
+        each. It can use {filter} (the name of the filter set), and {path},
+        {dir}, {name} (file name) and {stem} (file name without extensions)
+        of the TSV. Default: output_{filter}.tsv""")
+
+    parser.add_argument(
+        "--numeric-cols",
+        type=lambda s: [_ for _ in s.split(',')],
+        help="""If you have numeric columns added to your .tsv file that are
+        not in the default ones, you'll have to include them in this flag:
+
+        --numeric-cols columnName
+        --numeric-cols columnNameA,columnNameB""")
+
+    parser.add_argument(
+        "--chunksize", type=int,
+        help="""Stream the TSV in chunks of this many rows, writing the
+        filtered rows of each chunk as soon as they are ready. Memory is
+        then bounded by the chunk size instead of the file size.""")
+
+    parser.add_argument(
+        "--optimize", action="store_true",
+        help="""Evaluate the cheapest and most selective conditions first,
+        estimating their cost on a sample of the rows.""")
+
+    parser.add_argument(
+        "--filter-stats",
+        help="""JSON file to reuse the cost of the conditions estimated in
+        previous runs and to save the ones of this run (implies
+        --optimize).""")
+
+    parser.add_argument(
+        "--explain", action="store_true",
+        help="""Report to stderr the order the conditions were evaluated
+        and the time spent in each of them.""")
+
+    parser.add_argument(
+        "--cache", action="store_true",
+        help="""Keep a binary copy of the loaded TSV next to it (as
+        file.tsv.dffcache) and reuse it while the TSV doesn't change, to skip
+        the parsing in the next runs. With --output-columns or --raw, only
+        the columns the filters and the output need are read from it. Not
+        used with --chunksize.""")
+
+    parser.add_argument(
+        "--compact", action="store_true",
+        help="""Keep the loaded TSV in the smallest dtypes that hold its
+        values (int32, float32 and categoricals) and report to stderr the
+        memory of each dtype before and after. Not used with --chunksize,
+        --project, --parallel or --region.""")
+
+    parser.add_argument(
+        "--mask-cache", nargs="?", const=True,
+        help="""Keep the rows that pass each condition in a cache (in this
+        directory, ~/.cache/dff/masks if not given) for the same TSV and
+        condition in the next runs, so only the new or changed conditions
+        are evaluated. With --raw and all of them kept, the TSV isn't even
+        parsed. Not used with --chunksize, --project, --parallel or
+        --region.""")
+
+    parser.add_argument(
+        "--mask-cache-size", type=int,
+        help="Size in Mb of the --mask-cache (default 256)")
+
+    parser.add_argument(
+        "--summary", action="store_true",
+        help="""Write only the count of the rows that pass, by --group-by
+        and with the --aggregate if given, instead of the rows. The TSV is
+        read in chunks (of --chunksize rows, 100000 if not given) and no
+        row is kept, so whole genomes take little memory. With many
+        --json-filter, a first column has the name of each filter set.""")
+
+    parser.add_argument(
+        "--group-by", action="append",
+        help="""Summarize by the values of this column (as many as needed),
+        e.g. --group-by Gene.refGene. Implies --summary.""")
+
+    parser.add_argument(
+        "--aggregate", action="append",
+        help="""Add the min, max and mean of this numeric column (as many as
+        needed) to the --summary. Implies --summary.""")
+
+    parser.add_argument(
+        "--incremental", metavar="OUTPUT",
+        help="""Write the output to this file, and in the next runs filter
+        only the lines appended to the TSV since, appending the rows that
+        pass. If the TSV changed other than by appending lines, or the filters
+        or the output changed, it is all filtered again. A checkpoint is kept
+        next to the output (as OUTPUT.dffck).""")
+
+    parser.add_argument(
+        "--zone-maps", action="store_true",
+        help="""Keep next to the TSV (as file.tsv.dffzone) the min, max and
+        nulls of its numeric columns in each block of rows, and parse only
+        the blocks that could pass the <, <=, >, >= and == of the
+        conditions. The zone maps are built on the first run. Not used
+        with --project, --parallel or --region.""")
+
+    parser.add_argument(
+        "--project", action="store_true",
+        help="""Parse only the columns used by the filters to find the rows
+        that pass, then parse only those rows in full. Memory and time
+        depend then on the filters and not on the width of the TSV. The
+        numeric columns are typecasted on the rows that pass only, so a
+        column with only integers in them prints as such (3 and not
+        3.0).""")
+
+    parser.add_argument(
+        "--output-columns",
+        type=lambda s: [_ for _ in s.split(',')],
+        help="""Output only these columns (implies --project, unless
+        --cache):
+
+        --output-columns Chr,Start,End,Gene.refGene""")
+
+    parser.add_argument(
+        "--raw", action="store_true",
+        help="""Output the lines of the rows that pass exactly as they are in
+        the TSV, instead of writing the filtered table again. Faster and
+        keeps the numbers and column names untouched.""")
+
+    parser.add_argument(
+        "--parallel", type=int,
+        help="""Split the TSV in shards and filter them with this many
+        processes. Gzipped files can be split only if they are BGZF (made
+        by bgzip). --chunksize, --project and --cache are not used.""")
+
+    parser.add_argument(
+        "--shard-size", type=int,
+        help="Size in bytes of each shard with --parallel (default 64 Mb)")
+
+    parser.add_argument(
+        "--region", action="append",
+        help="""Keep only the rows overlapping this region (1-based, ends
+        included), read through an index of the Chr and Start columns kept
+        next to the TSV (as file.tsv.dffidx). The TSV must be sorted by them,
+        and if gzipped, be BGZF (made by bgzip). Give as many as needed:
+
+        --region chr12:133252000-133260000 --region chr17""")
+
+    parser.add_argument(
+        "--regions-bed",
+        help="""Like --region, with the regions in a BED file (e.g. the ones
+        of a panel). The numeric columns are typecasted on the rows read
+        only, as with --project.""")
+
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="""Report to stderr the wall time, CPU time and peak memory of
+        each stage (setup, read, numerize, filter, output) and the time and
+        rows in and out of each condition.""")
+
+    parser.add_argument(
+        "--metrics-json",
+        help="""Append the measures of --profile to this file, as a JSON
+        line per run, to gather them over many runs.""")
+
+    parser.add_argument("--version", "-v", action="store_true")
+
+    args = parser.parse_args(args)
+    if args.raw and args.filepath == "-":
+        parser.error("--raw reads the TSV twice, it can't be the standard "
+                     "input")
+    if args.raw and args.output_columns is not None:
+        parser.error("--raw writes whole lines, it can't use --output-columns")
+    if args.incremental and (args.filepath == "-" or
+                             len(args.json_filter or []) > 1):
+        parser.error("--incremental needs a file and a single --json-filter")
+
+    return args
@@ -0,0 +1,490 @@
+"""Reads the TSV files decompressing and decoding them only once.
+
+Gzipped files are inflated by other threads while the parser works (zlib
+releases the GIL): BGZF files (as bgzip and tabix write them) block by
+block in a pool of threads, other gzip files in a single background one.
+Streams (e.g. the standard input) are read only once, as they come (a copy
+is kept to decode them again as ISO-8859-1, see read_table).
+
+"""
+import codecs
+import io
+import logging
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+from collections import deque
+from itertools import chain
+
+import queue
+
+
+logger = logging.getLogger("ff")
+
+# Size of the chunks of (uncompressed) data read at once
+CHUNK_SIZE = 1 << 20
+# Threads inflating BGZF blocks, None for as many as CPUs
+THREADS = None
+
+# Bytes of a stream kept in memory to decode it again, before a temporary file
+SPOOL_SIZE = 64 << 20
+
+BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+NON_ASCII = re.compile(u"[^\x00-\x7f]")
+
+
+def bgzf_block_size(header):
+    """Return the size of the BGZF block starting with header, or None.
+
+    header are the first bytes of the block, its extra field included.
+
+    """
+    if len(header) < 12 or header[:4] != BGZF_MAGIC:
+        return None
+    xlen = struct.unpack("<H", header[10:12])[0]
+    extra = header[12:12 + xlen]
+    # Look for the BC subfield with the size of the block
+    position = 0
+    while position + 4 <= len(extra):
+        length = struct.unpack("<H", extra[position + 2:position + 4])[0]
+        if extra[position:position + 2] == b"BC" and length == 2:
+            return struct.unpack(
+                "<H", extra[position + 4:position + 6])[0] + 1
+        position += 4 + length
+
+    return None
+
+
+def bgzf_blocks(filepath):
+    """Return the [(compressed offset, uncompressed offset)] of the blocks.
+
+    Return None if filepath is not a BGZF file.
+
+    """
+    blocks = []
+    coffset = uoffset = 0
+    with open(filepath, "rb") as raw:
+        while True:
+            raw.seek(coffset)
+            header = raw.read(18)
+            if not header:
+                break
+            header += raw.read(max(
+                0, 12 + struct.unpack("<H", header[10:12])[0] - 18))
+            bsize = bgzf_block_size(header)
+            if bsize is None:
+                return None
+
+            raw.seek(coffset + bsize - 4)
+            isize = struct.unpack("<I", raw.read(4))[0]
+            blocks.append((coffset, uoffset))
+            coffset += bsize
+            uoffset += isize
+
+    # The last one marks the end of the data
+    blocks.append((coffset, uoffset))
+
+    return blocks
+
+
+def is_bgzf(filepath):
+    """Return True if filepath is a BGZF file."""
+    with open(filepath, "rb") as raw:
+        return bgzf_block_size(raw.read(1024)) is not None
+
+
+def inflate_blocks(data):
+    """Return the uncompressed bytes of a run of whole BGZF blocks."""
+    inflated = []
+    position = 0
+    while position < len(data):
+        bsize = bgzf_block_size(data[position:position + 1024])
+        header = 12 + struct.unpack(
+            "<H", data[position + 10:position + 12])[0]
+        inflated.append(zlib.decompress(
+            data[position + header:position + bsize - 8], -15))
+        position += bsize
+
+    return b"".join(inflated)
+
+
+def bgzf_chunks(filepath, threads=None):
+    """Yield the uncompressed bytes of the BGZF filepath, in chunks.
+
+    Runs of blocks are inflated by a pool of threads, in order.
+
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    threads = threads or THREADS or os.cpu_count() or 1
+    pending = deque()
+    with open(filepath, "rb") as raw, \
+            ThreadPoolExecutor(threads) as executor:
+        buffer = b""
+        while True:
+            data = raw.read(CHUNK_SIZE)
+            buffer += data
+            # Cut the buffer after its last whole block
+            position = 0
+            while True:
+                bsize = bgzf_block_size(buffer[position:position + 1024])
+                if bsize is None or position + bsize > len(buffer):
+                    break
+                position += bsize
+            if position:
+                pending.append(executor.submit(
+                    inflate_blocks, buffer[:position]))
+                buffer = buffer[position:]
+            while pending and (len(pending) > 2 * threads or not data):
+                yield pending.popleft().result()
+            if not data:
+                break
+
+    if buffer:
+        raise IOError("Truncated BGZF file {}".format(filepath))
+
+
+def gzip_chunks(filepath):
+    """Yield the uncompressed bytes of the gzipped filepath, in chunks.
+
+    A background thread inflates the next chunks while these are used.
+
+    """
+    chunks = queue.Queue(maxsize=8)
+    stop = threading.Event()
+
+    def inflate_file():
+        try:
+            with open(filepath, "rb") as raw:
+                for chunk in inflate(iter(
+                        lambda: raw.read(CHUNK_SIZE), b"")):
+                    if stop.is_set():
+                        break
+                    chunks.put(chunk)
+            chunks.put(None)
+        except Exception as err:
+            chunks.put(err)
+
+    thread = threading.Thread(target=inflate_file)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+        # Unblock the thread if it's waiting to put
+        while thread.is_alive():
+            try:
+                chunks.get_nowait()
+            except queue.Empty:
+                thread.join(0.01)
+
+
+def inflate(data):
+    """Yield the bytes of the gzip in the data chunks, inflated.
+
+    The gzip can have many members (e.g. BGZF blocks).
+
+    """
+    # 32 + 15: a gzip header and the largest window
+    inflater = zlib.decompressobj(47)
+    for compressed in data:
+        while compressed:
+            chunk = inflater.decompress(compressed)
+            compressed = b""
+            if inflater.unused_data:
+                # Another member of the gzip starts
+                compressed = inflater.unused_data
+                chunk += inflater.flush()
+                inflater = zlib.decompressobj(47)
+            if chunk:
+                yield chunk
+    yield inflater.flush()
+
+
+def blank(data):
+    """Return if the lines in data are blank, no rows for the parser.
+
+    The parser skips the lines with nothing but spaces, not tabs.
+
+    """
+    return not data.strip(b" \r\n")
+
+
+def is_stream(source):
+    """Return if source is "-" (the standard input) or a file object."""
+    return source == "-" or hasattr(source, "read")
+
+
+def open_stream(stream):
+    """Return the binary file object stream as an uncompressed one.
+
+    A gzipped stream is inflated on the fly. The stream itself (e.g. the
+    standard input) is left open.
+
+    """
+    head = b""
+    for data in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        head += data
+        if len(head) >= 2:
+            break
+    data = chain([head], iter(lambda: stream.read(CHUNK_SIZE), b""))
+    if head[:2] == BGZF_MAGIC[:2]:
+        data = inflate(data)
+
+    return io.BufferedReader(Chunks(data), CHUNK_SIZE)
+
+
+def chunks(filepath):
+    """Yield the uncompressed bytes of filepath, in chunks."""
+    if filepath.endswith(".gz"):
+        if is_bgzf(filepath):
+            return bgzf_chunks(filepath)
+        return gzip_chunks(filepath)
+
+    return plain_chunks(filepath)
+
+
+def plain_chunks(filepath):
+    """Yield the bytes of the uncompressed filepath, in chunks."""
+    with open(filepath, "rb") as raw:
+        for chunk in iter(lambda: raw.read(CHUNK_SIZE), b""):
+            yield chunk
+
+
+class Chunks(io.RawIOBase):
+    """Binary file object reading from an iterator of bytes chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.buffer:
+            self.buffer = next(self.chunks, b"")
+            if not self.buffer:
+                return 0
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+
+        return size
+
+    def close(self):
+        if hasattr(self.chunks, "close"):
+            self.chunks.close()
+        super(Chunks, self).close()
+
+
+def open_binary(filepath):
+    """Return filepath opened as uncompressed binary file object.
+
+    filepath can also be "-" for the standard input or a binary file object
+    (see open_stream).
+
+    """
+    if filepath == "-":
+        return open_stream(sys.stdin.buffer)
+    if hasattr(filepath, "read"):
+        return open_stream(filepath)
+    if filepath.endswith(".gz"):
+        return io.BufferedReader(Chunks(chunks(filepath)), CHUNK_SIZE)
+
+    return open(filepath, "rb")
+
+
+class Text(io.TextIOBase):
+    """Text file object decoding a binary one as UTF-8 or else ISO-8859-1.
+
+    The decoding switches to ISO-8859-1 at the first byte that is not
+    UTF-8. If some non ASCII text was decoded before as UTF-8, it would
+    be different decoded as ISO-8859-1 and lossy is True.
+
+    """
+
+    def __init__(self, binary):
+        self.binary = binary
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.latin = False
+        self.lossy = False
+        self.non_ascii = False
+        self.text = u""
+        # The newlines and the last byte read from binary
+        self.line_ends = 0
+        self.last = b""
+
+    def readable(self):
+        return True
+
+    def file_encoding(self):
+        """Return the encoding of all the text, once it's all read."""
+        return "iso-8859-1" if self.latin else "utf-8"
+
+    def lines(self):
+        """Return the number of lines of the text, once it's all read."""
+        return self.line_ends + (self.last not in [b"", b"\n"])
+
+    def decode(self, data, final=False):
+        """Return the data decoded."""
+        self.line_ends += data.count(b"\n")
+        self.last = data[-1:] or self.last
+        if self.latin:
+            return data.decode("iso-8859-1")
+        try:
+            text = self.decoder.decode(data, final)
+        except UnicodeDecodeError as err:
+            self.latin = True
+            self.lossy = self.non_ascii or \
+                bool(NON_ASCII.search(err.object[:err.start].decode("utf-8")))
+            return err.object[:err.start].decode("utf-8") + \
+                err.object[err.start:].decode("iso-8859-1")
+        if not self.non_ascii and NON_ASCII.search(text):
+            self.non_ascii = True
+        return text
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            text = self.text + self.decode(self.binary.read(), True)
+            self.text = u""
+            return text
+        while len(self.text) < size:
+            data = self.binary.read(CHUNK_SIZE)
+            self.text += self.decode(data, not data)
+            if not data:
+                break
+        text, self.text = self.text[:size], self.text[size:]
+
+        return text
+
+    def readline(self, size=-1):
+        while u"\n" not in self.text:
+            data = self.binary.read(CHUNK_SIZE)
+            self.text += self.decode(data, not data)
+            if not data:
+                break
+        end = self.text.find(u"\n") + 1 or len(self.text)
+        line, self.text = self.text[:end], self.text[end:]
+
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, u"")
+
+    def close(self):
+        self.binary.close()
+        super(Text, self).close()
+
+
+class Tee(object):
+    """Binary file object copying the bytes read from another one to out."""
+
+    def __init__(self, binary, out):
+        self.binary = binary
+        self.out = out
+
+    def read(self, size=-1):
+        data = self.binary.read(size)
+        self.out.write(data)
+
+        return data
+
+    def close(self):
+        self.binary.close()
+
+
+def open_text(filepath):
+    """Return filepath opened as text, decompressed and decoded once."""
+    return Text(open_binary(filepath))
+
+
+def read_table(filepath, encoding=None, **kwargs):
+    """Return pd.read_table(filepath, **kwargs) reading filepath once.
+
+    Only a file in ISO-8859-1 with some text before its first non UTF-8
+    byte that is also valid (non ASCII) UTF-8 has to be read again. A
+    stream can't be read again, so its bytes are kept while it's read (in a
+    temporary file past SPOOL_SIZE). With an encoding (e.g. found by a
+    previous read), it's decoded as such.
+
+    """
+    import pandas as pd
+
+    if isinstance(filepath, io.TextIOBase):
+        # Decoded already
+        return pd.read_table(filepath, **kwargs)
+    if encoding is not None:
+        with open_binary(filepath) as stream:
+            return pd.read_table(stream, encoding=encoding, **kwargs)
+
+    if is_stream(filepath):
+        with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as spool:
+            with Text(Tee(open_binary(filepath), spool)) as text:
+                df = pd.read_table(text, **kwargs)
+                if not text.lossy:
+                    return df
+            spool.seek(0)
+            return pd.read_table(spool, encoding="iso-8859-1", **kwargs)
+
+    with open_text(filepath) as text:
+        df = pd.read_table(text, **kwargs)
+        if not text.lossy:
+            return df
+
+    return pd.read_table(filepath, encoding="iso-8859-1", **kwargs)
+
+
+def read_chunks(filepath, chunksize, encoding=None, **kwargs):
+    """Yield the DataFrames of chunksize rows of read_table(filepath)."""
+    import pandas as pd
+
+    if isinstance(filepath, io.TextIOBase):
+        for chunk in pd.read_table(filepath, chunksize=chunksize, **kwargs):
+            yield chunk
+        return
+    if encoding is not None:
+        with open_binary(filepath) as stream:
+            for chunk in pd.read_table(stream, chunksize=chunksize,
+                                       encoding=encoding, **kwargs):
+                yield chunk
+        return
+
+    with open_text(filepath) as text:
+        for chunk in pd.read_table(text, chunksize=chunksize, **kwargs):
+            yield chunk
+        if text.lossy:
+            # The chunks are gone already, they can't be decoded again
+            logger.warning(
+                "{} is ISO-8859-1, but its text before the first byte that "
+                "isn't UTF-8 was decoded as UTF-8. Give an encoding, or read "
+                "it whole.".format("The input" if is_stream(filepath)
+                                   else filepath))
+
+
+def encoding(filepath):
+    """Return the encoding able to decode the whole filepath."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    source = chunks(filepath)
+    try:
+        for chunk in source:
+            decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return "iso-8859-1"
+    finally:
+        if hasattr(source, "close"):
+            source.close()
+
+    return "utf-8"
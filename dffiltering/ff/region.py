@@ -0,0 +1,289 @@
+"""Positional index of sorted TSVs to read only the rows of some regions.
+
+Like the linear index of tabix, the index keeps for each window of WINDOW
+bases of each chromosome the offset (and row) of the first line whose
+[Start, End] overlaps it. It lives next to the TSV (as file.tsv.dffidx)
+and is rebuilt whenever the TSV changes. The TSV must be sorted: the lines
+of each chromosome together and ordered by Start. Gzipped files can only
+be read from an offset if they are BGZF (made by bgzip).
+
+Regions are given as "chr12:133252000-133260000" (1-based, both ends
+included, as samtools does) or as the lines of a BED file (0-based, end
+excluded).
+
+"""
+import codecs
+import io
+import json
+import logging
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import ff
+    from . import reader
+    from .shard import seek
+except (SystemError, ImportError):
+    import ff
+    import reader
+    from shard import seek
+
+
+logger = logging.getLogger("ff")
+
+SUFFIX = ".dffidx"
+# Bases of each window of the index
+WINDOW = 1 << 14
+# The columns with the position of each variant
+CHROMOSOME, START, END = "Chr", "Start", "End"
+
+REGION = re.compile(
+    r"^(?P<chr>[^:]+)(:(?P<start>[\d,]+)(-(?P<end>[\d,]+))?)?$")
+
+
+def parse_region(text):
+    """Return the region "chr:start-end" as (chr, start, end), 1-based.
+
+    Without end, the region goes to the end of the chromosome, and
+    without start, it is the whole chromosome.
+
+    """
+    match = REGION.match(text.strip())
+    if match is None:
+        raise ValueError("Wrong region {}, use chr:start-end".format(text))
+
+    start = int((match.group("start") or "1").replace(",", ""))
+    end = match.group("end")
+    end = int(end.replace(",", "")) if end else float("inf")
+
+    return match.group("chr"), start, end
+
+
+def read_bed(filepath):
+    """Return the regions in the BED file filepath as (chr, start, end)."""
+    regions = []
+    with open(filepath) as bed:
+        for line in bed:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.split("\t")
+            # BED starts are 0-based and its ends excluded
+            regions.append(
+                (fields[0], int(fields[1]) + 1, int(fields[2].strip())))
+
+    return regions
+
+
+def index_path(filepath):
+    """Return the path of the index of filepath."""
+    return filepath + SUFFIX
+
+
+def key(filepath):
+    """Return the key that makes an index of filepath valid."""
+    stat = os.stat(filepath)
+
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def build(filepath):
+    """Return the index of filepath, as stored in its index file.
+
+    It has the offset and row of the first line overlapping each window
+    of each chromosome, and of the line after its last one. If filepath
+    is not sorted, or it's gzipped but not BGZF, it has "sorted" False.
+
+    """
+    index = {"key": key(filepath), "sorted": False}
+    blocks = None
+    if filepath.endswith(".gz"):
+        blocks = reader.bgzf_blocks(filepath)
+        if blocks is None:
+            return index
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    index["encoding"] = "utf-8"
+    chromosomes = {}
+    with reader.open_binary(filepath) as stream:
+        header = stream.readline()
+        names = header.rstrip(b"\r\n").decode("iso-8859-1").split("\t")
+        if CHROMOSOME not in names or START not in names:
+            logger.warning("{} has no {} and {} columns to index.".format(
+                filepath, CHROMOSOME, START))
+            return index
+        columns = [names.index(CHROMOSOME), names.index(START),
+                   names.index(END) if END in names else names.index(START)]
+        split = max(columns) + 1
+
+        offset, row = len(header), 0
+        current = windows = None
+        last = 0
+        for line in stream:
+            if reader.blank(line):
+                # The parser skips the blank lines, they are no row
+                offset += len(line)
+                continue
+            if index["encoding"] == "utf-8":
+                try:
+                    decoder.decode(line)
+                except UnicodeDecodeError:
+                    index["encoding"] = "iso-8859-1"
+            fields = line.split(b"\t", split)
+            chromosome = fields[columns[0]].decode("iso-8859-1")
+            try:
+                start = int(fields[columns[1]])
+                end = max(int(fields[columns[2]]), start)
+            except (ValueError, IndexError):
+                return index
+
+            if chromosome != current:
+                if chromosome in chromosomes:
+                    # Its lines are not together
+                    return index
+                if current is not None:
+                    chromosomes[current]["end"] = [offset, row]
+                windows = []
+                chromosomes[chromosome] = {"windows": windows}
+                current, last = chromosome, 0
+            elif start < last:
+                return index
+            last = start
+
+            for window in range(start // WINDOW, end // WINDOW + 1):
+                if window >= len(windows):
+                    windows.extend([None] * (window + 1 - len(windows)))
+                if windows[window] is None:
+                    windows[window] = [offset, row]
+
+            offset += len(line)
+            row += 1
+
+        if current is not None:
+            chromosomes[current]["end"] = [offset, row]
+
+    index.update(sorted=True, columns=columns, blocks=blocks,
+                 chromosomes=chromosomes)
+
+    return index
+
+
+def load_index(filepath):
+    """Return the index of filepath, built (and saved) if missing or stale."""
+    try:
+        with open(index_path(filepath)) as js:
+            index = json.load(js)
+        if index["key"] == key(filepath):
+            return index
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+
+    index = build(filepath)
+    try:
+        with open(index_path(filepath), "w") as js:
+            json.dump(index, js)
+    except (IOError, OSError) as err:
+        logger.warning("Can't write the index {} ({}).".format(
+            index_path(filepath), err))
+
+    return index
+
+
+def chromosome_of(index, chromosome):
+    """Return the chromosome entry of the index, with or without "chr"."""
+    chromosomes = index["chromosomes"]
+    for name in [chromosome, chromosome[3:] if chromosome.startswith("chr")
+                 else "chr" + chromosome]:
+        if name in chromosomes:
+            return chromosomes[name]
+
+    return None
+
+
+def region_lines(filepath, index, region):
+    """Yield the (row, line) of the lines of filepath overlapping region."""
+    chromosome, start, end = region
+    entry = chromosome_of(index, chromosome)
+    if entry is None:
+        return
+
+    # The first line overlapping a window at or after the one of start
+    windows = entry["windows"]
+    first = next((_ for _ in windows[max(start, 0) // WINDOW:] if _), None)
+    if first is None:
+        return
+    offset, row = first
+    columns = index["columns"]
+    split = max(columns) + 1
+
+    with seek(filepath, offset, index["blocks"]) as stream:
+        while offset < entry["end"][0]:
+            line = stream.readline()
+            if not line:
+                break
+            if reader.blank(line):
+                offset += len(line)
+                continue
+            fields = line.split(b"\t", split)
+            line_start = int(fields[columns[1]])
+            if line_start > end:
+                break
+            if max(int(fields[columns[2]]), line_start) >= start:
+                yield row, line
+            offset += len(line)
+            row += 1
+
+
+def load_regions(filepath, regions):
+    """Return the rows of filepath overlapping any of regions, as load does.
+
+    The rows are indexed by their position in the file. The numeric
+    columns are typecasted on the rows read only.
+
+    """
+    if reader.is_stream(filepath):
+        # Read once and in full, there's no index of a stream
+        df = ff.load(filepath)
+        return df[overlaps(df, regions)]
+
+    index = load_index(filepath)
+    if not index["sorted"]:
+        logger.warning(
+            "{} is not a sorted TSV or BGZF, it's read in full.".format(
+                filepath))
+        df = ff.load(filepath)
+        return df[overlaps(df, regions)]
+
+    lines = {}
+    for region in regions:
+        lines.update(region_lines(filepath, index, region))
+    rows = sorted(lines)
+
+    with reader.open_binary(filepath) as stream:
+        header = stream.readline()
+
+    df = pd.read_table(
+        io.BytesIO(header + b"".join(lines[_] for _ in rows)),
+        dtype=object, encoding=index["encoding"])
+    df.index = rows
+
+    return ff.numerize(df)
+
+
+def overlaps(df, regions):
+    """Return the mask of the rows of df overlapping any of regions."""
+    chromosomes = df[CHROMOSOME].astype(str)
+    starts = pd.to_numeric(df[START], errors="coerce")
+    ends = pd.to_numeric(df[END], errors="coerce") if END in df else starts
+    ends = np.fmax(starts, ends)
+
+    mask = np.zeros(len(df), dtype=bool)
+    for chromosome, start, end in regions:
+        other = chromosome[3:] if chromosome.startswith("chr") \
+            else "chr" + chromosome
+        mask |= (chromosomes.isin([chromosome, other]) &
+                 (starts <= end) & (ends >= start)).values
+
+    return mask
@@ -0,0 +1,317 @@
+"""Keeps dff running to filter the requests of dff clients (see client).
+
+The loaded tables are kept in memory, the least recently used dropped
+when they take more than a budget, so the next requests of the same file
+are filtered without loading it again. A table is reloaded when its file
+changes.
+
+"""
+import binascii
+import contextlib
+import hmac
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+from collections import OrderedDict
+
+try:
+    from . import _version
+    from . import client
+    from . import ff
+    from . import summary
+except (SystemError, ImportError):
+    import _version
+    import client
+    import ff
+    import summary
+
+
+logger = logging.getLogger("ff")
+
+# Default memory budget of the tables, in Mb
+MEMORY = 1024
+# The args with paths relative to the directory of the client
+PATHS = ["filepath", "filter_stats", "regions_bed", "output", "incremental",
+         "mask_cache"]
+# The flags that report on the stderr of dff, or measure the whole process
+REPORTS = ["profile", "metrics_json", "explain"]
+PATH_LISTS = ["column_contains", "column_in"]
+
+
+class Tables(object):
+    """LRU cache of the loaded tables, within a memory budget in bytes."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.tables = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(filepath):
+        """Return the key of the table of filepath as it is now."""
+        stat = os.stat(filepath)
+
+        return (os.path.abspath(filepath), stat.st_size, stat.st_mtime,
+                tuple(sorted(ff.known_numeric())))
+
+    def get(self, filepath):
+        """Return the filepath loaded as load does, from memory if kept."""
+        key = self.key(filepath)
+        with self.lock:
+            if key in self.tables:
+                self.tables.move_to_end(key)
+                self.hits += 1
+                return self.tables[key][0]
+            self.misses += 1
+
+        df = ff.load(filepath)
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        with self.lock:
+            if size <= self.budget and key not in self.tables:
+                self.tables[key] = (df, size)
+                self.size += size
+                while self.size > self.budget:
+                    self.size -= self.tables.popitem(last=False)[1][1]
+
+        return df
+
+    def stats(self):
+        """Return a dict with the tables kept and the hits and misses."""
+        with self.lock:
+            return {"budget": self.budget, "size": self.size,
+                    "hits": self.hits, "misses": self.misses,
+                    "tables": [{"path": key[0], "size": size}
+                               for key, (_, size) in self.tables.items()]}
+
+
+def parse(flags, cwd):
+    """Return the dff args of flags, their paths relative to cwd."""
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            args = ff.argparser(flags)
+    except SystemExit:
+        raise ValueError(
+            (stderr.getvalue().strip().splitlines() or ["Wrong args"])[-1])
+
+    for name in PATHS:
+        # A bare --mask-cache is True, the default directory
+        if isinstance(getattr(args, name, None), str):
+            setattr(args, name, os.path.join(cwd, getattr(args, name)))
+    for name in PATH_LISTS:
+        if getattr(args, name, None):
+            setattr(args, name,
+                    [os.path.join(cwd, _) for _ in getattr(args, name)])
+    if getattr(args, "json_filter", None):
+        args.json_filter = ["{}={}".format(name, os.path.join(cwd, path))
+                            for name, path in ff.json_filters(args)]
+
+    return args
+
+
+def filter_request(args, tables):
+    """Return the result of the dff args, reusing the tables kept."""
+    if not args.filepath:
+        raise ValueError("Missing --filepath")
+    reports = [_ for _ in REPORTS if getattr(args, _, None)]
+    if reports:
+        raise ValueError("The server can't report {}, run dff instead".format(
+            ", ".join("--" + _.replace("_", "-") for _ in reports)))
+
+    if ff.summarizing(args) and not args.chunksize and not args.cache:
+        # The rows that pass are only counted, read in chunks as main does
+        args.chunksize = summary.CHUNKSIZE
+
+    if len(ff.json_filters(args)) > 1:
+        filters = ff.compile_filters(OrderedDict(
+            (name, ff.conditions(args, path))
+            for name, path in ff.json_filters(args)), args)
+        if any(getattr(args, _, None) for _ in [
+                "chunksize", "region", "regions_bed", "cache"]):
+            return ff.filter_sets(args.filepath, filters, args)
+        results = ff.apply_sets(filters, tables.get(args.filepath),
+                                getattr(args, "output_columns", None))
+        ff.finish_sets(filters, args)
+
+        return results
+
+    filters = ff.compile_filter(ff.conditions(args), args)
+
+    if args.incremental:
+        # The output is written to its file already
+        return ff.filter_incremental(args.filepath, filters, args)
+
+    if any(getattr(args, _, None) for _ in [
+            "chunksize", "parallel", "project", "output_columns", "region",
+            "regions_bed", "cache"]):
+        # These don't load the whole table
+        return ff.filter_file(args.filepath, filters, args)
+
+    # A shallow copy, the filters rename its columns
+    df = filters.apply(tables.get(args.filepath).copy(deep=False))
+    ff.finish(filters, args)
+
+    return df
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """Answers a request of a dff client."""
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline().decode("utf-8"))
+            if self.server.token is not None and not hmac.compare_digest(
+                    str(message.get("token")), self.server.token):
+                raise ValueError("Wrong token, see {}".format(
+                    client.token_path(self.server.server_address[1])))
+            command = message.get("command", "filter")
+            if command == "stats":
+                self.answer(json.dumps(self.server.tables.stats()) + "\n")
+            elif command == "shutdown":
+                self.answer("")
+                threading.Thread(target=self.server.shutdown).start()
+            else:
+                args = parse(message["args"], message["cwd"])
+                self.answer_filter(args)
+        except Exception as err:
+            logger.error("Request failed: {}".format(err))
+            try:
+                self.wfile.write("ERROR {}\n".format(err).encode("utf-8"))
+            except (IOError, OSError):
+                pass
+
+    def answer(self, text):
+        """Answer the text as the output of the request."""
+        self.wfile.write(b"OK\n" + text.encode("utf-8"))
+
+    def answer_filter(self, args):
+        """Answer the output of dff with args, streaming its chunks."""
+        if args.version:
+            return self.answer(_version.__version__ + "\n")
+
+        # The --numeric-cols of a request are only its own, the chunks of
+        #  the result are read (and typecasted) while they are written.
+        with ff.extra_numeric(args.numeric_cols):
+            result = filter_request(args, self.server.tables)
+            if args.incremental:
+                return self.answer("")
+            if ff.summarizing(args):
+                table = io.StringIO()
+                ff.write(summary.summarize(
+                    result, args.group_by, args.aggregate), table)
+                return self.answer(table.getvalue())
+            if len(ff.json_filters(args)) > 1:
+                # Each output goes to its own file
+                ff.write_sets(result, args)
+                return self.answer("")
+
+            self.wfile.write(b"OK\n")
+            try:
+                if args.raw:
+                    ff.write_raw(result, args.filepath, self.wfile)
+                else:
+                    out = io.TextIOWrapper(self.wfile, encoding="utf-8")
+                    ff.write(result, out)
+                    out.flush()
+                    out.detach()
+            except Exception as err:
+                # Too late to answer an error, the client gets a cut output
+                logger.error("Output not sent: {}".format(err))
+
+
+def server(args, tables):
+    """Return the server listening at the address in args.
+
+    A Unix socket is only for the user running the server. Any local user
+    can connect to a TCP port, so its clients must send the token the
+    server writes where only this user can read it (see client.token).
+
+    """
+    token = None
+    if args.port or not hasattr(socket, "AF_UNIX"):
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        listening = socketserver.ThreadingTCPServer(
+            ("127.0.0.1", args.port or client.PORT), Handler)
+        token = write_token(listening.server_address[1])
+    else:
+        if os.path.exists(args.socket):
+            # Left by a server that didn't stop, unless it's running
+            try:
+                client.connect(args).close()
+                raise ValueError(
+                    "A server is already running at {}".format(args.socket))
+            except (IOError, OSError):
+                os.remove(args.socket)
+        # Only this user can connect
+        umask = os.umask(0o177)
+        try:
+            listening = socketserver.ThreadingUnixStreamServer(
+                args.socket, Handler)
+        finally:
+            os.umask(umask)
+    listening.daemon_threads = True
+    listening.tables = tables
+    listening.token = token
+
+    return listening
+
+
+def write_token(port):
+    """Return a new token for the clients of port, saved for this user."""
+    token = binascii.hexlify(os.urandom(16)).decode("ascii")
+    path = client.token_path(port)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), 0o700)
+    if os.path.exists(path):
+        os.remove(path)
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descriptor, "w") as out:
+        out.write(token)
+
+    return token
+
+
+def argparser(args):
+    """Return the parsed arguments of the serve command."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="dff serve",
+        description="""Keep dff running to filter the requests of
+        `dff client` keeping the loaded tables in memory""")
+    client.address(parser)
+    parser.add_argument(
+        "--memory", type=int, default=MEMORY,
+        help="Mb of memory for the tables kept (default {})".format(MEMORY))
+
+    return parser.parse_args(args)
+
+
+def run(args):
+    """Run the serve command line with args (sys.argv without "serve")."""
+    args = argparser(args)
+    listening = server(args, Tables(args.memory * 1024 * 1024))
+    print("dff serving at {}".format(
+        "127.0.0.1:{}".format(listening.server_address[1])
+        if isinstance(listening.server_address, tuple)
+        else args.socket), file=sys.stderr)
+    try:
+        listening.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listening.server_close()
+        if isinstance(listening.server_address, tuple):
+            if os.path.exists(client.token_path(listening.server_address[1])):
+                os.remove(client.token_path(listening.server_address[1]))
+        elif os.path.exists(args.socket):
+            os.remove(args.socket)
+
+    return 0
@@ -0,0 +1,201 @@
+"""Filters a big TSV in parallel, splitting it in shards of whole lines.
+
+A shard is a range of bytes of the (uncompressed) TSV holding the lines
+that start in it. Plain TSV files are split anywhere; gzipped ones only if
+they are BGZF (as bgzip and tabix write them), made of independent blocks
+where the reading can start.
+
+"""
+import bisect
+import gzip
+import io
+import logging
+import os
+
+import pandas as pd
+
+try:
+    from . import ff
+    from .reader import bgzf_blocks
+except (SystemError, ImportError):
+    import ff
+    from reader import bgzf_blocks
+
+
+logger = logging.getLogger("ff")
+
+# Default size in bytes of each shard
+SHARD_SIZE = 64 * 1024 * 1024
+
+# The compiled Filter and file details of each worker, set by init_worker
+WORKER = {}
+
+
+def seek(filepath, offset, blocks=None):
+    """Return filepath opened to read (uncompressed) from offset on."""
+    if blocks is None:
+        raw = open(filepath, "rb")
+        raw.seek(offset)
+        return raw
+
+    index = bisect.bisect_right([_[1] for _ in blocks], offset) - 1
+    coffset, uoffset = blocks[max(index, 0)]
+    raw = open(filepath, "rb")
+    raw.seek(coffset)
+    stream = gzip.GzipFile(fileobj=raw, mode="rb")
+    stream.read(offset - uoffset)
+
+    return stream
+
+
+def read_shard(filepath, start, end, blocks=None):
+    """Return the bytes of the data lines starting within [start, end)."""
+    if start == 0:
+        stream = seek(filepath, 0, blocks)
+        # The header
+        position = len(stream.readline())
+    else:
+        # If the previous byte is a newline, the line starting at start is
+        #  complete; if not, this reads the end of a line of the previous.
+        stream = seek(filepath, start - 1, blocks)
+        position = start - 1 + len(stream.readline())
+
+    with stream:
+        if position >= end:
+            return b""
+        data = stream.read(end - position)
+        if data and not data.endswith(b"\n"):
+            # Finish the last line
+            data += stream.readline()
+
+    return data
+
+
+def shards(filepath, shard_size=SHARD_SIZE):
+    """Return the shards of filepath as [(start, end)] and the BGZF blocks.
+
+    Return None as the shards for gzipped files that aren't BGZF.
+
+    """
+    blocks = None
+    if filepath.endswith(".gz"):
+        blocks = bgzf_blocks(filepath)
+        if blocks is None:
+            return None, None
+        size = blocks[-1][1]
+    else:
+        size = os.path.getsize(filepath)
+
+    return [(start, min(start + shard_size, size))
+            for start in range(0, size, shard_size)], blocks
+
+
+def decode(data):
+    """Return the data decoded as UTF-8, or else ISO-8859-1, and as which.
+
+    The encoding is None if the data is ASCII, the same in both.
+
+    """
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("iso-8859-1"), "iso-8859-1"
+
+    return text, None if len(text) == len(data) else "utf-8"
+
+
+def init_worker(filepath, header, blocks, filters, numeric):
+    """Keep what every shard of filepath needs in this process."""
+    ff.add_numeric(numeric)
+    WORKER.update(filepath=filepath, header=header, blocks=blocks,
+                  filters=filters)
+
+
+def filter_shard(shard):
+    """Return the shard parsed and filtered, with what to merge it.
+
+    That is the filtered DF, the number of rows in the shard, the traits
+    of its numeric columns (see ff.numerize), the Filter rows, timings and
+    order, and the encoding of the shard (see decode).
+
+    """
+    filters, header = WORKER["filters"], WORKER["header"]
+    filters.rows = [0, 0]
+    filters.timings = {}
+
+    # Each shard is decoded on its own, instead of scanning the whole file
+    #  for its encoding first.
+    text, shard_encoding = decode(read_shard(
+        WORKER["filepath"], shard[0], shard[1], WORKER["blocks"]))
+    if text:
+        df = pd.read_table(io.StringIO(text), header=None, names=header,
+                           dtype=object)
+    else:
+        df = pd.DataFrame(columns=header, dtype=object)
+    del text
+    traits = {}
+    df = ff.numerize(df, traits=traits)
+    rows = len(df)
+
+    df = filters.apply(df)
+
+    return (df, rows, traits, filters.rows, filters.timings, filters.order,
+            shard_encoding)
+
+
+def filter_parallel(filepath, filters, processes, shard_size=SHARD_SIZE):
+    """Return filepath filtered by the Filter filters, as load + apply do.
+
+    The file is split in shards of about shard_size bytes filtered by a
+    pool of processes. Files that can't be split are filtered at once.
+
+    """
+    split, blocks = shards(filepath, shard_size)
+    if split is None:
+        logger.warning("{} is not BGZF, it can't be split.".format(filepath))
+        return filters.apply(ff.load(filepath))
+
+    with seek(filepath, 0, blocks) as stream:
+        line, header_encoding = decode(stream.readline())
+    header = ff.parse_header(line)
+    renamed = filters.plan(header)[0]
+
+    from multiprocessing import Pool
+
+    pool = Pool(max(processes, 1), initializer=init_worker,
+                initargs=(filepath, header, blocks, filters,
+                          ff.known_numeric()))
+    try:
+        results = list(pool.imap(filter_shard, split))
+    finally:
+        pool.close()
+        pool.join()
+
+    encodings = set(_[-1] for _ in results) | {header_encoding}
+    if {"iso-8859-1", "utf-8"} <= encodings:
+        # Some non ASCII text is UTF-8, but all of it is ISO-8859-1
+        logger.warning("{} mixes encodings, filtering it at once.".format(
+            filepath))
+        return filters.apply(ff.load(filepath))
+
+    frames = []
+    traits = {}
+    position = 0
+    for df, rows, shard_traits, counts, timings, order, _ in results:
+        # Index the rows by their position in the whole file.
+        df.index = df.index + position
+        position += rows
+        frames.append(df)
+        ff.merge_traits(traits, shard_traits)
+        filters.rows = [_ + __ for _, __ in zip(filters.rows, counts)]
+        for condition, timing in timings.items():
+            total = filters.timings.setdefault(condition, [0, 0, 0])
+            filters.timings[condition] = [
+                _ + __ for _, __ in zip(total, timing)]
+        filters.order = order
+
+    if not frames:
+        return filters.apply(pd.DataFrame(columns=header, dtype=object))
+
+    # Typecast the numeric columns as if the whole file was loaded at once
+    return ff.retype(pd.concat(frames), traits, dict(zip(header, renamed)))
@@ -0,0 +1,173 @@
+"""Counts and aggregates of the rows that pass the filters, by group.
+
+The filtered rows are only summarized, chunk by chunk as they are read, so
+only the summary of each group is kept in memory and never the rows. The
+summary of each group is its count of rows and the min, max and mean of
+some numeric columns.
+
+"""
+import logging
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import ff
+except (SystemError, ImportError):
+    import ff
+
+
+logger = logging.getLogger("ff")
+
+# Rows read at a time when summarizing, if no chunksize is given
+CHUNKSIZE = 100000
+# The column with the name of the filter set, with many of them
+FILTER = "filter"
+
+
+def column_of(df, column):
+    """Return the name of column in the DF, renamed as the filters do.
+
+    Return None if not found.
+
+    """
+    if column in df.columns:
+        return column
+    # The columns used by the filters are cleaned (see ff.clean)
+    new_column = ff.clean(column, pd.DataFrame())[0]
+
+    return new_column if new_column in df.columns else None
+
+
+class Summary(object):
+    """The count and aggregates of the rows of each group, updated by parts.
+
+    The rows are grouped by the values of their group_by columns, and the
+    min, max and mean of each of the aggregate columns is kept. Missing
+    values are a group of their own, and aren't aggregated.
+
+    """
+
+    def __init__(self, group_by=None, aggregate=None):
+        self.group_by = list(group_by or [])
+        self.aggregate = list(aggregate or [])
+        # {group: [rows, [[values, sum, min, max] of each aggregate]]}
+        self.groups = OrderedDict()
+        self.missing = set()
+
+    def columns(self, df, columns):
+        """Return the names of the columns in the DF, None if missing."""
+        names = [column_of(df, _) for _ in columns]
+        for column, name in zip(columns, names):
+            if name is None and column not in self.missing:
+                self.missing.add(column)
+                logger.error(ff.error("Column not found ({}).".format(
+                    column)))
+
+        return names
+
+    def update(self, df, name=()):
+        """Add the rows of a filtered DF, of the filter set name if given."""
+        if not len(df):
+            return
+
+        keys = ["key{}".format(_) for _ in range(len(self.group_by))]
+        values = ["value{}".format(_) for _ in range(len(self.aggregate))]
+        work = pd.DataFrame(dict(
+            [(key, df[column].astype(object).fillna("").values
+              if column is not None else "")
+             for key, column in zip(keys, self.columns(df, self.group_by))] +
+            [(value, pd.to_numeric(df[column], errors="coerce").values
+              if column is not None else np.nan)
+             for value, column in zip(
+                 values, self.columns(df, self.aggregate))]),
+            index=np.arange(len(df)))
+
+        if not keys:
+            self.add(name, len(df), [
+                [work[_].count(), work[_].sum(), work[_].min(),
+                 work[_].max()] for _ in values])
+            return
+
+        grouped = work.groupby(keys, sort=False)
+        counts = grouped.size()
+        aggregates = [grouped[_].agg(["count", "sum", "min", "max"]).values
+                      for _ in values]
+        for index, (group, rows) in enumerate(counts.items()):
+            if len(keys) == 1:
+                group = (group,)
+            self.add(name + tuple(group), rows,
+                     [_[index] for _ in aggregates])
+
+    def empty(self):
+        """Return the summary of a group without rows."""
+        return [0, [[0, 0, np.nan, np.nan] for _ in self.aggregate]]
+
+    def add(self, group, rows, aggregates):
+        """Add the rows and the aggregates of a part of a group."""
+        summary = self.groups.setdefault(group, self.empty())
+        summary[0] += rows
+        for total, (values, value_sum, low, high) in zip(
+                summary[1], aggregates):
+            if values:
+                total[0] += values
+                total[1] += value_sum
+                total[2] = np.fmin(total[2], low)
+                total[3] = np.fmax(total[3], high)
+
+    def table(self, names=None):
+        """Return the summary as a DF, with a row per group.
+
+        The groups are sorted by their count of rows, most first. With names
+        (of the filter sets), a first column has the name of each one.
+
+        """
+        columns = ([FILTER] if names else []) + self.group_by + ["count"]
+        for column in self.aggregate:
+            columns.extend(
+                "{}_{}".format(column, _) for _ in ["min", "max", "mean"])
+
+        groups = list(self.groups.items())
+        if not self.group_by:
+            # A row even when nothing passes
+            groups = [(_, self.groups.get(_, self.empty()))
+                      for _ in ([(name,) for name in names] if names
+                                else [()])]
+        elif names:
+            groups.sort(key=lambda _: (names.index(_[0][0]), -_[1][0]))
+        else:
+            groups.sort(key=lambda _: -_[1][0])
+
+        rows = []
+        for group, (count, aggregates) in groups:
+            row = list(group) + [count]
+            for values, value_sum, low, high in aggregates:
+                row.extend(
+                    [low, high, value_sum / values if values else np.nan])
+            rows.append(row)
+
+        return pd.DataFrame(rows, columns=columns)
+
+
+def summarize(result, group_by=None, aggregate=None):
+    """Return the summary table of the result of ff.main (see Summary).
+
+    result is a filtered DF, a dict of them by filter set name, or an
+    iterator of either.
+
+    """
+    summary = Summary(group_by, aggregate)
+    if isinstance(result, (pd.DataFrame, dict)):
+        result = [result]
+
+    names = None
+    for part in result:
+        if isinstance(part, dict):
+            names = list(part)
+            for name, df in part.items():
+                summary.update(df, (name,))
+        else:
+            summary.update(part)
+
+    return summary.table(names)
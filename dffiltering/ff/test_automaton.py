@@ -0,0 +1,28 @@
+"""Test the automaton module."""
+from unittest import TestCase
+
+from automaton import Automaton, literals
+
+
+class testAutomaton(TestCase):
+    def test_finds_any_of_the_words(self):
+        automaton = Automaton(["he", "she", "his", "hers"])
+
+        self.assertTrue(automaton.search("ushers"))
+        self.assertTrue(automaton.search("this"))
+        self.assertFalse(automaton.search("hxs"))
+        self.assertFalse(automaton.search(""))
+
+    def test_follows_the_failure_links(self):
+        automaton = Automaton(["abcd", "bce"])
+
+        self.assertTrue(automaton.search("abce"))
+        self.assertFalse(automaton.search("abcbd"))
+
+    def test_empty_word_is_everywhere(self):
+        self.assertTrue(Automaton(["GENE1", ""]).search("anything"))
+
+    def test_literals_of_the_terms(self):
+        self.assertEqual(literals("GATK,TVC|TVC,GATK"),
+                         ["GATK,TVC", "TVC,GATK"])
+        self.assertIsNone(literals(r"\bsynonymous SNV|deletion"))
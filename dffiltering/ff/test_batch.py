@@ -0,0 +1,97 @@
+"""Test the batch module."""
+import io
+import os
+import shutil
+import tempfile
+from os.path import dirname, join
+from unittest import TestCase
+
+import batch
+import ff
+
+
+def file_test(filename):
+    """Return the path to filename in test_files."""
+    return join(dirname(__file__), "test_files", filename)
+
+
+class testBatch(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        for filename in ["8859.tab", "DOT.column.tab"]:
+            shutil.copy(file_test(filename), self.tmp)
+        with open(join(self.tmp, "manifest.txt"), "w") as manifest:
+            manifest.write("# Samples\n{}\n\n{}\n".format(
+                join(self.tmp, "DOT.column.tab"),
+                join(self.tmp, "missing.tab")))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def args(self, *extra):
+        return batch.argparser(
+            [join(self.tmp, "*.tab"),
+             "--manifest", join(self.tmp, "manifest.txt"),
+             "--json-filter", file_test("filter_sample.json"),
+             "--output", join(self.tmp, "{stem}.out")] + list(extra))
+
+    def summaries(self, args):
+        out = io.StringIO()
+        errors = batch.main(args, out)
+        lines = out.getvalue().splitlines()
+
+        return errors, [dict(zip(lines[0].split("\t"), _.split("\t")))
+                        for _ in lines[1:]]
+
+    def test_output_path_template(self):
+        self.assertEqual(
+            ff.output_path("{dir}/out_{stem}.tsv", "/data/s1.tab.gz"),
+            "/data/out_s1.tsv")
+        self.assertEqual(ff.output_path("{name}.f", "s1.tab"), "s1.tab.f")
+        self.assertEqual(
+            ff.output_path("{stem}_{filter}.tsv", "s1.tab", filter="rare"),
+            "s1_rare.tsv")
+
+    def test_paths_from_globs_and_manifest(self):
+        self.assertEqual(
+            [os.path.basename(_) for _ in batch.paths(self.args())],
+            ["8859.tab", "DOT.column.tab", "missing.tab"])
+
+    def test_bad_file_does_not_abort_the_batch(self):
+        errors, summaries = self.summaries(self.args("--jobs", "1"))
+
+        self.assertEqual(errors, 1)
+        self.assertEqual(
+            [(_["rows_in"], _["rows_out"], bool(_["error"]))
+             for _ in summaries],
+            [("249", "7", False), ("9", "2", False), ("0", "0", True)])
+        self.assertTrue(os.path.exists(join(self.tmp, "8859.out")))
+
+    def test_pool_gives_the_same_summaries(self):
+        errors, summaries = self.summaries(self.args("--jobs", "1"))
+        with open(join(self.tmp, "8859.out")) as out:
+            output = out.read()
+
+        pool_errors, pool_summaries = self.summaries(self.args("--jobs", "2"))
+
+        self.assertEqual(pool_errors, errors)
+        self.assertEqual([_["rows_out"] for _ in pool_summaries],
+                         [_["rows_out"] for _ in summaries])
+        with open(join(self.tmp, "8859.out")) as out:
+            self.assertEqual(out.read(), output)
+
+    def test_same_output_path_is_an_error(self):
+        os.mkdir(join(self.tmp, "other"))
+        shutil.copy(file_test("8859.tab"), join(self.tmp, "other"))
+        args = batch.argparser(
+            [join(self.tmp, "8859.tab"), join(self.tmp, "other", "8859.tab"),
+             join(self.tmp, "DOT.column.tab"),
+             "--json-filter", file_test("filter_sample.json"),
+             "--output", join(self.tmp, "{stem}.out"), "--jobs", "1"])
+
+        errors, summaries = self.summaries(args)
+
+        self.assertEqual(errors, 2)
+        self.assertEqual([bool(_["error"]) for _ in summaries],
+                         [True, True, False])
+        self.assertFalse(os.path.exists(join(self.tmp, "8859.out")))
@@ -0,0 +1,75 @@
+"""Test the cache module."""
+import os
+import shutil
+import tempfile
+from os.path import dirname, join
+from unittest import TestCase
+
+import cache
+import ff
+
+
+def file_test(filename):
+    """Return the path to filename in test_files."""
+    return join(dirname(__file__), "test_files", filename)
+
+
+class testCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.tab_file = join(self.tmp, "8859.tab")
+        shutil.copy(file_test("8859.tab"), self.tab_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_cached_DF_is_the_same_DF(self):
+        df = ff.load(self.tab_file, cache=True)
+
+        self.assertTrue(os.path.isdir(cache.cache_dir(self.tab_file)))
+        self.assertTrue(ff.load(self.tab_file, cache=True).equals(df))
+
+    def test_cache_reads_only_the_columns_asked(self):
+        ff.load(self.tab_file, cache=True)
+
+        df = ff.load(self.tab_file, cache=True,
+                     columns=["ExAC_ALL", "Chr", "Imaginary"])
+
+        self.assertEqual(list(df.columns), ["Chr", "ExAC_ALL"])
+        self.assertEqual(df.shape, (249, 2))
+
+    def test_changed_file_invalidates_cache(self):
+        df = ff.load(self.tab_file, cache=True)
+        numeric = [_ for _ in ff.COLUMN_TYPES["numeric"] if _ in df.columns]
+
+        self.assertIsNotNone(cache.read(self.tab_file, numeric))
+        self.assertIsNone(cache.read(self.tab_file, numeric + ["Chr"]))
+
+        with open(self.tab_file, "ab") as tab:
+            tab.write(b"\n")
+
+        self.assertIsNone(cache.read(self.tab_file, numeric))
+
+    def test_only_the_columns_needed_are_read(self):
+        args = ff.argparser(["--filepath", self.tab_file, "--cache",
+                             "--json-filter", file_test("filter_sample.json"),
+                             "--output-columns", "Chr,Start"])
+        expected = ff.main(args)
+        # Any column not needed missing from the cache can't be read
+        meta = cache.meta(self.tab_file)
+        os.remove(join(cache.cache_dir(self.tab_file),
+                       meta["files"]["Gene.refGene"]["values"]))
+
+        df = ff.main(args)
+
+        self.assertEqual(list(df.columns), ["Chr", "Start"])
+        self.assertEqual(df.to_csv(sep="\t"), expected.to_csv(sep="\t"))
+        args.output_columns = None
+        args.raw = True
+        self.assertEqual(list(ff.main(args).index), list(expected.index))
+
+    def test_cache_runs_no_pickle(self):
+        ff.load(self.tab_file, cache=True)
+
+        self.assertFalse([_ for _ in os.listdir(
+            cache.cache_dir(self.tab_file)) if _.endswith(".pkl")])
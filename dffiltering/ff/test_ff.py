@@ -1,10 +1,15 @@
 """Test the ff module."""
+import io
 import json
+import shutil
+import tempfile
+from contextlib import redirect_stderr
 from os.path import dirname, join
 from colorama import init, Fore, Style
 import pandas as pd
 import numpy as np
 from unittest import TestCase
+from unittest.mock import patch
 
 init()
 
@@ -131,6 +136,17 @@ class testDataFrame(TestCase):
 
         self.assertEqual(ff.dffilter(conditions, df).shape, (1, 76))
 
+    def test_num_columns_markers_are_corrected(self):
+        df = pd.DataFrame({
+            "ExAC_ALL": [".", "-", "1.", "1,", "0,5", np.nan, "A"],
+            "Start": ["1", "2", "3", "4", "5", "6", "7"]}, dtype=object)
+
+        df = ff.numerize(df)
+
+        self.assertEqual(df["Start"].dtype, np.dtype("int64"))
+        self.assertEqual(list(df["ExAC_ALL"][:6]), [0, 0, 1, 1, 0.5, 0])
+        self.assertTrue(np.isnan(df["ExAC_ALL"][6]))
+
     def test_num_columns_with_commas(self):
         tab_file = join(dirname(__file__), "test_files", "floats_comma.tab")
         df = ff.load(tab_file)
@@ -209,6 +225,404 @@ class testFilterAndDFClean(TestCase):
         self.assertEqual(ff.dffilter(conditions, df).shape, (1, 99))
 
 
+class testCompiledFilter(TestCase):
+    def test_filter_can_be_reused_on_many_DFs(self):
+        conditions = ['TVC.counts < 3', 'Func.refGene contains exonic']
+        compiled = ff.Filter(conditions)
+
+        self.assertEqual(
+            compiled.apply(ff.load(file_test("DOT.column.tab"))).shape,
+            (2, 99))
+        self.assertEqual(
+            compiled.apply(ff.load(file_test("DOT.column.tab"))).shape,
+            (2, 99))
+
+    def test_filter_resolves_columns_once_per_header(self):
+        compiled = ff.Filter(["Imaginary < 3"])
+
+        with self.assertLogs("ff", level="INFO") as log:
+            for chunk in ff.load(file_test("8859.tab"), chunksize=100):
+                compiled.apply(chunk)
+
+        self.assertEqual(len(log.output), 1)
+
+    def test_long_filter_lists_dont_recurse(self):
+        conditions = ["Ref not_contains Z"] * 2000
+
+        df = ff.dffilter(conditions, ff.load(file_test("8859.tab")))
+
+        self.assertEqual(df.shape, (249, 151))
+
+    def test_empty_mask_shortcircuits(self):
+        conditions = ['Ref == "Z"', 'Imaginary.Column.txt contains X']
+
+        with self.assertLogs("ff", level="INFO"):
+            df = ff.dffilter(conditions, ff.load(file_test("8859.tab")))
+
+        self.assertEqual(df.shape, (0, 151))
+
+
+class testMembershipFilter(TestCase):
+    def setUp(self):
+        self.df = ff.load(file_test("8859.tab"))
+
+    def test_in_splits_multivalued_cells(self):
+        conditions = ["Gene.refGene in PRH1|GRIN2B"]
+
+        self.assertEqual(ff.dffilter(conditions, self.df).shape, (14, 151))
+
+    def test_not_in_is_the_complement(self):
+        conditions = ["Gene.refGene not_in PRH1|GRIN2B"]
+
+        self.assertEqual(ff.dffilter(conditions, self.df).shape, (235, 151))
+
+    def test_in_is_exact(self):
+        conditions = ["Gene.refGene in PRH"]
+
+        self.assertEqual(ff.dffilter(conditions, self.df).shape, (0, 151))
+
+    def test_in_a_list_is_still_a_query(self):
+        for condition, rows in [('Chr in ["chr12", "chr1"]', 249),
+                                ('Ref in ("A", "G")', 114),
+                                ("Start in [10312878]", 1)]:
+            self.assertEqual(
+                len(ff.dffilter([condition], self.df)), rows, condition)
+
+    def test_long_literal_contains_is_same_as_regex(self):
+        terms = "|".join(["FAKE{}".format(_) for _ in range(100)] +
+                         ["LRRK", "SLCO1B"])
+        regex = ff.Filter(["Gene.refGene contains {}|(?!)".format(terms)])
+        literal = ff.Filter(["Gene.refGene contains {}".format(terms)])
+
+        self.assertIsNone(regex.matcher("contains", terms + "|(?!)"))
+        self.assertIsNotNone(literal.matcher("contains", terms))
+        self.assertTrue(literal.apply(self.df.copy()).equals(
+            regex.apply(self.df.copy())))
+
+    def test_main_entry_with_column_in(self):
+        args = ff.argparser([
+            "--column-in", file_test("Gene.refGene"),
+            "--filepath", file_test("8859.tab"),
+            "--json-filter", file_test("filter_sample.json")])
+
+        df = ff.main(args)
+
+        self.assertEqual(df.shape, (4, 151))
+
+
+class testCategoricalColumns(TestCase):
+    def setUp(self):
+        self.df = ff.load(file_test("8859.tab"))
+        self.strings = ff.decategorize(self.df)
+
+    def test_low_cardinality_columns_are_categorical(self):
+        self.assertTrue(ff.is_categorical(self.df["Func.refGene"]))
+        self.assertTrue(ff.is_categorical(self.df["Chr"]))
+        # Numeric columns are left alone
+        self.assertFalse(ff.is_categorical(self.df["Start"]))
+        self.assertFalse(any(
+            ff.is_categorical(self.strings[_]) for _ in self.strings))
+
+    def test_told_columns_are_always_categorical(self):
+        df = pd.DataFrame({"Zygosity": ["het", "hom", "het?"],
+                           "Other": ["a", "b", "c"]})
+
+        df = ff.categorize(df)
+
+        self.assertTrue(ff.is_categorical(df["Zygosity"]))
+        self.assertFalse(ff.is_categorical(df["Other"]))
+
+    def test_categoricals_filter_as_strings(self):
+        for conditions in [
+                ["Func.refGene contains exonic|splicing"],
+                ["ExonicFunc.refGene not_contains synonymous SNV"],
+                ["Func.refGene in exonic|intronic"],
+                ['Func.refGene == "exonic"', 'Chr > "chr1"'],
+                ["Chr == Ref"]]:
+            df = ff.dffilter(conditions, self.df.copy())
+            strings = ff.dffilter(conditions, self.strings.copy())
+
+            self.assertTrue(ff.decategorize(df).equals(strings), conditions)
+
+    def test_distinct_runs_once_per_category(self):
+        calls = []
+        series = self.df["Func.refGene"]
+
+        found = ff.distinct(series, lambda _: calls.append(_) or
+                            _ == "exonic")
+
+        self.assertEqual(sorted(calls), sorted(series.cat.categories))
+        self.assertEqual(found.sum(), (series == "exonic").sum())
+
+    def test_output_is_the_same(self):
+        categorical, strings = io.StringIO(), io.StringIO()
+        ff.write(self.df, categorical)
+        ff.write(self.strings, strings)
+
+        self.assertEqual(categorical.getvalue(), strings.getvalue())
+
+
+class testOptimizedFilter(TestCase):
+    def setUp(self):
+        self.conditions = json.load(open(file_test("filter_sample.json")))
+
+    def test_optimized_filter_gives_same_rows(self):
+        df = ff.dffilter(self.conditions, ff.load(file_test("8859.tab")))
+        compiled = ff.Filter(self.conditions, optimize=True)
+
+        self.assertTrue(
+            compiled.apply(ff.load(file_test("8859.tab"))).equals(df))
+
+    def test_optimized_filter_evaluates_selective_first(self):
+        compiled = ff.Filter(self.conditions, optimize=True)
+        compiled.stats = {
+            "vardb_gatk <= 20": (1, 0.5),
+            "vardb_tvc <= 20": (1, 0.1),
+            "ExAC_ALL <= 0.1": (1, 1),
+            "Func_refGene contains exonic|splicing": (100, 0.1)}
+
+        compiled.apply(ff.load(file_test("8859.tab")))
+
+        self.assertEqual(compiled.order,
+                         ["vardb_tvc <= 20", "vardb_gatk <= 20",
+                          "Func_refGene contains exonic|splicing",
+                          "ExAC_ALL <= 0.1"])
+
+    def test_stats_are_saved_and_reloaded(self):
+        compiled = ff.Filter(self.conditions, optimize=True)
+        compiled.apply(ff.load(file_test("8859.tab")))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            stats = join(tmp, "stats.json")
+            compiled.save_stats(stats)
+            reloaded = ff.Filter(self.conditions, optimize=True)
+            reloaded.load_stats(stats)
+
+        self.assertEqual(sorted(reloaded.stats), sorted(compiled.stats))
+
+    def test_report_lists_every_condition_evaluated(self):
+        compiled = ff.Filter(self.conditions)
+        compiled.apply(ff.load(file_test("8859.tab")))
+
+        report = compiled.report().splitlines()
+
+        self.assertEqual(len(report), 5)
+        self.assertTrue(report[-1].endswith("Func_refGene contains "
+                                            "exonic|splicing"))
+
+
+class testProjection(TestCase):
+    def setUp(self):
+        self.conditions = json.load(open(file_test("filter_sample.json")))
+
+    def test_filter_knows_the_columns_it_uses(self):
+        compiled = ff.Filter(self.conditions + ["CG46 != CG46"])
+        header = ff.read_header(file_test("8859.tab"))
+
+        self.assertEqual(compiled.columns(header),
+                         ["Func.refGene", "vardb_gatk", "vardb_tvc",
+                          "ExAC_ALL", "CG46"])
+
+    def test_projected_rows_are_the_filtered_rows(self):
+        df = ff.dffilter(self.conditions, ff.load(file_test("8859.tab")))
+
+        projected = ff.project(file_test("8859.tab"),
+                               ff.Filter(self.conditions))
+
+        self.assertEqual(list(projected.columns), list(df.columns))
+        pd.testing.assert_frame_equal(
+            projected, ff.decategorize(df), check_dtype=False)
+
+    def test_projected_chunks(self):
+        chunks = ff.project(file_test("8859.tab"), ff.Filter(self.conditions),
+                            chunksize=5)
+
+        self.assertEqual([_.shape for _ in chunks], [(5, 151), (2, 151)])
+
+    def test_output_columns(self):
+        df = ff.project(file_test("8859.tab"), ff.Filter(self.conditions),
+                        output_columns=["Start", "Chr", "Func.refGene"])
+
+        self.assertEqual(list(df.columns), ["Chr", "Start", "Func_refGene"])
+        self.assertEqual(df.shape, (7, 3))
+
+    def test_projection_skips_blank_lines(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tab_file = join(tmp, "blank.tab")
+            with open(tab_file, "w") as tab:
+                tab.write("Chr\tStart\tRef\n\nchr1\t1\tA\n  \n"
+                          "chr1\t2\tG\n\nchr1\t3\tA\n")
+            conditions = ['Ref == "A"']
+            df = ff.dffilter(conditions, ff.load(tab_file))
+            projected = ff.project(tab_file, ff.Filter(conditions))
+
+        self.assertEqual(projected.to_csv(), df.to_csv())
+
+
+class testRawOutput(TestCase):
+    def setUp(self):
+        class Arg(object):
+            json_filter = file_test("filter_sample.json")
+            filepath = file_test("8859.tab")
+            column_contains = None
+            chunksize = None
+
+        self.args = Arg()
+        with open(file_test("8859.tab"), "rb") as tab:
+            self.lines = tab.readlines()
+
+    def output(self):
+        out = io.BytesIO()
+        ff.write_raw(ff.main(self.args), self.args.filepath, out)
+
+        return out.getvalue()
+
+    def test_raw_output_are_the_input_lines(self):
+        df = ff.main(self.args)
+        out = io.BytesIO()
+
+        ff.write_raw(df, self.args.filepath, out)
+
+        self.assertEqual(out.getvalue(), b"".join(
+            [self.lines[0]] + [self.lines[_ + 1] for _ in df.index]))
+        self.assertEqual(len(out.getvalue().splitlines()), 8)
+
+    def test_raw_output_of_chunks_and_projections_are_the_same(self):
+        raw = self.output()
+        self.args.chunksize = 40
+        self.assertEqual(self.output(), raw)
+        self.args.project = True
+        self.assertEqual(self.output(), raw)
+        self.args.chunksize = None
+        self.assertEqual(self.output(), raw)
+
+    def test_raw_output_of_gzipped_file(self):
+        raw = self.output()
+        self.args.filepath = file_test("8859.tab.gz")
+
+        self.assertEqual(self.output(), raw)
+
+    def test_raw_output_skips_blank_lines(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tab_file = join(tmp, "blank.tab")
+            with open(tab_file, "wb") as tab:
+                tab.write(b"Chr\tStart\tRef\n\nchr1\t1\tA\n  \n"
+                          b"chr1\t2\tG\n\nchr1\t3\tA\n")
+            df = ff.dffilter(['Ref == "A"'], ff.load(tab_file))
+            out = io.BytesIO()
+            ff.write_raw(df, tab_file, out)
+
+        self.assertEqual(out.getvalue(),
+                         b"Chr\tStart\tRef\nchr1\t1\tA\nchr1\t3\tA\n")
+
+    def test_raw_output_of_some_columns_is_refused(self):
+        with redirect_stderr(io.StringIO()), \
+                self.assertRaises(SystemExit) as refused:
+            ff.argparser(["--filepath", self.args.filepath, "--raw",
+                          "--output-columns", "Chr"])
+
+        self.assertEqual(refused.exception.code, 2)
+
+
+class testCompactDtypes(TestCase):
+    def test_values_are_kept_in_smaller_dtypes(self):
+        df = pd.DataFrame({
+            "exact": [0.5, 0.25, np.nan, 2], "inexact": [0.1, 0.2, 0.3, 1],
+            "small": [1, 2, 3, 4], "big": [1, 2, 3, 2 ** 40],
+            "few": ["a", "b", "a", "a"], "unique": ["a", "b", "c", "d"]})
+
+        df = ff.compact_dtypes(df)
+
+        self.assertEqual(
+            [str(_) for _ in df.dtypes],
+            ["float32", "float64", "int32", "int64", "category", "object"])
+        self.assertEqual(list(df["inexact"]), [0.1, 0.2, 0.3, 1])
+
+    def test_compact_output_is_the_same(self):
+        args = ff.argparser([
+            "--filepath", file_test("8859.tab"),
+            "--json-filter", file_test("filter_sample.json")])
+        compact = ff.argparser([
+            "--filepath", file_test("8859.tab"),
+            "--json-filter", file_test("filter_sample.json"), "--compact"])
+        expected, out, report = io.StringIO(), io.StringIO(), io.StringIO()
+
+        ff.write(ff.main(args), expected)
+        with redirect_stderr(report):
+            ff.write(ff.main(compact), out)
+
+        self.assertEqual(out.getvalue(), expected.getvalue())
+        self.assertIn("int64 -> int32", report.getvalue())
+        self.assertTrue(report.getvalue().splitlines()[-1].startswith(
+            "total"))
+
+
+class testFilterSets(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.sets = {
+            "rare": ["ExAC_ALL <= 0.1", "Func.refGene contains exonic"],
+            "deep": ["ExAC_ALL <= 0.1", "GATK.Depth > 20"]}
+        for name, conditions in self.sets.items():
+            with open(join(self.tmp, name + ".json"), "w") as js:
+                json.dump(conditions, js)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_filter_sets_are_named_after_their_file(self):
+        args = ff.argparser([
+            "--json-filter", join(self.tmp, "rare.json"),
+            "--json-filter", "other=" + join(self.tmp, "deep.json")])
+
+        self.assertEqual(ff.json_filters(args), [
+            ("rare", join(self.tmp, "rare.json")),
+            ("other", join(self.tmp, "deep.json"))])
+
+    def test_shared_conditions_are_evaluated_once(self):
+        df = ff.load(file_test("8859.tab"))
+        filters = dict((name, ff.Filter(conditions))
+                       for name, conditions in self.sets.items())
+
+        with patch.object(ff.Filter, "step", autospec=True,
+                          side_effect=ff.Filter.step) as step:
+            results = ff.apply_sets(filters, df)
+
+        for name, conditions in self.sets.items():
+            self.assertTrue(results[name].equals(
+                ff.dffilter(conditions, df.copy())), name)
+        self.assertEqual(
+            [_[0][2][3] for _ in step.call_args_list].count(
+                "ExAC_ALL <= 0.1"), 1)
+
+    def test_each_output_is_the_one_of_its_filter(self):
+        template = join(self.tmp, "{stem}_{filter}.tsv")
+        for extra in [[], ["--chunksize", "50"], ["--raw"]]:
+            args = ff.argparser([
+                "--filepath", file_test("8859.tab"),
+                "--json-filter", join(self.tmp, "rare.json"),
+                "--json-filter", join(self.tmp, "deep.json"),
+                "--output", template] + extra)
+
+            ff.write_sets(ff.main(args), args)
+
+            for name in self.sets:
+                single = ff.argparser([
+                    "--filepath", file_test("8859.tab"),
+                    "--json-filter", join(self.tmp, name + ".json")] + extra)
+                path = template.format(stem="8859", filter=name)
+                if "--raw" in extra:
+                    expected = io.BytesIO()
+                    ff.write_raw(ff.main(single), single.filepath, expected)
+                    with open(path, "rb") as out:
+                        self.assertEqual(out.read(), expected.getvalue())
+                else:
+                    expected = io.StringIO()
+                    ff.write(ff.main(single), expected)
+                    with open(path) as out:
+                        self.assertEqual(out.read(), expected.getvalue())
+
+
 class testMainEntry(TestCase):
     def setUp(self):
         self.tab_file = file_test("8859.tab")
@@ -265,6 +679,97 @@ class testMainEntry(TestCase):
         self.assertEqual(df.shape, (249, 151))
 
 
+class testChunkedEntry(TestCase):
+    def setUp(self):
+        class Arg(object):
+            json_filter = file_test("filter_sample.json")
+            filepath = file_test("8859.tab")
+            column_contains = None
+            chunksize = None
+
+        self.args = Arg()
+
+    def output(self):
+        out = io.StringIO()
+        ff.write(ff.main(self.args), out)
+
+        return out.getvalue()
+
+    def test_can_load_tab_in_chunks(self):
+        chunks = list(ff.load(file_test("8859.tab"), chunksize=100))
+
+        self.assertEqual([_.shape for _ in chunks],
+                         [(100, 151), (100, 151), (49, 151)])
+        self.assertEqual(chunks[0]["MetaLR_score"].dtype,
+                         np.dtype("float64"))
+
+    def test_chunked_output_is_identical(self):
+        whole = self.output()
+        self.args.chunksize = 50
+
+        self.assertEqual(whole, self.output())
+
+    def test_chunked_gzipped_output_is_identical(self):
+        self.args.filepath = file_test("8859.tab.gz")
+        self.args.json_filter = file_test("slashb.json")
+        whole = self.output()
+        self.args.chunksize = 60
+
+        self.assertEqual(whole, self.output())
+
+    def test_chunk_with_only_missing_values_keeps_int_columns(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tab_file = join(tmp, "int.tab")
+            with open(tab_file, "w") as tab:
+                tab.write("Chr\tCG46\n" + "chr1\t146\n" * 10 +
+                          "chr1\t.\nchr1\t\n" * 5)
+            whole = ff.load(tab_file)
+            chunks = list(ff.load(tab_file, chunksize=4))
+
+        self.assertEqual(pd.concat(chunks).to_csv(), whole.to_csv())
+
+
+class testStreams(TestCase):
+    def setUp(self):
+        self.conditions = json.load(open(file_test("filter_sample.json")))
+        self.expected = ff.dffilter(
+            self.conditions, ff.load(file_test("8859.tab")))
+        with open(file_test("8859.tab"), "rb") as tab:
+            self.data = tab.read()
+
+    def test_iter_filtered_yields_the_filtered_rows(self):
+        for source in [file_test("8859.tab"), io.BytesIO(self.data)]:
+            chunks = list(ff.iter_filtered(source, self.conditions, 100))
+
+            self.assertEqual([len(_.columns) for _ in chunks], [151] * 3)
+            self.assertEqual(
+                list(pd.concat(chunks).index), list(self.expected.index))
+
+    def test_iter_filtered_takes_a_filter(self):
+        filters = ff.Filter(self.conditions)
+        chunks = ff.iter_filtered(io.BytesIO(self.data), filters)
+
+        self.assertTrue(next(chunks).equals(ff.decategorize(self.expected)))
+        self.assertEqual(filters.rows, [249, 7])
+
+    def test_standard_input(self):
+        stdin = io.TextIOWrapper(io.BytesIO(self.data))
+        args = ff.argparser(["--filepath", "-",
+                             "--json-filter", file_test("filter_sample.json")])
+
+        with patch("sys.stdin", stdin):
+            df = ff.main(args)
+
+        self.assertTrue(df.equals(self.expected))
+
+    def test_raw_output_needs_a_file(self):
+        with redirect_stderr(io.StringIO()), \
+                self.assertRaises(SystemExit) as refused:
+            ff.argparser(["--filepath", "-", "--raw"])
+
+        self.assertEqual(refused.exception.code, 2)
+
+
 class testArgParser(TestCase):
     def setUp(self):
         self.tab_file = file_test("8859.tab")
@@ -316,3 +821,8 @@ class testArgParser(TestCase):
             "--json-filter", "/path/to/filter.json"])
 
         self.assertCountEqual(args.numeric_cols, ["MakeUp.Name", "Other.Name"])
+
+    def test_chunksize_argument(self):
+        args = ff.argparser(["--chunksize", "1000"])
+
+        self.assertEqual(args.chunksize, 1000)
@@ -0,0 +1,132 @@
+"""Test the incremental module."""
+import io
+import json
+import shutil
+import tempfile
+from os.path import dirname, join
+from unittest import TestCase
+
+import ff
+import incremental
+
+
+def file_test(filename):
+    """Return the path to filename in test_files."""
+    return join(dirname(__file__), "test_files", filename)
+
+
+class testIncremental(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.tab_file = join(self.tmp, "8859.tab")
+        shutil.copy(file_test("8859.tab"), self.tab_file)
+        with open(file_test("8859.tab"), "rb") as tab:
+            self.lines = tab.readlines()[1:]
+        with open(file_test("filter_sample.json")) as js:
+            self.conditions = json.load(js)
+        self.output = join(self.tmp, "output.tsv")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def append(self, data):
+        with open(self.tab_file, "ab") as tab:
+            tab.write(data)
+
+    def update(self, raw=False, conditions=None):
+        """Return the rows written and the rows filtered by an update."""
+        filters = ff.Filter(conditions or self.conditions)
+        written = incremental.update(
+            self.tab_file, filters, self.output, raw)
+
+        return written, filters.rows[0]
+
+    def assertSameOutput(self, raw=False, conditions=None):
+        df = ff.dffilter(conditions or self.conditions,
+                         ff.load(self.tab_file))
+        if raw:
+            expected = io.BytesIO()
+            ff.write_raw(df, self.tab_file, expected)
+            with open(self.output, "rb") as output:
+                self.assertEqual(output.read(), expected.getvalue())
+        else:
+            expected = io.StringIO()
+            ff.write(df, expected)
+            with open(self.output) as output:
+                self.assertEqual(output.read(), expected.getvalue())
+
+    def test_only_the_appended_lines_are_filtered(self):
+        for raw in [False, True]:
+            shutil.copy(file_test("8859.tab"), self.tab_file)
+            self.assertEqual(self.update(raw), (7, 249))
+            # The last line isn't complete yet, its row is filtered again
+            self.append(b"".join(self.lines[:100]) + self.lines[100][:20])
+            self.assertEqual(self.update(raw), (5, 101))
+            self.assertSameOutput(raw)
+            self.assertEqual(self.update(raw), (0, 1))
+            self.append(self.lines[100][20:])
+            self.assertEqual(self.update(raw), (0, 1))
+            self.assertEqual(self.update(raw), (0, 0))
+
+            self.assertSameOutput(raw)
+
+    def test_a_last_line_without_newline_is_a_row(self):
+        # A row that passes the filters
+        passing = self.lines[17].rstrip(b"\n")
+        for raw in [False, True]:
+            shutil.copy(file_test("8859.tab"), self.tab_file)
+            self.append(passing)
+            self.assertEqual(self.update(raw), (8, 250))
+            self.assertSameOutput(raw)
+
+            # The line grows, and its row is written again as it is now
+            self.append(b"\n" + passing)
+            self.assertEqual(self.update(raw), (2, 2))
+            self.assertSameOutput(raw)
+            self.append(b"\n")
+            self.assertEqual(self.update(raw), (1, 1))
+            self.assertEqual(self.update(raw), (0, 0))
+            self.assertSameOutput(raw)
+
+    def test_blank_lines_are_no_rows(self):
+        for raw in [False, True]:
+            shutil.copy(file_test("8859.tab"), self.tab_file)
+            self.update(raw)
+            self.append(b"\n" + b"\n".join(self.lines[:3]) + b"\n")
+            self.assertEqual(self.update(raw)[1], 3)
+
+            self.assertSameOutput(raw)
+
+    def test_changes_filter_it_all_again(self):
+        self.update()
+        with open(self.tab_file, "rb") as tab:
+            data = tab.read()
+        with open(self.tab_file, "wb") as tab:
+            tab.write(data.replace(b"exonic", b"intronic", 1))
+        self.assertEqual(self.update()[1], 249)
+        self.assertSameOutput()
+
+        conditions = self.conditions[:2]
+        self.assertEqual(self.update(conditions=conditions)[1], 249)
+        self.assertSameOutput(conditions=conditions)
+
+        with open(self.output, "a") as output:
+            output.write("edited")
+        self.assertEqual(self.update(conditions=conditions)[1], 249)
+        self.assertSameOutput(conditions=conditions)
+
+    def test_new_floats_filter_it_all_again(self):
+        self.update()
+        # A Start with decimals, all of them print as floats now
+        self.append(self.lines[0].replace(b"\t10312878\t", b"\t1.5\t", 1))
+
+        self.assertEqual(self.update()[1], 250)
+        self.assertSameOutput()
+
+    def test_main(self):
+        args = ff.argparser(["--filepath", self.tab_file, "--json-filter",
+                             file_test("filter_sample.json"),
+                             "--incremental", self.output])
+
+        self.assertIsNone(ff.main(args))
+        self.assertSameOutput()
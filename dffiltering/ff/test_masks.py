@@ -0,0 +1,126 @@
+"""Test the masks module."""
+import io
+import json
+import os
+import shutil
+import tempfile
+from os.path import dirname, join
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+
+import ff
+import masks
+
+
+def file_test(filename):
+    """Return the path to filename in test_files."""
+    return join(dirname(__file__), "test_files", filename)
+
+
+class testMasks(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.tab = join(self.tmp, "8859.tab")
+        shutil.copy(file_test("8859.tab"), self.tab)
+        self.cache = join(self.tmp, "masks")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_dff(self, conditions, *extra):
+        """Return the output of dff and the conditions it evaluated."""
+        json_filter = join(self.tmp, "filter.json")
+        with open(json_filter, "w") as js:
+            json.dump(conditions, js)
+        args = ff.argparser(["--filepath", self.tab, "--json-filter",
+                             json_filter, "--mask-cache", self.cache] +
+                            list(extra))
+        out = io.BytesIO() if "--raw" in extra else io.StringIO()
+
+        with patch.object(ff.Filter, "step", autospec=True,
+                          side_effect=ff.Filter.step) as step:
+            result = ff.main(args)
+            if "--raw" in extra:
+                ff.write_raw(result, self.tab, out)
+            else:
+                ff.write(result, out)
+
+        return out.getvalue(), [_[0][2][3] for _ in step.call_args_list]
+
+    def test_normalize(self):
+        self.assertEqual(masks.normalize("ExAC_ALL <=   0.01 "),
+                         "ExAC_ALL <= 0.01")
+        self.assertEqual(masks.normalize('Ref ==  "A  G" |  Ref == "T"'),
+                         'Ref == "A  G" | Ref == "T"')
+        self.assertEqual(masks.normalize("Func contains exonic  SNV"),
+                         "Func contains exonic  SNV")
+
+    def test_pack(self):
+        for rows in [0, 1, 7, 8, 1001]:
+            mask = np.random.RandomState(rows).random_sample(rows) < 0.3
+
+            self.assertTrue(np.array_equal(
+                masks.unpack(masks.pack(mask)), mask))
+
+    def test_only_new_conditions_are_evaluated(self):
+        conditions = ["ExAC_ALL <= 0.1", "Func.refGene contains exonic"]
+        expected = ff.dffilter(conditions, ff.load(self.tab))
+
+        output, evaluated = self.run_dff(conditions)
+        self.assertEqual(len(evaluated), 2)
+        again, evaluated = self.run_dff(conditions)
+        self.assertEqual(evaluated, [])
+        self.assertEqual(again, output)
+
+        changed, evaluated = self.run_dff(
+            ["ExAC_ALL <=  0.1", "Func.refGene contains splicing"])
+        self.assertEqual(evaluated, ["Func_refGene contains splicing"])
+
+        out = io.StringIO()
+        ff.write(expected, out)
+        self.assertEqual(output, out.getvalue())
+
+    def test_raw_output_of_cached_masks_needs_no_load(self):
+        conditions = ["ExAC_ALL <= 0.1", "Func.refGene contains exonic"]
+        output, evaluated = self.run_dff(conditions, "--raw")
+
+        with patch.object(ff, "load", side_effect=AssertionError):
+            again, evaluated = self.run_dff(conditions, "--raw")
+
+        self.assertEqual(again, output)
+        self.assertEqual(evaluated, [])
+
+    def test_changed_files_are_evaluated_again(self):
+        conditions = ['Ref == "G"']
+        self.run_dff(conditions)
+        with open(self.tab, "rb") as tab:
+            lines = tab.readlines()
+        with open(self.tab, "wb") as tab:
+            tab.writelines(lines[:100])
+
+        output, evaluated = self.run_dff(conditions)
+
+        self.assertEqual(evaluated, conditions)
+
+    def test_least_recently_used_are_dropped(self):
+        cache = masks.MaskCache(self.cache, 0)
+        cache.save("source", {"A == 1": np.ones(10, dtype=bool)})
+        self.assertEqual(
+            [_ for _ in os.listdir(self.cache) if _.endswith(".mask")], [])
+
+        cache.budget = 10 ** 6
+        for condition in ["A == 1", "A == 2", "A == 3"]:
+            cache.save("source", {condition: np.ones(10, dtype=bool)})
+            old = os.path.getmtime(cache.path("source", "A == 1")) - 10
+            os.utime(cache.path("source", condition), (old, old))
+        # The first one is the most recently used
+        os.utime(cache.path("source", "A == 1"), None)
+        size = os.path.getsize(cache.path("source", "A == 1"))
+        cache.budget = size * 2
+        cache.evict()
+
+        self.assertIsNotNone(cache.get("source", "A == 1"))
+        self.assertEqual(len(
+            [_ for _ in os.listdir(self.cache) if _.endswith(".mask")]), 2)
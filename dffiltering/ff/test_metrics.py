@@ -0,0 +1,100 @@
+"""Test the metrics module."""
+import io
+import json
+import shutil
+import tempfile
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from os.path import dirname, join
+from unittest import TestCase
+
+import ff
+import metrics
+
+
+def file_test(filename):
+    """Return the path to filename in test_files."""
+    return join(dirname(__file__), "test_files", filename)
+
+
+class testMetrics(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        metrics.CURRENT = None
+        shutil.rmtree(self.tmp)
+
+    def test_stages_are_not_measured_by_default(self):
+        with metrics.stage("read"):
+            pass
+
+        self.assertIsNone(metrics.CURRENT)
+
+    def test_a_stage_within_another_pauses_it(self):
+        current = metrics.start()
+        with metrics.stage("output"):
+            time.sleep(0.05)
+            with metrics.stage("read"):
+                time.sleep(0.1)
+        for _ in metrics.iterate("read", [1, 2]):
+            pass
+
+        self.assertEqual(list(current.stages), ["output", "read"])
+        self.assertLess(current.stages["output"]["wall"], 0.09)
+        self.assertGreaterEqual(current.stages["read"]["wall"], 0.1)
+        # Two items and the end of the iteration
+        self.assertEqual(current.stages["read"]["calls"], 4)
+
+    def test_peak_memory_is_the_one_of_each_stage(self):
+        current = metrics.start()
+        with metrics.stage("big"):
+            big = bytearray(64 * 1024 * 1024)
+            big[::4096] = b"x" * len(big[::4096])
+            del big
+        with metrics.stage("small"):
+            pass
+        peaks = current.as_dict()
+
+        self.assertGreater(peaks["total"]["peak_mb"], 64)
+        if peaks["peak"] == "stage":
+            self.assertGreater(current.stages["big"]["peak_mb"],
+                               current.stages["small"]["peak_mb"] + 32)
+        else:
+            self.assertEqual(peaks["peak"], "cumulative")
+
+    def run_dff(self, *extra):
+        """Return the stderr of a run of dff with extra args."""
+        args = ff.argparser(
+            ["--filepath", file_test("8859.tab"),
+             "--json-filter", file_test("filter_sample.json")] +
+            list(extra))
+        stderr = io.StringIO()
+        with redirect_stdout(io.StringIO()), redirect_stderr(stderr):
+            ff.output(ff.main(args), args)
+
+        return stderr.getvalue()
+
+    def test_metrics_json(self):
+        metrics_json = join(self.tmp, "metrics.jsonl")
+        self.run_dff("--metrics-json", metrics_json)
+        self.run_dff("--metrics-json", metrics_json, "--chunksize", "100")
+
+        with open(metrics_json) as js:
+            runs = [json.loads(_) for _ in js]
+        self.assertEqual(len(runs), 2)
+        for run in runs:
+            self.assertEqual(
+                set(_["stage"] for _ in run["stages"]),
+                {"setup", "read", "numerize", "filter", "output"})
+            self.assertEqual(run["rows"], {"in": 249, "out": 7})
+            self.assertEqual(len(run["conditions"]), 4)
+            self.assertEqual(run["conditions"][0]["rows_in"], 249)
+            self.assertEqual(run["conditions"][-1]["rows_out"], 7)
+            self.assertIsNone(metrics.CURRENT)
+
+    def test_profile(self):
+        report = self.run_dff("--profile")
+
+        self.assertIn("numerize", report)
+        self.assertIn("Func_refGene contains exonic|splicing", report)
@@ -0,0 +1,69 @@
+"""Test the options module and the startup of dff."""
+import io
+import json
+import subprocess
+import sys
+from contextlib import redirect_stderr, redirect_stdout
+from os.path import abspath, dirname
+from unittest import TestCase
+
+import ff
+import options
+
+
+# Seconds dff -v and dff -h may take to run, Python startup apart
+STARTUP_BUDGET = 0.25
+
+STARTUP = """
+import json, sys
+from timeit import default_timer as timer
+start = timer()
+sys.argv = ["dff"] + {args!r}
+from dffiltering.command.run import run
+try:
+    run()
+except SystemExit:
+    pass
+print(json.dumps([timer() - start, "pandas" in sys.modules]))
+"""
+
+
+def startup(*args):
+    """Return the seconds dff with args took and if it imported pandas."""
+    process = subprocess.run(
+        [sys.executable, "-c", STARTUP.format(args=list(args))],
+        stdout=subprocess.PIPE, check=True,
+        cwd=dirname(dirname(dirname(abspath(__file__)))))
+
+    return json.loads(process.stdout.decode().splitlines()[-1])
+
+
+class testStartup(TestCase):
+    def test_version_and_help_are_fast(self):
+        for args in [["-v"], ["--version"], ["-h"], []]:
+            seconds, pandas = startup(*args)
+            self.assertFalse(pandas, args)
+            self.assertLess(seconds, STARTUP_BUDGET, args)
+
+    def test_ff_parses_the_same_options(self):
+        self.assertIs(ff.argparser, options.argparser)
+
+    def test_main_stops_after_the_version(self):
+        args = options.argparser(["-v", "--filepath", "missing.tab"])
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertIsNone(ff.main(args))
+
+        self.assertTrue(out.getvalue().strip())
+
+    def test_refused_combinations_exit_with_an_error(self):
+        for args in [["--filepath", "-", "--raw"],
+                     ["--filepath", "a.tab", "--raw", "--output-columns",
+                      "Chr"],
+                     ["--filepath", "-", "--incremental", "out.tsv"],
+                     ["--filepath", "a.tab", "--incremental", "out.tsv",
+                      "--json-filter", "a.json", "--json-filter", "b.json"]]:
+            with redirect_stderr(io.StringIO()), \
+                    self.assertRaises(SystemExit) as refused:
+                options.argparser(args)
+            self.assertEqual(refused.exception.code, 2, args)
@@ -0,0 +1,135 @@
+"""Test the reader module."""
+import gzip
+import io
+import shutil
+import tempfile
+from os.path import dirname, join
+from unittest import TestCase
+
+import pandas as pd
+
+import ff
+import reader
+from test_shard import bgzip
+
+
+def file_test(filename):
+    """Return the path to filename in test_files."""
+    return join(dirname(__file__), "test_files", filename)
+
+
+class testReader(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        with open(file_test("8859.tab"), "rb") as tab:
+            self.data = tab.read()
+        self.chunk_size = reader.CHUNK_SIZE
+        # Many chunks even for the small test files
+        reader.CHUNK_SIZE = 4096
+
+    def tearDown(self):
+        reader.CHUNK_SIZE = self.chunk_size
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, data, compress=None):
+        """Return the path of the file name written with data."""
+        path = join(self.tmp, name)
+        if compress == "bgzf":
+            bgzip(data, path)
+        else:
+            with open(path, "wb") as tab:
+                tab.write(gzip.compress(data) if compress else data)
+        return path
+
+    def test_chunks_are_the_uncompressed_data(self):
+        half = len(self.data) // 2
+        for path in [
+                self.write("plain.tab", self.data),
+                self.write("plain.tab.gz", self.data, "gzip"),
+                self.write("bgzf.tab.gz", self.data, "bgzf")]:
+            self.assertEqual(b"".join(reader.chunks(path)), self.data, path)
+
+        # gzip files can be many gzips one after another
+        path = join(self.tmp, "members.tab.gz")
+        with open(path, "wb") as tab:
+            tab.write(gzip.compress(self.data[:half]) +
+                      gzip.compress(self.data[half:]))
+        self.assertEqual(b"".join(reader.chunks(path)), self.data)
+
+    def test_bgzf_is_inflated_by_threads(self):
+        path = self.write("bgzf.tab.gz", self.data, "bgzf")
+
+        self.assertTrue(reader.is_bgzf(path))
+        self.assertFalse(reader.is_bgzf(
+            self.write("plain.tab.gz", self.data, "gzip")))
+        self.assertEqual(
+            b"".join(reader.bgzf_chunks(path, threads=3)), self.data)
+
+    def test_stopped_reading_stops_the_thread(self):
+        chunks = reader.gzip_chunks(
+            self.write("plain.tab.gz", self.data * 10, "gzip"))
+        next(chunks)
+        chunks.close()
+
+    def test_text_switches_to_latin(self):
+        data = b"a\tb\ncaf\xe9\t1\n"
+        with reader.open_text(self.write("latin.tab.gz", data, "gzip")) \
+                as text:
+            self.assertEqual(text.read(), data.decode("iso-8859-1"))
+            self.assertFalse(text.lossy)
+
+        data = b"a\tb\ncaf\xc3\xa9\t1\n" * 1000 + b"caf\xe9\t2\n"
+        with reader.open_text(self.write("lossy.tab", data)) as text:
+            self.assertEqual(text.readline(), u"a\tb\n")
+            text.read()
+            self.assertTrue(text.lossy)
+
+    def test_read_table_decodes_as_a_whole(self):
+        for data in [b"a\tb\ncaf\xe9\t1\n",
+                     b"a\tb\ncaf\xc3\xa9\t1\n",
+                     b"a\tb\ncaf\xc3\xa9\t1\n" * 1000 + b"caf\xe9\t2\n"]:
+            path = self.write("encoded.tab.gz", data, "gzip")
+            encoding = reader.encoding(path)
+
+            self.assertTrue(reader.read_table(path, dtype=object).equals(
+                pd.read_table(path, dtype=object, encoding=encoding)))
+
+    def test_lossy_streams_are_decoded_again(self):
+        data = b"a\tb\ncaf\xc3\xa9\t1\n" * 1000 + b"caf\xe9\t2\n"
+        expected = pd.read_table(io.BytesIO(data), dtype=object,
+                                 encoding="iso-8859-1")
+
+        for stream in [io.BytesIO(data), io.BytesIO(gzip.compress(data))]:
+            self.assertTrue(reader.read_table(stream, dtype=object).equals(
+                expected))
+
+        with self.assertLogs("ff", level="WARNING"):
+            list(reader.read_chunks(io.BytesIO(data), 100, dtype=object))
+
+    def test_load_is_the_same_from_any_compression(self):
+        df = ff.load(self.write("plain.tab", self.data))
+
+        self.assertTrue(ff.load(
+            self.write("plain.tab.gz", self.data, "gzip")).equals(df))
+        self.assertTrue(ff.load(
+            self.write("bgzf.tab.gz", self.data, "bgzf")).equals(df))
+
+    def test_streams_are_uncompressed_once(self):
+        half = len(self.data) // 2
+        for data in [self.data, gzip.compress(self.data),
+                     gzip.compress(self.data[:half]) +
+                     gzip.compress(self.data[half:])]:
+            stream = io.BytesIO(data)
+            with reader.open_binary(stream) as binary:
+                self.assertEqual(binary.read(), self.data)
+            # The stream itself is left open
+            self.assertFalse(stream.closed)
+
+    def test_load_from_a_stream_is_the_same(self):
+        df = ff.load(file_test("8859.tab"))
+
+        self.assertTrue(ff.load(io.BytesIO(self.data)).equals(df))
+        self.assertTrue(ff.load(io.BytesIO(gzip.compress(self.data))).equals(
+            df))
+        self.assertTrue(ff.load(io.StringIO(
+            self.data.decode("iso-8859-1"))).equals(df))
@@ -0,0 +1,113 @@
+"""Test the region module."""
+import os
+import shutil
+import tempfile
+from os.path import dirname, join
+from unittest import TestCase
+
+import ff
+import region
+from test_shard import bgzip
+
+
+def file_test(filename):
+    """Return the path to filename in test_files."""
+    return join(dirname(__file__), "test_files", filename)
+
+
+class testRegion(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        with open(file_test("8859.tab"), "rb") as tab:
+            header, data = tab.read().split(b"\n", 1)
+        # Sorted by Start, spread in two chromosomes
+        lines = sorted((_ for _ in data.split(b"\n") if _),
+                       key=lambda line: int(line.split(b"\t")[1]))
+        lines = [b"chr1" + _[_.index(b"\t"):] for _ in lines[::2]] + \
+            lines[1::2]
+        self.data = header + b"\n" + b"\n".join(lines) + b"\n"
+        self.tab_file = join(self.tmp, "sorted.tab")
+        with open(self.tab_file, "wb") as tab:
+            tab.write(self.data)
+        self.df = ff.load(self.tab_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def assertRegions(self, filepath, regions):
+        df = region.load_regions(filepath, regions)
+        expected = self.df[region.overlaps(self.df, regions)]
+
+        self.assertEqual(list(df.index), list(expected.index))
+        self.assertEqual(list(df["Ref"]), list(expected["Ref"]))
+        return df
+
+    def test_parse_region(self):
+        self.assertEqual(region.parse_region("chr12:133,252,000-133260000"),
+                         ("chr12", 133252000, 133260000))
+        self.assertEqual(region.parse_region("chr12:100"),
+                         ("chr12", 100, float("inf")))
+        self.assertEqual(region.parse_region("chr12"),
+                         ("chr12", 1, float("inf")))
+        with self.assertRaises(ValueError):
+            region.parse_region("chr12:a-b")
+
+    def test_read_bed(self):
+        bed = join(self.tmp, "panel.bed")
+        with open(bed, "w") as panel:
+            panel.write("track name=panel\n# c\nchr1\t99\t200\tA\n\n")
+
+        self.assertEqual(region.read_bed(bed), [("chr1", 100, 200)])
+
+    def test_rows_overlapping_regions(self):
+        df = self.assertRegions(self.tab_file, [("chr1", 11000000, 12000000)])
+        self.assertEqual(set(df["Chr"]), {"chr1"})
+        self.assertTrue(len(df))
+
+        self.assertRegions(self.tab_file, [("chr12", 40000000, 41000000),
+                                           ("chr1", 11000000, 12000000),
+                                           ("12", 40500000, 40700000)])
+        self.assertRegions(self.tab_file, [("chr12", 12006544, 12006544)])
+        self.assertEqual(len(self.assertRegions(
+            self.tab_file, [("chrX", 1, float("inf"))])), 0)
+
+    def test_small_windows(self):
+        window = region.WINDOW
+        region.WINDOW = 1000
+        try:
+            for start in range(10000000, 50000000, 1000000):
+                self.assertRegions(self.tab_file, [
+                    ("chr1", start, start + 500000),
+                    ("chr12", start, start + 500000)])
+        finally:
+            region.WINDOW = window
+
+    def test_bgzf(self):
+        bgzf = join(self.tmp, "sorted.tab.gz")
+        bgzip(self.data, bgzf, 4096)
+
+        self.assertTrue(region.load_index(bgzf)["sorted"])
+        self.assertRegions(bgzf, [("chr12", 40000000, 41000000),
+                                  ("chr1", 11000000, 12000000)])
+
+    def test_index_is_reused_until_the_file_changes(self):
+        region.load_regions(self.tab_file, [("chr1", 1, 2)])
+        index = region.index_path(self.tab_file)
+        self.assertTrue(os.path.exists(index))
+
+        with open(self.tab_file, "ab") as tab:
+            tab.write(self.data.split(b"\n")[1] + b"\n")
+        # Now unsorted, read in full
+        self.df = ff.load(self.tab_file)
+        self.assertFalse(region.load_index(self.tab_file)["sorted"])
+        self.assertRegions(self.tab_file, [("chr1", 10000000, 12000000)])
+
+    def test_filter_file_with_regions(self):
+        args = ff.argparser(["--filepath", self.tab_file,
+                             "--region", "chr12:40000000-41000000",
+                             "--output-columns", "Chr,Start,Ref"])
+        df = ff.filter_file(self.tab_file, ff.Filter(['Ref == "G"']), args)
+
+        self.assertEqual(list(df.columns), ["Chr", "Start", "Ref"])
+        self.assertEqual(set(df["Ref"]), {"G"})
+        self.assertTrue((df["Start"] >= 40000000).all())
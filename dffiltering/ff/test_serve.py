@@ -0,0 +1,216 @@
+"""Test the serve and client modules."""
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from contextlib import redirect_stdout
+from os.path import dirname, join
+from unittest import TestCase
+
+import client
+import ff
+import serve
+
+
+def file_test(filename):
+    """Return the path to filename in test_files."""
+    return join(dirname(__file__), "test_files", filename)
+
+
+class testServe(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        for filename in ["8859.tab", "DOT.column.tab"]:
+            shutil.copy(file_test(filename), self.tmp)
+        self.socket = join(self.tmp, "dff.sock")
+        self.server = serve.server(
+            serve.argparser(["--socket", self.socket]),
+            serve.Tables(64 * 1024 * 1024))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tmp)
+
+    def client(self, *args):
+        """Return the exit code and output of the client with args."""
+        out = io.BytesIO()
+        code = client.run(["--socket", self.socket] + list(args), out)
+        return code, out.getvalue()
+
+    def expected(self, *args):
+        """Return the output of dff with args."""
+        args = ff.argparser(list(args))
+        out = io.StringIO()
+        ff.write(ff.main(args), out)
+        return out.getvalue().encode("utf-8")
+
+    def test_output_is_the_one_of_dff(self):
+        args = ["--filepath", join(self.tmp, "8859.tab"),
+                "--json-filter", file_test("filter_sample.json")]
+
+        self.assertEqual(self.client(*args), (0, self.expected(*args)))
+        # From the table kept this time
+        self.assertEqual(self.client(*args), (0, self.expected(*args)))
+        self.assertEqual(self.server.tables.hits, 1)
+        self.assertEqual(self.server.tables.misses, 1)
+
+    def test_other_modes_and_raw(self):
+        args = ["--filepath", join(self.tmp, "8859.tab"),
+                "--json-filter", file_test("filter_sample.json")]
+        self.assertEqual(self.client(*(args + ["--chunksize", "50"])),
+                         (0, self.expected(*(args + ["--chunksize", "50"]))))
+
+        code, output = self.client(*(args + ["--raw"]))
+        expected = io.BytesIO()
+        ff.write_raw(ff.main(ff.argparser(args)), args[1], expected)
+        self.assertEqual((code, output), (0, expected.getvalue()))
+
+    def test_summaries(self):
+        for extra in [["--summary"], ["--group-by", "Func.refGene",
+                                      "--aggregate", "ExAC_ALL"]]:
+            args = ["--filepath", join(self.tmp, "8859.tab"),
+                    "--json-filter", file_test("filter_sample.json")] + extra
+            expected = io.StringIO()
+            with redirect_stdout(expected):
+                ff.output(ff.main(ff.argparser(args)), ff.argparser(args))
+
+            self.assertEqual(self.client(*args),
+                             (0, expected.getvalue().encode("utf-8")))
+
+    def test_relative_paths_are_the_ones_of_the_client(self):
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            code, output = self.client("--filepath", "DOT.column.tab")
+        finally:
+            os.chdir(cwd)
+
+        self.assertEqual(code, 0)
+        self.assertEqual(output, self.expected(
+            "--filepath", join(self.tmp, "DOT.column.tab")))
+
+    def test_many_filter_sets_are_written_to_their_files(self):
+        shutil.copy(file_test("slashb.json"), self.tmp)
+        args = ["--filepath", "DOT.column.tab",
+                "--json-filter", "sample=" + file_test("filter_sample.json"),
+                "--json-filter", "slashb.json", "--output", "{filter}.tsv"]
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            self.assertEqual(self.client(*args), (0, b""))
+        finally:
+            os.chdir(cwd)
+
+        for name, json_filter in [("sample", "filter_sample.json"),
+                                  ("slashb", "slashb.json")]:
+            with open(join(self.tmp, name + ".tsv"), "rb") as out:
+                self.assertEqual(out.read(), self.expected(
+                    "--filepath", join(self.tmp, "DOT.column.tab"),
+                    "--json-filter", file_test(json_filter)))
+
+    def test_incremental_output_is_written_relative_to_the_client(self):
+        args = ["--filepath", "8859.tab",
+                "--json-filter", file_test("filter_sample.json"),
+                "--incremental", "filtered.tsv"]
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            self.assertEqual(self.client(*args), (0, b""))
+            self.assertEqual(self.client(*args), (0, b""))
+        finally:
+            os.chdir(cwd)
+
+        with open(join(self.tmp, "filtered.tsv"), "rb") as out:
+            self.assertEqual(out.read(), self.expected(
+                "--filepath", join(self.tmp, "8859.tab"),
+                "--json-filter", file_test("filter_sample.json")))
+        self.assertTrue(os.path.exists(join(self.tmp, "filtered.tsv.dffck")))
+
+    def test_errors(self):
+        self.assertEqual(self.client("--filepath", "missing.tab")[0], 1)
+        self.assertEqual(self.client("--chunksize", "a")[0], 1)
+        self.assertEqual(self.client("--json-filter", "f.json")[0], 1)
+        for flags in [["--profile"], ["--explain"],
+                      ["--metrics-json", join(self.tmp, "m.json")]]:
+            self.assertEqual(self.client(
+                "--filepath", join(self.tmp, "8859.tab"), *flags)[0], 1)
+        self.assertFalse(os.path.exists(join(self.tmp, "m.json")))
+
+    def test_numeric_columns_are_only_of_their_request(self):
+        args = ["--filepath", join(self.tmp, "8859.tab"),
+                "--json-filter", file_test("filter_sample.json")]
+        numeric = list(ff.COLUMN_TYPES["numeric"])
+
+        self.assertEqual(self.client(*(args + ["--numeric-cols", "Ref"]))[0],
+                         0)
+        self.assertEqual(ff.COLUMN_TYPES["numeric"], numeric)
+        self.assertEqual(ff.known_numeric(), numeric)
+        self.assertEqual(self.client(*args), (0, self.expected(*args)))
+
+    def test_tcp_clients_need_the_token(self):
+        listening = socket.socket()
+        listening.bind(("127.0.0.1", 0))
+        port = listening.getsockname()[1]
+        listening.close()
+
+        tokens, client.TOKENS = client.TOKENS, join(self.tmp, "tokens")
+        try:
+            server = serve.server(serve.argparser(["--port", str(port)]),
+                                  serve.Tables(64 * 1024 * 1024))
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                self.assertEqual(
+                    os.stat(client.token_path(port)).st_mode & 0o777, 0o600)
+                self.assertEqual(client.run(
+                    ["--port", str(port), "--stats"], io.BytesIO()), 0)
+
+                with open(client.token_path(port), "w") as token:
+                    token.write("wrong")
+                self.assertEqual(client.run(
+                    ["--port", str(port), "--stats"], io.BytesIO()), 1)
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+        finally:
+            client.TOKENS = tokens
+
+    def test_socket_is_only_for_its_user(self):
+        self.assertEqual(os.stat(self.socket).st_mode & 0o777, 0o600)
+
+    def test_least_recently_used_tables_are_dropped(self):
+        self.server.tables.budget = 1
+        self.client("--filepath", join(self.tmp, "8859.tab"))
+        self.assertEqual(self.server.tables.stats()["tables"], [])
+
+        shutil.copy(file_test("NA_fail.tab"), self.tmp)
+        paths = [join(self.tmp, _)
+                 for _ in ["8859.tab", "DOT.column.tab", "NA_fail.tab"]]
+        sizes = serve.Tables(10 ** 9)
+        for path in paths:
+            sizes.get(path)
+        sizes = [_[1] for _ in sizes.tables.values()]
+
+        tables = serve.Tables(sizes[0] + sizes[2])
+        for path in [paths[0], paths[1], paths[0], paths[2]]:
+            tables.get(path)
+        # The second was the least recently used
+        self.assertEqual([_["path"] for _ in tables.stats()["tables"]],
+                         [paths[0], paths[2]])
+        self.assertEqual(tables.size, sizes[0] + sizes[2])
+
+    def test_stats(self):
+        self.client("--filepath", join(self.tmp, "8859.tab"))
+        code, output = self.client("--stats")
+
+        stats = json.loads(output.decode("utf-8"))
+        self.assertEqual([_["path"] for _ in stats["tables"]],
+                         [join(self.tmp, "8859.tab")])
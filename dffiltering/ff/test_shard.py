@@ -0,0 +1,108 @@
+"""Test the shard module."""
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from os.path import dirname, join
+from unittest import TestCase
+
+import ff
+import shard
+
+
+def file_test(filename):
+    """Return the path to filename in test_files."""
+    return join(dirname(__file__), "test_files", filename)
+
+
+def bgzip(data, filepath, block_size=4096):
+    """Write data to filepath as BGZF blocks of block_size bytes."""
+    with open(filepath, "wb") as bgzf:
+        for start in range(0, len(data), block_size) or [0]:
+            block = data[start:start + block_size]
+            compress = zlib.compressobj(6, zlib.DEFLATED, -15)
+            cdata = compress.compress(block) + compress.flush()
+            bgzf.write(b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC"
+                       + struct.pack("<HH", 2, len(cdata) + 25) + cdata +
+                       struct.pack("<II", zlib.crc32(block) & 0xffffffff,
+                                   len(block)))
+        if data:
+            # The empty block at the end of every BGZF file
+            bgzip(b"", filepath + ".eof")
+            with open(filepath + ".eof", "rb") as eof:
+                bgzf.write(eof.read())
+            os.remove(filepath + ".eof")
+
+
+class testShards(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.tab_file = join(self.tmp, "8859.tab")
+        shutil.copy(file_test("8859.tab"), self.tab_file)
+        with open(self.tab_file, "rb") as tab:
+            self.data = tab.read()
+        bgzip(self.data, self.tab_file + ".gz")
+        self.conditions = ["ExAC_ALL <= 0.1",
+                           "Func.refGene contains exonic|splicing"]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_shards_hold_every_line_once(self):
+        header = len(self.data.splitlines(True)[0])
+        for filepath in [self.tab_file, self.tab_file + ".gz"]:
+            split, blocks = shard.shards(filepath, 3000)
+
+            self.assertEqual(
+                b"".join(shard.read_shard(filepath, start, end, blocks)
+                         for start, end in split),
+                self.data[header:])
+
+    def test_bgzf_blocks(self):
+        blocks = shard.bgzf_blocks(self.tab_file + ".gz")
+
+        self.assertEqual(blocks[1][1], 4096)
+        self.assertEqual(blocks[-1][1], len(self.data))
+        self.assertIsNone(shard.bgzf_blocks(file_test("8859.tab.gz")))
+
+    def test_parallel_filter_is_the_same(self):
+        df = ff.dffilter(self.conditions, ff.load(self.tab_file))
+
+        for filepath in [self.tab_file, self.tab_file + ".gz"]:
+            parallel = shard.filter_parallel(
+                filepath, ff.Filter(self.conditions), 2, 5000)
+
+            self.assertEqual(list(parallel.index), list(df.index))
+            self.assertEqual(parallel.to_csv(sep="\t"),
+                             df.to_csv(sep="\t"))
+
+    def test_shard_with_only_missing_values_keeps_int_columns(self):
+        with open(self.tab_file, "w") as tab:
+            tab.write("Chr\tCG46\n" + "chr1\t146\n" * 20 +
+                      "chr1\t.\n" * 10 + "chr1\t\n" * 10)
+
+        parallel = shard.filter_parallel(
+            self.tab_file, ff.Filter(["Chr contains chr"]), 2, 60)
+
+        self.assertEqual(parallel.to_csv(), ff.load(self.tab_file).to_csv())
+
+    def test_shards_of_mixed_encodings(self):
+        with open(self.tab_file, "wb") as tab:
+            tab.write(u"Chr\tGene\nchr1\tcaf\u00e9\n".encode("utf-8") +
+                      b"chr1\tgene\n" * 20 + b"chr1\tcaf\xe9\n")
+
+        parallel = shard.filter_parallel(
+            self.tab_file, ff.Filter(["Chr contains chr"]), 2, 60)
+
+        self.assertEqual(parallel.to_csv(), ff.load(self.tab_file).to_csv())
+
+    def test_parallel_output_columns(self):
+        args = ff.argparser(["--filepath", self.tab_file, "--json-filter",
+                             file_test("filter_sample.json"),
+                             "--output-columns", "Chr,Start"])
+        expected = ff.main(args)
+        args.parallel = 2
+        args.shard_size = 5000
+
+        self.assertEqual(ff.main(args).to_csv(), expected.to_csv())
@@ -0,0 +1,74 @@
+"""Test the summary module."""
+import io
+import json
+from contextlib import redirect_stdout
+from os.path import dirname, join
+from unittest import TestCase
+
+import pandas as pd
+
+import ff
+import summary
+
+
+def file_test(filename):
+    """Return the path to filename in test_files."""
+    return join(dirname(__file__), "test_files", filename)
+
+
+class testSummary(TestCase):
+    def setUp(self):
+        with open(file_test("filter_sample.json")) as js:
+            self.conditions = json.load(js)[:2]
+        self.df = ff.dffilter(self.conditions, ff.load(file_test("8859.tab")))
+
+    def run_dff(self, *extra):
+        """Return the output of dff with extra args, as a DF."""
+        args = ff.argparser(["--filepath", file_test("8859.tab")] +
+                            list(extra))
+        out = io.StringIO()
+        with redirect_stdout(out):
+            ff.output(ff.main(args), args)
+
+        return pd.read_table(io.StringIO(out.getvalue()))
+
+    def test_the_summary_of_parts_is_that_of_the_whole(self):
+        group_by = ["Func.refGene", "ExonicFunc.refGene"]
+        parts = (self.df.iloc[_:_ + 7] for _ in range(0, len(self.df), 7))
+        table = summary.summarize(parts, group_by, ["ExAC_ALL"])
+
+        expected = ff.decategorize(self.df).fillna(
+            {"ExonicFunc.refGene": ""}).groupby(
+                group_by, sort=False)["ExAC_ALL"]
+        expected = expected.agg(["size", "min", "max", "mean"])
+        expected = expected.sort_values("size", ascending=False,
+                                        kind="mergesort")
+        self.assertEqual(list(table.columns), group_by + [
+            "count", "ExAC_ALL_min", "ExAC_ALL_max", "ExAC_ALL_mean"])
+        self.assertEqual(
+            [tuple(_) for _ in table[group_by].values], list(expected.index))
+        self.assertEqual(list(table["count"]), list(expected["size"]))
+        self.assertEqual(list(table["ExAC_ALL_max"]), list(expected["max"]))
+        for mean, expected_mean in zip(table["ExAC_ALL_mean"],
+                                       expected["mean"]):
+            self.assertAlmostEqual(mean, expected_mean)
+
+    def test_nothing_passes(self):
+        table = summary.summarize(self.df.iloc[:0], None, ["ExAC_ALL"])
+
+        self.assertEqual(list(table["count"]), [0])
+        self.assertTrue(table["ExAC_ALL_mean"].isnull().all())
+
+    def test_dff_summary(self):
+        table = self.run_dff("--json-filter", file_test("filter_sample.json"),
+                             "--summary")
+        self.assertEqual(list(table["count"]), [7])
+
+        table = self.run_dff(
+            "--json-filter", "all=" + file_test("filter_sample.json"),
+            "--json-filter", file_test("filter_sample.json"),
+            "--group-by", "Func.refGene", "--chunksize", "50")
+        self.assertEqual(list(table.columns),
+                         ["filter", "Func.refGene", "count"])
+        self.assertEqual(table.groupby("filter")["count"].sum().to_dict(),
+                         {"all": 7, "filter_sample": 7})
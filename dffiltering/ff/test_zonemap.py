@@ -0,0 +1,126 @@
+"""Test the zonemap module."""
+import ast
+import gzip
+import io
+import shutil
+import tempfile
+from os.path import dirname, exists, join
+from unittest import TestCase
+from unittest.mock import patch
+
+import ff
+import reader
+import zonemap
+from test_shard import bgzip
+
+
+def file_test(filename):
+    """Return the path to filename in test_files."""
+    return join(dirname(__file__), "test_files", filename)
+
+
+class testZoneMap(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.tab_file = join(self.tmp, "8859.tab")
+        shutil.copy(file_test("8859.tab"), self.tab_file)
+        self.block = patch.object(zonemap, "BLOCK", 40)
+        self.block.start()
+
+    def tearDown(self):
+        self.block.stop()
+        shutil.rmtree(self.tmp)
+
+    def needed(self, filepath, conditions):
+        """Return the number of blocks needed for the conditions."""
+        header = ff.read_header(filepath)
+        zones = zonemap.load_zones(filepath, [
+            _ for _ in ff.COLUMN_TYPES["numeric"] if _ in header])
+        renamed, steps = ff.Filter(conditions).plan(header)
+
+        return len(zonemap.needed(zones, steps, dict(zip(renamed, header))))
+
+    def assertSameOutput(self, filepath, conditions, chunksize=None):
+        expected, output = io.StringIO(), io.StringIO()
+        ff.write(ff.dffilter(conditions, ff.load(filepath)), expected)
+        filters = ff.Filter(conditions)
+        df = zonemap.read_zones(filepath, filters, chunksize)
+        ff.write(filters.apply(df) if chunksize is None else
+                 (filters.apply(_) for _ in df), output)
+
+        self.assertEqual(output.getvalue(), expected.getvalue())
+
+    def test_blocks_out_of_range_are_skipped(self):
+        # The Start column is sorted in the first blocks
+        self.assertEqual(self.needed(self.tab_file, ["Start <= 10312914"]),
+                         1)
+        self.assertEqual(self.needed(self.tab_file, ["Start == 10312914"]),
+                         1)
+        self.assertEqual(self.needed(self.tab_file, ["Start > 999999999"]),
+                         0)
+        self.assertEqual(
+            self.needed(self.tab_file, ["Start > 999999999 | Start < 100"]),
+            0)
+        self.assertEqual(self.needed(self.tab_file, ["ExAC_ALL <= 0.1"]), 7)
+        self.assertTrue(exists(zonemap.zone_path(self.tab_file)))
+
+    def test_other_conditions_skip_nothing(self):
+        for condition in ["Start != 10312914", "~(Start > 100)",
+                          "Func.refGene contains exonic",
+                          'Chr == "chr12"', "Start > End"]:
+            self.assertEqual(self.needed(self.tab_file, [condition]), 7)
+
+    def test_the_output_is_the_same(self):
+        for conditions in [["vardb_gatk <= 20", "ExAC_ALL <= 0.1",
+                            "Func.refGene contains exonic|splicing"],
+                           ["Start >= 10312900", "Start < 10400000"],
+                           ["Start > 999999999"],
+                           ["ExAC_ALL <= 0.01 | ExAC_ALL >= 0.9"]]:
+            self.assertSameOutput(self.tab_file, conditions)
+            self.assertSameOutput(self.tab_file, conditions, 30)
+
+    def test_gzipped_files(self):
+        with open(self.tab_file, "rb") as tab:
+            data = tab.read()
+        bgzf = join(self.tmp, "8859.tab.gz")
+        bgzip(data, bgzf)
+        gz = join(self.tmp, "other.tab.gz")
+        with gzip.open(gz, "wb") as gz_file:
+            gz_file.write(data)
+
+        for filepath in [bgzf, gz]:
+            self.assertSameOutput(filepath, ["Start >= 10312900",
+                                             "Start < 10400000"])
+
+    def test_changed_files_are_mapped_again(self):
+        self.assertEqual(self.needed(self.tab_file, ["Start > 999999999"]),
+                         0)
+        with open(self.tab_file, "rb") as tab:
+            lines = tab.readlines()
+        lines[1] = lines[1].replace(b"10312878", b"1000000000")
+        with open(self.tab_file, "wb") as tab:
+            tab.writelines(lines)
+
+        self.assertEqual(self.needed(self.tab_file, ["Start > 999999999"]),
+                         1)
+        self.assertSameOutput(self.tab_file, ["Start > 999999999"])
+
+    def test_encoding_is_found_in_the_same_scan(self):
+        utf8 = join(self.tmp, "utf8.tab")
+        with open(self.tab_file, "rb") as tab:
+            data = tab.read().decode("iso-8859-1").encode("utf-8")
+        with open(utf8, "wb") as tab:
+            tab.write(data)
+
+        for filepath in [self.tab_file, utf8]:
+            with patch.object(reader, "encoding") as encoding:
+                zones = zonemap.build(filepath, ["Start"])
+            encoding.assert_not_called()
+            self.assertEqual(zones["encoding"], reader.encoding(filepath))
+            self.assertSameOutput(filepath, ["Start >= 10312900"])
+
+    def test_numbers_of_the_conditions(self):
+        for text, value in [("10", 10), ("-0.5", -0.5), ("+3", 3),
+                            ("True", None), ("'10'", None), ("x", None)]:
+            self.assertEqual(
+                zonemap.number(ast.parse(text, mode="eval").body), value)
@@ -0,0 +1,351 @@
+"""Zone maps of TSVs to skip the blocks of rows no condition can pass.
+
+The TSV is split in blocks of BLOCK rows, and the zone map keeps the
+offset and row of each block and the min, max and count of nulls (NaN once
+typecasted) of each of its numeric columns. It lives next to the TSV (as
+file.tsv.dffzone), built on the first scan and rebuilt whenever the TSV
+changes.
+
+A condition comparing a numeric column to a number with <, <=, >, >= or ==
+(and any & and | of them) can't pass any row of a block whose range is all
+out of the compared one. Those blocks are not even parsed. The numeric
+columns of the rows read are typecasted as the whole file would be, so the
+output is the same a full load gives. Gzipped files can only be read from
+an offset if they are BGZF (made by bgzip), the other ones are decompressed
+in full but only the lines of the blocks needed are parsed.
+
+"""
+import ast
+import codecs
+import io
+import json
+import logging
+import operator
+import os
+import sys
+import tokenize
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import ff
+    from . import reader
+    from .shard import seek
+except (SystemError, ImportError):
+    import ff
+    import reader
+    from shard import seek
+
+
+logger = logging.getLogger("ff")
+
+SUFFIX = ".dffzone"
+# Rows of each block, and blocks typecasted at once to build the zone maps
+BLOCK = 1000
+PARSE = 100
+
+# The operators that compare a column to a number, and the same ones with
+#  the number on the left.
+COMPARISONS = {ast.Lt: operator.lt, ast.LtE: operator.le,
+               ast.Gt: operator.gt, ast.GtE: operator.ge,
+               ast.Eq: operator.eq}
+FLIPPED = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt,
+           ast.GtE: ast.LtE, ast.Eq: ast.Eq}
+# As in pandas eval, & and | are the and and or of the comparisons
+BOOLEANS = {"&": " and ", "|": " or ", "~": " not "}
+# The node of a literal number and its attribute with the number
+if sys.version_info < (3, 8):
+    NUMBER, NUMBER_VALUE = ast.Num, "n"
+else:
+    NUMBER, NUMBER_VALUE = ast.Constant, "value"
+
+
+def zone_path(filepath):
+    """Return the path of the zone map of filepath."""
+    return filepath + SUFFIX
+
+
+def key(filepath, numeric_columns):
+    """Return the key that makes a zone map of filepath valid."""
+    stat = os.stat(filepath)
+
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "block": BLOCK,
+            "columns": sorted(numeric_columns)}
+
+
+def stats(chunk, numeric_columns):
+    """Return the stats of each block of BLOCK rows of the chunk.
+
+    The stats of a block are the [min, max, nulls] of each numeric column,
+    min and max None when all the values are null.
+
+    """
+    values = chunk[numeric_columns].values.astype(float)
+    starts = np.arange(0, len(values), BLOCK)
+    nulls = np.add.reduceat(np.isnan(values), starts)
+    lows = np.fmin.reduceat(values, starts)
+    highs = np.fmax.reduceat(values, starts)
+
+    return [dict(
+        (column, [None, None, int(null)] if np.isnan(low) else
+         [low.item(), high.item(), int(null)])
+        for column, low, high, null in zip(
+            numeric_columns, *block)) for block in zip(lows, highs, nulls)]
+
+
+def build(filepath, numeric_columns):
+    """Return the zone map of filepath, as stored in its zone map file.
+
+    Each block has its offset, row, rows and the stats of its numeric
+    columns. The end is the offset after the last line, and the traits are
+    those of numerize over the whole file.
+
+    """
+    blocks = reader.bgzf_blocks(filepath) \
+        if filepath.endswith(".gz") else None
+    zones = []
+
+    # The encoding is found in the same pass, as reader.encoding does
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    file_encoding = "utf-8"
+    with reader.open_binary(filepath) as stream:
+        offset = 0
+        row = -1
+        for line in stream:
+            if file_encoding == "utf-8":
+                try:
+                    decoder.decode(line)
+                except UnicodeDecodeError:
+                    file_encoding = "iso-8859-1"
+            if row < 0:
+                # The header
+                row = 0
+            elif not reader.blank(line):
+                # The parser skips the blank lines, they are no row
+                if not row % BLOCK:
+                    zones.append({"offset": offset, "row": row,
+                                  "rows": 0, "stats": {}})
+                zones[-1]["rows"] += 1
+                row += 1
+            offset += len(line)
+        if file_encoding == "utf-8":
+            try:
+                decoder.decode(b"", final=True)
+            except UnicodeDecodeError:
+                file_encoding = "iso-8859-1"
+
+    traits = {}
+    if numeric_columns:
+        # Typecasted in big chunks, each distinct value is cleaned once
+        block_stats = []
+        with reader.open_binary(filepath) as stream:
+            for chunk in pd.read_table(
+                    stream, dtype=object, chunksize=BLOCK * PARSE,
+                    encoding=file_encoding, usecols=numeric_columns):
+                block_stats.extend(stats(
+                    ff.numerize(chunk, numeric_columns, traits),
+                    numeric_columns))
+        for zone, zone_stats in zip(zones, block_stats):
+            zone["stats"] = zone_stats
+
+    return {"key": key(filepath, numeric_columns), "encoding": file_encoding,
+            "blocks": blocks, "end": offset, "traits": traits,
+            "zones": zones}
+
+
+def load_zones(filepath, numeric_columns):
+    """Return the zone map of filepath, built (and saved) if stale."""
+    try:
+        with open(zone_path(filepath)) as js:
+            zones = json.load(js)
+        if zones["key"] == key(filepath, numeric_columns):
+            return zones
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+
+    zones = build(filepath, numeric_columns)
+    try:
+        with open(zone_path(filepath), "w") as js:
+            json.dump(zones, js)
+    except (IOError, OSError) as err:
+        logger.warning("Can't write the zone map {} ({}).".format(
+            zone_path(filepath), err))
+
+    return zones
+
+
+def parse(condition):
+    """Return the condition as a Python expression, None if it isn't one."""
+    try:
+        tokens = [
+            (token.type, BOOLEANS.get(token.string, token.string))
+            if token.type == tokenize.OP else (token.type, token.string)
+            for token in tokenize.generate_tokens(
+                io.StringIO(condition).readline)]
+        return ast.parse(
+            tokenize.untokenize(tokens).strip(), mode="eval").body
+    except (SyntaxError, tokenize.TokenError, ValueError):
+        return None
+
+
+def number(node):
+    """Return the number of an expression node, None if it isn't one."""
+    sign = 1
+    if isinstance(node, ast.UnaryOp) and \
+            isinstance(node.op, (ast.USub, ast.UAdd)):
+        sign = -1 if isinstance(node.op, ast.USub) else 1
+        node = node.operand
+    if isinstance(node, NUMBER):
+        value = getattr(node, NUMBER_VALUE)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return sign * value
+
+    return None
+
+
+def compare(zone, column, op, value):
+    """Return False if no row of zone can pass column op value."""
+    low, high = zone[column][:2]
+    if low is None:
+        # Nothing but NaN, which never compares
+        return False
+    if isinstance(op, ast.Eq):
+        return low <= value <= high
+    if isinstance(op, (ast.Lt, ast.LtE)):
+        return COMPARISONS[type(op)](low, value)
+
+    return COMPARISONS[type(op)](high, value)
+
+
+def may_pass(node, zone, columns):
+    """Return False if no row of the zone can pass the expression node.
+
+    columns maps the names in the expression to those of the zone.
+
+    """
+    if isinstance(node, ast.BoolOp):
+        passes = [may_pass(_, zone, columns) for _ in node.values]
+        return all(passes) if isinstance(node.op, ast.And) else any(passes)
+
+    if isinstance(node, ast.Compare):
+        operands = [node.left] + node.comparators
+        for op, left, right in zip(node.ops, operands, operands[1:]):
+            if type(op) not in COMPARISONS:
+                continue
+            if isinstance(right, ast.Name) and number(left) is not None:
+                left, op, right = right, FLIPPED[type(op)](), left
+            if isinstance(left, ast.Name) and left.id in columns and \
+                    number(right) is not None and not compare(
+                        zone, columns[left.id], op, number(right)):
+                return False
+
+    # Anything else could pass
+    return True
+
+
+def needed(zones, steps, renames):
+    """Return the zones whose rows could pass all the steps of a Filter.
+
+    renames maps the columns of the steps to those of the file.
+
+    """
+    columns = dict((new, old) for new, old in renames.items()
+                   if old in zones["key"]["columns"])
+    expressions = [parse(_[3]) for _ in steps
+                   if not ff.by_strings(_[1], _[2])]
+    expressions = [_ for _ in expressions if _ is not None]
+
+    return [zone for zone in zones["zones"]
+            if all(may_pass(_, zone["stats"], columns)
+                   for _ in expressions)]
+
+
+def zone_lines(filepath, zones, needed_zones):
+    """Yield the (zone, bytes of its lines) of the needed zones."""
+    ends = dict((zone["offset"], next_zone["offset"]) for zone, next_zone in
+                zip(zones["zones"], zones["zones"][1:]))
+    seekable = not filepath.endswith(".gz") or zones["blocks"] is not None
+
+    stream = None if seekable else reader.open_binary(filepath)
+    position = 0
+    try:
+        for zone in needed_zones:
+            offset = zone["offset"]
+            if seekable and offset != position:
+                if stream is not None:
+                    stream.close()
+                stream = seek(filepath, offset, zones["blocks"])
+                position = offset
+            # Decompress and drop the lines of the zones not needed
+            while position < offset:
+                skipped = stream.read(min(offset - position, 1 << 20))
+                if not skipped:
+                    break
+                position += len(skipped)
+            data = stream.read(ends.get(offset, zones["end"]) - offset)
+            position += len(data)
+            yield zone, data
+    finally:
+        if stream is not None:
+            stream.close()
+
+
+def read_zones(filepath, filters, chunksize=None):
+    """Return the rows of filepath that could pass the filters, as load does.
+
+    Only the blocks of rows that could pass the filters are parsed, the
+    rows are indexed by their position in the file and the numeric columns
+    typecasted as in the whole file.
+
+    With a chunksize, return an iterator of DataFrames of about chunksize
+    rows instead.
+
+    """
+    header = ff.read_header(filepath)
+    numeric_columns = ff.numeric_in(header)
+    zones = load_zones(filepath, numeric_columns)
+    renamed, steps = filters.plan(header)
+    needed_zones = needed(zones, steps, dict(zip(renamed, header)))
+    logger.info("Reading {} of {} blocks of {}.".format(
+        len(needed_zones), len(zones["zones"]), filepath))
+    if len(needed_zones) == len(zones["zones"]):
+        # Nothing to skip, read it as usual
+        return ff.load(filepath, chunksize)
+
+    chunks = zone_chunks(filepath, zones, needed_zones, numeric_columns,
+                         chunksize or float("inf"))
+    if chunksize:
+        return chunks
+
+    chunks = list(chunks)
+    return ff.categorize(pd.concat(chunks) if len(chunks) > 1 else chunks[0])
+
+
+def zone_chunks(filepath, zones, needed_zones, numeric_columns, chunksize):
+    """Yield the rows of the needed zones in DFs of about chunksize rows.
+
+    At least one DF is yielded, even if empty, with the header.
+
+    """
+    with reader.open_binary(filepath) as stream:
+        header = stream.readline()
+
+    def parse_rows(rows, data):
+        chunk = pd.read_table(io.BytesIO(header + b"".join(data)),
+                              dtype=object, encoding=zones["encoding"])
+        chunk.index = rows
+        chunk = ff.numerize(chunk, numeric_columns)
+
+        return ff.retype(chunk, zones["traits"])
+
+    rows, data = [], []
+    empty = True
+    for zone, lines in zone_lines(filepath, zones, needed_zones):
+        rows.extend(range(zone["row"], zone["row"] + zone["rows"]))
+        data.append(lines)
+        if len(rows) >= chunksize:
+            yield parse_rows(rows, data)
+            rows, data, empty = [], [], False
+    if rows or empty:
+        yield parse_rows(rows, data)
@@ -8,8 +8,11 @@ setup(
     description="Command line to filter TSV files.""",
     author_email="xbello@gmail.com",
     packages=["dffiltering.ff", "dffiltering.command"],
+    python_requires=">=3.8",
     install_requires=[
-        "pandas==0.19.2",
+        "pandas==1.5.3",
+        # pandas 1.5 wheels are built against numpy 1
+        "numpy<2",
         "colorama==0.3.9"],
     entry_points={
         "console_scripts": [